@@ -3,14 +3,16 @@ import logging
 import sys
 import os
 from PIL import Image
+from uuid import uuid4
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.auth import check_password
 from services.processing import get_agent
 from components.sidebar import render_sidebar 
-from components.chat_interface import display_messages, handle_user_input, process_agent_interaction
+from components.chat_interface import display_messages, handle_user_input
 from services.feedback_logger import process_all_feedback
+from backend.metrics import start_exporters
 
 
 logging.basicConfig(
@@ -37,7 +39,8 @@ def initialize_session_state():
         "user_identifier": "Unknown User",
         "msg_id_counter": 0,
         "password_correct": False,
-        "processed_feedback_ids": set()
+        "processed_feedback_ids": set(),
+        "result_session_id": uuid4().hex,
     }
     for key, value in defaults.items():
         if key not in st.session_state:
@@ -52,11 +55,8 @@ def chatbot_page_main_content():
     display_messages()
     process_all_feedback()
 
-    if "processing_prompt" in st.session_state and st.session_state.processing_prompt is not None:
-        process_agent_interaction()
-    else:
-        if prompt := st.chat_input("Still et spørsmål..."):
-            handle_user_input(prompt)
+    if prompt := st.chat_input("Still et spørsmål..."):
+        handle_user_input(prompt)
 
     if not st.session_state.get("messages", []) and st.session_state.get("password_correct", False):
         logger.info(f"Chat started by user: {st.session_state.get('user_identifier', 'N/A')}")
@@ -87,6 +87,7 @@ if __name__ == "__main__":
     )
 
     initialize_session_state()
+    start_exporters()
 
     if check_password():
 
@@ -1,208 +1,414 @@
 import streamlit as st
 import pandas as pd
-from io import BytesIO
-import copy
+import pyarrow as pa
+from functools import partial
 import logging
 import numpy as np
-
-from backend.token_tracer import TokenUsageCallbackHandler
-from services.processing import process_sql_to_dataframe, TOKEN_TO_GCO2E_FACTOR, get_visualization_suggestion
+import altair as alt
+import time
+
+from backend.token_tracer import StreamingTokenUsageCallbackHandler, TOOL_STEP_LABELS
+from backend.config import AGENT_POLL_INTERVAL_SECONDS, RESULT_PAGER_THRESHOLD_ROWS, CHAT_FULL_RENDER_MESSAGES
+from backend.result_export import EXPORT_FORMATS, available_formats, export_file_name, export_result
+from backend.job_executor import job_executor, Job, JobStatus, JobQueueFullError
+from backend.usage_ledger import record_usage
+from services.processing import run_agent_request, TOKEN_TO_GCO2E_FACTOR, suggest_visualization
+from services.feedback_logger import process_all_feedback
+from services.result_store import result_store, message_dataframe, message_table, message_agent_steps
+from components.result_pager import render_result_pager
 
 logger = logging.getLogger(__name__)
 
+PROCESSING_MESSAGE_CONTENT = "Behandler forespørselen din..."
+SQL_TOOL_NAMES = ("sql_db_query", "sql_db_query_checker")
+SUMMARY_MAX_CHARS = 200
+TIMELINE_KIND_LABELS = {"llm": "LLM", "tool": "Verktøy", "chain": "Agent"}
+ENGINE_LABELS = {"cache": "Hurtigbuffer", "fast_path": "Hurtigsti (ett LLM-kall)", "agent": "SQL-agent"}
+VISUALIZATION_SOURCE_CAPTIONS = {
+    "heuristic": "Forslaget er regelbasert ut fra kolonnenes datatyper og navn – ingen AI-kall.",
+    "cache": "Forslaget er gjenbrukt fra et tidligere AI-forslag for samme resultatform.",
+}
+
 def display_messages():
+    """
+    Viser chatloggen. De siste CHAT_FULL_RENDER_MESSAGES meldingene tegnes fullt ut,
+    hver i sitt eget fragment, så interaksjon med én melding bare kjører den meldingen
+    på nytt. Eldre meldinger vises som korte sammendrag som kan utvides.
+    """
     if "messages" not in st.session_state:
         st.session_state.messages = []
 
-    for i, message in enumerate(st.session_state.get("messages", [])):
-        message_id = message.get("id", f"msg_{i}")
+    started = time.perf_counter()
+    messages = st.session_state.get("messages", [])
+    expanded_ids = st.session_state.setdefault("expanded_message_ids", set())
+    first_full_index = max(len(messages) - CHAT_FULL_RENDER_MESSAGES, 0)
+    full_count = summary_count = 0
+
+    for i, message in enumerate(messages):
+        message_id = message.setdefault("id", f"msg_{i}")
 
         avatar_icon = "🧑‍💻" if message["role"] == "user" else "🤖"
         with st.chat_message(message["role"], avatar=avatar_icon):
-            st.markdown(message["content"])
-            
-            current_df = None
-            if "dataframe" in message and message["dataframe"] is not None:
-                df_to_display = message["dataframe"]
-                if not isinstance(df_to_display, pd.DataFrame):
-                    try:
-                        df_to_display = pd.DataFrame(df_to_display)
-                    except Exception as e:
-                        logger.error(f"Kunne ikke konvertere message['dataframe'] til DataFrame: {e}")
-                        st.error("Kunne ikke vise tabellen.")
-                        df_to_display = None 
-                
-                if df_to_display is not None:
-                    current_df = df_to_display 
-                    if not df_to_display.empty:
-                        st.dataframe(df_to_display)
-                    elif "dataframe" in message: 
-                        st.caption("Tomt resultatsett.")
-            
-            if current_df is not None and not current_df.empty:
-                if st.button("📊 Generer visualisering med AI", key=f"ai_vis_btn_{message_id}"):
-                    st.session_state.ai_visualize_request = {
-                        "message_id": message_id,
-                        "dataframe_for_ai_processing": current_df.copy() 
-                    }
-                    if "ai_visualization_suggestion" in st.session_state:
-                        del st.session_state.ai_visualization_suggestion
-                    if "last_message_id_for_ai_viz" in st.session_state: 
-                         del st.session_state.last_message_id_for_ai_viz
-                    st.rerun()
-
-                if st.session_state.get("ai_visualize_request", {}).get("message_id") == message_id:
-                    with st.expander("AI-generert visualisering", expanded=True):
-                        with st.spinner("🤖 AI tenker ut en passende visualisering..."):
-                            if "ai_visualization_suggestion" not in st.session_state or \
-                               st.session_state.get("last_message_id_for_ai_viz") != message_id:
-                                
-                                df_for_ai = st.session_state.ai_visualize_request["dataframe_for_ai_processing"]
-                                suggestion = get_visualization_suggestion(df_for_ai)
-                                
-                                if suggestion:
-                                    st.session_state.ai_visualization_suggestion = suggestion
-                                    st.session_state.last_message_id_for_ai_viz = message_id
-                                else:
-                                    st.error("Beklager, AI-en kunne ikke generere et visualiseringsforslag for disse dataene.")
-                                if "ai_visualize_request" in st.session_state:
-                                    del st.session_state.ai_visualize_request
-                                st.rerun()
-
-            if "ai_visualization_suggestion" in st.session_state and \
-               message_id == st.session_state.get("last_message_id_for_ai_viz"):
-                
-                suggestion = st.session_state.ai_visualization_suggestion
-                df_to_plot_original = message.get("dataframe") 
-                
-                if df_to_plot_original is not None and not df_to_plot_original.empty:
-                    if not isinstance(df_to_plot_original, pd.DataFrame):
-                        try:
-                            df_to_plot_original = pd.DataFrame(df_to_plot_original)
-                        except:
-                            st.error("Data for plotting er ikke i gyldig format.")
-                            df_to_plot_original = None
-
-                if df_to_plot_original is not None and not df_to_plot_original.empty:
-                    try:
-                        chart_type = suggestion.get("chart_type")
-                        params = suggestion.get("params", {})
-                        title = suggestion.get("title", "AI-generert graf")
-                        
-                        st.subheader(title)
+            if "job_id" in message:
+                render_pending_message(message_id)
+                continue
+
+            if i < first_full_index and message_id not in expanded_ids:
+                render_message_summary(message_id, message)
+                summary_count += 1
+            else:
+                render_message(message_id)
+                full_count += 1
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    st.session_state.render_stats = {
+        "total_ms": elapsed_ms,
+        "full": full_count,
+        "summaries": summary_count,
+        "last_fragment_ms": st.session_state.get("render_stats", {}).get("last_fragment_ms"),
+    }
+    logger.debug(f"Chat rendered in {elapsed_ms:.1f} ms ({full_count} full, {summary_count} summaries)")
 
-                        plot_data_source = df_to_plot_original.copy()
 
-                        x_col_name = params.get("x")
-                        y_col_names = params.get("y")
-                        
-                        if y_col_names and not isinstance(y_col_names, list):
-                            y_col_names = [y_col_names]
-                        
-                        valid_plot = True
-                        if x_col_name and x_col_name not in plot_data_source.columns:
-                            st.warning(f"AI foreslo x-kolonnen '{x_col_name}', som ikke finnes. Tilgjengelige: {', '.join(plot_data_source.columns)}. Prøver å bruke indeksen.")
-                            x_col_name = None
+def _message_row_count(message: dict) -> int | None:
+    if message.get("paged"):
+        return message.get("row_count")
+    handle = message.get("result_handle")
+    if handle is not None:
+        return handle.row_count if handle.has_dataframe else None
+    df = message.get("dataframe")
+    return len(df) if df is not None else None
+
+
+def _expand_message(message_id: str):
+    st.session_state.setdefault("expanded_message_ids", set()).add(message_id)
+
+
+def render_message_summary(message_id: str, message: dict):
+    """Kort versjon av en eldre melding: starten av svaret, nøkkeltall og knapp for å vise alt."""
+    answer = message.get("content", "").split("\n\n---\n")[0]
+    if len(answer) > SUMMARY_MAX_CHARS:
+        answer = answer[:SUMMARY_MAX_CHARS].rsplit(" ", 1)[0] + " …"
+    st.markdown(answer)
+    if message["role"] != "assistant":
+        return
+
+    details = []
+    row_count = _message_row_count(message)
+    if row_count is not None:
+        details.append(f"📋 {'minst ' if message.get('paged') else ''}{row_count:,} rader")
+    if message.get("engine"):
+        details.append(f"{ENGINE_LABELS.get(message['engine'], message['engine'])} · {message.get('latency_ms', 0) / 1000:.1f} s")
+    if details:
+        st.caption(" · ".join(details))
+
+    has_details = row_count is not None or message.get("result_handle") or message.get("agent_steps")
+    if has_details or len(answer) < len(message.get("content", "")):
+        st.button("Vis hele svaret", key=f"expand_{message_id}", on_click=_expand_message, args=(message_id,))
+    if not message_id.startswith("welcome_"):
+        st.feedback(options="thumbs", key=f"feedback_{message_id}", on_change=process_all_feedback)
+
+
+@st.fragment
+def render_message(message_id: str):
+    """
+    Tegner én ferdig melding fullt ut: svar, tabell, visualisering, nedlasting,
+    agentsteg og tilbakemelding. Kjøres som et fragment, så knapper og widgets i
+    meldingen ikke tegner hele chatloggen på nytt.
+    """
+    started = time.perf_counter()
+    message = _find_message(message_id)
+    if message is None:
+        return
+
+    if message_id in st.session_state.get("expanded_message_ids", set()):
+        if st.button("Skjul detaljer", key=f"collapse_{message_id}"):
+            st.session_state.expanded_message_ids.discard(message_id)
+            st.rerun()
+
+    _render_message_body(message_id, message)
+    st.session_state.setdefault("render_stats", {})["last_fragment_ms"] = (time.perf_counter() - started) * 1000
+
+
+def _render_message_body(message_id: str, message: dict):
+    st.markdown(message["content"])
+    
+    has_rows = False
+    # Fra resultatlageret er dette en minnemappet pa.Table, som vises uten å kopieres til
+    # pandas; DataFrame-en hentes først når visualiseringen trenger den.
+    table_to_display = message_table(message)
+    if table_to_display is not None:
+        if not isinstance(table_to_display, (pd.DataFrame, pa.Table)):
+            try:
+                table_to_display = pd.DataFrame(table_to_display)
+            except Exception as e:
+                logger.error(f"Kunne ikke konvertere message['dataframe'] til DataFrame: {e}")
+                st.error("Kunne ikke vise tabellen.")
+                table_to_display = None 
+        
+        if table_to_display is not None:
+            has_rows = len(table_to_display) > 0
+            columns = table_to_display.column_names if isinstance(table_to_display, pa.Table) else list(table_to_display.columns)
+            if message.get("paged"):
+                render_result_pager(message_id, message["result_sql"], columns, message.get("row_count"))
+                st.caption(
+                    f"Visualisering bruker de første {len(table_to_display):,} radene. "
+                    "Tabellen over hentes side for side fra databasen."
+                )
+            elif has_rows:
+                st.dataframe(table_to_display)
+            else:
+                st.caption("Tomt resultatsett.")
+    
+    if has_rows:
+        if st.button("📊 Generer visualisering med AI", key=f"ai_vis_btn_{message_id}"):
+            st.session_state.ai_visualize_request = {
+                "message_id": message_id,
+                "dataframe_for_ai_processing": pd.DataFrame(message_dataframe(message))
+            }
+            if "ai_visualization_suggestion" in st.session_state:
+                del st.session_state.ai_visualization_suggestion
+            if "last_message_id_for_ai_viz" in st.session_state: 
+                 del st.session_state.last_message_id_for_ai_viz
+
+        if st.session_state.get("ai_visualize_request", {}).get("message_id") == message_id:
+            with st.expander("AI-generert visualisering", expanded=True):
+                with st.spinner("🤖 Finner en passende visualisering..."):
+                    if "ai_visualization_suggestion" not in st.session_state or \
+                       st.session_state.get("last_message_id_for_ai_viz") != message_id:
                         
-                        if y_col_names:
-                            valid_y_cols = []
-                            for y_col_check in y_col_names:
-                                if y_col_check in plot_data_source.columns:
-                                    valid_y_cols.append(y_col_check)
-                                else:
-                                    st.error(f"AI foreslo y-kolonnen '{y_col_check}', som ikke finnes. Tilgjengelige: {', '.join(plot_data_source.columns)}.")
-                                    valid_plot = False
-                                    break
-                            y_col_names = valid_y_cols
-                            if not y_col_names:
-                                valid_plot = False
-                        elif chart_type not in ["map"]:
-                            numeric_cols = plot_data_source.select_dtypes(include=np.number).columns.tolist()
-                            if numeric_cols:
-                                y_col_names = numeric_cols
-                                st.info(f"AI spesifiserte ikke y-kolonne(r). Bruker alle numeriske kolonner: {', '.join(y_col_names)}")
-                            else:
-                                st.error("AI spesifiserte ikke y-kolonne(r), og ingen numeriske kolonner ble funnet for automatisk valg.")
-                                valid_plot = False
+                        df_for_ai = st.session_state.ai_visualize_request["dataframe_for_ai_processing"]
+                        suggestion = suggest_visualization(df_for_ai)
                         
-                        if not valid_plot:
-                            if "ai_visualization_suggestion" in st.session_state:
-                                del st.session_state.ai_visualization_suggestion
-                            return
-
-                        if chart_type == "bar_chart":
-                            st.bar_chart(plot_data_source, x=x_col_name, y=y_col_names)
-                        elif chart_type == "line_chart":
-                            st.line_chart(plot_data_source, x=x_col_name, y=y_col_names)
-                        elif chart_type == "scatter_chart":
-                            size_col = params.get("size")
-                            color_col = params.get("color")
-                            
-                            if size_col and size_col not in plot_data_source.columns:
-                                st.warning(f"AI foreslo 'size'-kolonnen '{size_col}', som ikke finnes. Fortsetter uten 'size'.")
-                                size_col = None
-                            if color_col and color_col not in plot_data_source.columns:
-                                st.warning(f"AI foreslo 'color'-kolonnen '{color_col}', som ikke finnes. Fortsetter uten 'color'.")
-                                color_col = None
-                            
-                            single_y_for_scatter = y_col_names[0] if y_col_names else None
-                            if not (x_col_name and single_y_for_scatter): 
-                                st.error("For punktdiagram må både en gyldig x- og y-kolonne være tilgjengelig.")
-                            else:
-                                st.scatter_chart(plot_data_source, x=x_col_name, y=single_y_for_scatter, size=size_col, color=color_col)
-                        elif chart_type == "area_chart":
-                            st.area_chart(plot_data_source, x=x_col_name, y=y_col_names)
-                        elif chart_type == "map":
-                            lat_col = params.get('lat')
-                            lon_col = params.get('lon')
-                            if lat_col and lon_col and lat_col in plot_data_source.columns and lon_col in plot_data_source.columns:
-                                st.map(plot_data_source, latitude=lat_col, longitude=lon_col)
-                            else:
-                                st.error("Kunne ikke lage kart. AI må spesifisere gyldige 'lat'- og 'lon'-kolonner som finnes i dataene.")
+                        if suggestion:
+                            st.session_state.ai_visualization_suggestion = suggestion
+                            st.session_state.last_message_id_for_ai_viz = message_id
                         else:
-                            st.warning(f"Ukjent eller ustøttet graf-type fra AI: {chart_type}")
-                        
-                    except Exception as e:
-                        logger.error(f"Kunne ikke rendre AI-foreslått graf: {e}", exc_info=True)
-                        st.error(f"En feil oppstod under generering av AI-grafen: {e}")
-                        if "ai_visualization_suggestion" in st.session_state:
-                            del st.session_state.ai_visualization_suggestion
-
-            if "csv_data" in message and message["csv_data"] is not None:
-                st.download_button(
-                    label="Last ned CSV",
-                    data=message["csv_data"],
-                    file_name="query_result.csv",
-                    mime="text/csv",
-                    key=f"download_{message_id}"
-                )
-            
-            if "agent_steps" in message and message["agent_steps"]:
-                with st.expander("Vis agentens tankeprosess og SQL"):
-                    for step in message["agent_steps"]:
-                        step_name = str(step.get('name', 'N/A'))
-                        step_input = str(step.get("input", ""))
-                        step_output = str(step.get("output", ""))
-                        step_log = str(step.get("log", ""))
-
-                        st.markdown(f"**{step.get('type', 'Ukjent Steg')}**: {step_name}")
-                        if "input" in step: st.code(step_input, language="sql" if "sql" in step_name.lower() else "text")
-                        if "output" in step: st.text(step_output[:1000] + "..." if len(step_output) > 1000 else step_output)
-                        if "log" in step and step_log: st.text(f"Log: {step_log}")
-
-            if message["role"] == "assistant":
-                if message_id:
-                    is_welcome_message = message_id.startswith("welcome_")
-                    is_processing_message = message.get("content") == "Behandler forespørselen din..."
+                            st.error("Beklager, AI-en kunne ikke generere et visualiseringsforslag for disse dataene.")
+                        if "ai_visualize_request" in st.session_state:
+                            del st.session_state.ai_visualize_request
+
+    if "ai_visualization_suggestion" in st.session_state and \
+       message_id == st.session_state.get("last_message_id_for_ai_viz"):
+        
+        suggestion = st.session_state.ai_visualization_suggestion
+        df_to_plot_original = message_dataframe(message) if has_rows else None
+        
+        if df_to_plot_original is not None and not df_to_plot_original.empty:
+            if not isinstance(df_to_plot_original, pd.DataFrame):
+                try:
+                    df_to_plot_original = pd.DataFrame(df_to_plot_original)
+                except:
+                    st.error("Data for plotting er ikke i gyldig format.")
+                    df_to_plot_original = None
+
+        if df_to_plot_original is not None and not df_to_plot_original.empty:
+            try:
+                chart_type = suggestion.get("chart_type")
+                params = suggestion.get("params", {})
+                title = suggestion.get("title", "AI-generert graf")
+                
+                st.subheader(title)
+                if suggestion.get("source") in VISUALIZATION_SOURCE_CAPTIONS:
+                    st.caption(VISUALIZATION_SOURCE_CAPTIONS[suggestion["source"]])
+
+                plot_data_source = df_to_plot_original.copy()
+
+                x_col_name = params.get("x")
+                y_col_names = params.get("y")
+                
+                if y_col_names and not isinstance(y_col_names, list):
+                    y_col_names = [y_col_names]
+                
+                valid_plot = True
+                if x_col_name and x_col_name not in plot_data_source.columns:
+                    st.warning(f"AI foreslo x-kolonnen '{x_col_name}', som ikke finnes. Tilgjengelige: {', '.join(plot_data_source.columns)}. Prøver å bruke indeksen.")
+                    x_col_name = None
+                
+                if y_col_names:
+                    valid_y_cols = []
+                    for y_col_check in y_col_names:
+                        if y_col_check in plot_data_source.columns:
+                            valid_y_cols.append(y_col_check)
+                        else:
+                            st.error(f"AI foreslo y-kolonnen '{y_col_check}', som ikke finnes. Tilgjengelige: {', '.join(plot_data_source.columns)}.")
+                            valid_plot = False
+                            break
+                    y_col_names = valid_y_cols
+                    if not y_col_names:
+                        valid_plot = False
+                elif chart_type not in ["map"]:
+                    numeric_cols = plot_data_source.select_dtypes(include=np.number).columns.tolist()
+                    if numeric_cols:
+                        y_col_names = numeric_cols
+                        st.info(f"AI spesifiserte ikke y-kolonne(r). Bruker alle numeriske kolonner: {', '.join(y_col_names)}")
+                    else:
+                        st.error("AI spesifiserte ikke y-kolonne(r), og ingen numeriske kolonner ble funnet for automatisk valg.")
+                        valid_plot = False
+                
+                if not valid_plot:
+                    if "ai_visualization_suggestion" in st.session_state:
+                        del st.session_state.ai_visualization_suggestion
+                    return
+
+                color_col = params.get("color")
+                if color_col and color_col not in plot_data_source.columns:
+                    st.warning(f"AI foreslo 'color'-kolonnen '{color_col}', som ikke finnes. Fortsetter uten 'color'.")
+                    color_col = None
+
+                if chart_type == "bar_chart":
+                    st.bar_chart(plot_data_source, x=x_col_name, y=y_col_names, color=color_col)
+                elif chart_type == "line_chart":
+                    st.line_chart(plot_data_source, x=x_col_name, y=y_col_names, color=color_col)
+                elif chart_type == "scatter_chart":
+                    size_col = params.get("size")
+                    
+                    if size_col and size_col not in plot_data_source.columns:
+                        st.warning(f"AI foreslo 'size'-kolonnen '{size_col}', som ikke finnes. Fortsetter uten 'size'.")
+                        size_col = None
                     
-                    if not is_welcome_message and not is_processing_message:
-                        feedback_key = f"feedback_{message_id}"
-                        st.feedback(options="thumbs", key=feedback_key)
+                    single_y_for_scatter = y_col_names[0] if y_col_names else None
+                    if not (x_col_name and single_y_for_scatter): 
+                        st.error("For punktdiagram må både en gyldig x- og y-kolonne være tilgjengelig.")
+                    else:
+                        st.scatter_chart(plot_data_source, x=x_col_name, y=single_y_for_scatter, size=size_col, color=color_col)
+                elif chart_type == "area_chart":
+                    st.area_chart(plot_data_source, x=x_col_name, y=y_col_names, color=color_col)
+                elif chart_type == "map":
+                    lat_col = params.get('lat')
+                    lon_col = params.get('lon')
+                    if lat_col and lon_col and lat_col in plot_data_source.columns and lon_col in plot_data_source.columns:
+                        st.map(plot_data_source, latitude=lat_col, longitude=lon_col)
+                    else:
+                        st.error("Kunne ikke lage kart. AI må spesifisere gyldige 'lat'- og 'lon'-kolonner som finnes i dataene.")
                 else:
-                    logger.warning(f"Assistant message at index {i} is missing an ID. Feedback widget not shown.")
-
+                    st.warning(f"Ukjent eller ustøttet graf-type fra AI: {chart_type}")
+                
+            except Exception as e:
+                logger.error(f"Kunne ikke rendre AI-foreslått graf: {e}", exc_info=True)
+                st.error(f"En feil oppstod under generering av AI-grafen: {e}")
+                if "ai_visualization_suggestion" in st.session_state:
+                    del st.session_state.ai_visualization_suggestion
+
+    if has_rows:
+        render_export_buttons(message_id, message)
+    
+    if message.get("from_cache"):
+        st.caption("⚡ Svar hentet fra hurtigbuffer – agenten ble ikke kjørt.")
+        if message.get("prompt") and st.button("🔄 Kjør på nytt uten hurtigbuffer", key=f"bypass_cache_{message_id}"):
+            handle_user_input(message["prompt"], bypass_cache=True)
+
+    agent_steps = message_agent_steps(message)
+    if agent_steps or message.get("timeline"):
+        with st.expander("Vis agentens tankeprosess og SQL"):
+            if message.get("timings"):
+                render_timing_waterfall(message["timings"], message.get("timeline", []))
+            for step in agent_steps:
+                step_name = str(step.get('name', 'N/A'))
+                step_input = str(step.get("input", ""))
+                step_output = str(step.get("output", ""))
+                step_log = str(step.get("log", ""))
+
+                st.markdown(f"**{step.get('type', 'Ukjent Steg')}**: {step_name}")
+                if "input" in step: st.code(step_input, language="sql" if "sql" in step_name.lower() else "text")
+                if "output" in step: st.text(step_output[:1000] + "..." if len(step_output) > 1000 else step_output)
+                if "log" in step and step_log: st.text(f"Log: {step_log}")
+
+    # display_messages gir alltid meldingen en ID før den tegnes.
+    if message["role"] == "assistant":
+        is_welcome_message = message_id.startswith("welcome_")
+        is_processing_message = message.get("content") == PROCESSING_MESSAGE_CONTENT
+
+        if not is_welcome_message and not is_processing_message:
+            feedback_key = f"feedback_{message_id}"
+            st.feedback(options="thumbs", key=feedback_key, on_change=process_all_feedback)
+
+
+def render_timing_waterfall(timings: dict, timeline: list[dict]):
+    """Viser hvor tiden gikk: totaler for LLM, database og overhead, og et fossefall over stegene."""
+    st.caption(
+        f"⏱️ Totalt {timings['total_ms'] / 1000:.1f} s · LLM {timings['llm_ms'] / 1000:.1f} s · "
+        f"Database {timings['db_ms'] / 1000:.2f} s ({timings.get('db_queries', 0)} spørringer) · "
+        f"Overhead {timings['overhead_ms'] / 1000:.1f} s · Kø {timings.get('queue_ms', 0) / 1000:.1f} s"
+    )
+    if not timeline:
+        return
 
-def handle_user_input(prompt: str):
+    rows = []
+    for index, step in enumerate(timeline, start=1):
+        if step["kind"] == "llm":
+            name = "LLM-kall"
+        elif step["kind"] == "tool":
+            name = TOOL_STEP_LABELS.get(step["name"], step["name"])
+        else:
+            name = step["name"]
+        rows.append({
+            "steg": f"{index:02d} {'· ' * step['depth']}{name}",
+            "type": TIMELINE_KIND_LABELS.get(step["kind"], step["kind"]),
+            "start_s": step["start_ms"] / 1000,
+            "slutt_s": (step["start_ms"] + step["duration_ms"]) / 1000,
+            "varighet_ms": round(step["duration_ms"]),
+            "feil": step.get("error") or "",
+        })
+    chart = alt.Chart(pd.DataFrame(rows)).mark_bar().encode(
+        y=alt.Y("steg:N", sort=None, title=None),
+        x=alt.X("start_s:Q", title="Sekunder fra start"),
+        x2="slutt_s:Q",
+        color=alt.Color("type:N", title=None),
+        tooltip=["steg", "type", "varighet_ms", "feil"],
+    ).properties(height=max(22 * len(rows), 80))
+    st.altair_chart(chart, use_container_width=True)
+
+
+def _timeline_for_display(timings: list[dict]) -> list[dict]:
+    """
+    LLM-kall og verktøy fra tokensporingens tidslinje, pluss rotkjeden. Interne
+    LangChain-kjeder utelates, og nivået regnes om til antall viste foreldre.
+    """
+    by_id = {step["run_id"]: step for step in timings}
+    kept = [step for step in timings if step["kind"] != "chain" or step["depth"] == 0]
+    kept_ids = {step["run_id"] for step in kept}
+    rows = []
+    for step in kept:
+        depth = 0
+        parent = by_id.get(step["parent_run_id"])
+        while parent is not None:
+            depth += parent["run_id"] in kept_ids
+            parent = by_id.get(parent["parent_run_id"])
+        rows.append({
+            "kind": step["kind"], "name": step["name"], "depth": depth,
+            "start_ms": step["start_ms"], "duration_ms": step["duration_ms"], "error": step["error"],
+        })
+    return rows
+
+
+def render_export_buttons(message_id: str, message: dict):
+    """
+    Viser nedlasting av resultatet i valgt format. Filen (og DataFrame-en den lages
+    fra) lages først når brukeren trykker på knappen, og bytene lagres ikke i meldingen.
+    """
+    formats = available_formats()
+    col_format, col_download = st.columns([1, 3])
+    format_key = col_format.selectbox(
+        "Format", [f.key for f in formats], format_func=lambda key: EXPORT_FORMATS[key].label,
+        key=f"export_format_{message_id}", label_visibility="collapsed"
+    )
+    export_format = EXPORT_FORMATS[format_key]
+    if message.get("paged"):
+        export_data = partial(export_result, format_key, sql_query=message["result_sql"])
+    else:
+        export_data = lambda: export_result(format_key, dataframe=pd.DataFrame(message_dataframe(message)))
+    col_download.download_button(
+        label=f"Last ned {export_format.label}",
+        data=export_data,
+        file_name=export_file_name(format_key),
+        mime=export_format.mime,
+        key=f"download_{message_id}",
+        on_click="ignore",
+    )
+
+
+def handle_user_input(prompt: str, bypass_cache: bool = False):
     if not st.session_state.get("agent"):
         st.error("Chatbot agent er ikke lastet. Prøv å laste siden på nytt.")
         error_msg_id_counter = st.session_state.get("msg_id_counter", 0) + 1
@@ -220,17 +426,26 @@ def handle_user_input(prompt: str):
     st.session_state.messages.append({"role": "user", "content": prompt, "id": user_msg_id})
 
     asst_msg_id = f"asst_{msg_id_counter}"
-    assistant_initial_content = "Behandler forespørselen din..."
+    assistant_initial_content = PROCESSING_MESSAGE_CONTENT
     assistant_message_data = {
         "role": "assistant",
         "content": assistant_initial_content,
-        "id": asst_msg_id
+        "id": asst_msg_id,
+        "prompt": prompt,
     }
+
+    token_callback = StreamingTokenUsageCallbackHandler()
+    try:
+        job = job_executor.submit(
+            run_agent_request, st.session_state.agent, prompt, token_callback,
+            bypass_cache=bypass_cache, progress=token_callback
+        )
+        assistant_message_data["job_id"] = job.id
+    except JobQueueFullError as e:
+        logger.warning(f"Rejected prompt '{prompt}': {e}")
+        assistant_message_data["content"] = "Tjenesten har mange forespørsler akkurat nå. Vennligst prøv igjen om litt."
     st.session_state.messages.append(assistant_message_data)
     
-    st.session_state.processing_prompt = prompt 
-    st.session_state.current_asst_msg_id = asst_msg_id
-    
     if "ai_visualize_request" in st.session_state:
         del st.session_state.ai_visualize_request
     if "ai_visualization_suggestion" in st.session_state:
@@ -241,124 +456,185 @@ def handle_user_input(prompt: str):
     st.rerun()
 
 
-def process_agent_interaction():
-    prompt_to_process = st.session_state.pop("processing_prompt", None)
-    asst_msg_id_to_update = st.session_state.pop("current_asst_msg_id", None)
+def _find_message(message_id: str) -> dict | None:
+    for msg in st.session_state.get("messages", []):
+        if msg.get("id") == message_id:
+            return msg
+    return None
 
-    if not prompt_to_process or not asst_msg_id_to_update:
-        logger.warning("process_agent_interaction called without prompt or asst_msg_id in session_state.")
-        return 
 
-    message_to_update_index = -1
-    for i, msg in enumerate(st.session_state.messages):
-        if msg.get("id") == asst_msg_id_to_update:
-            message_to_update_index = i
-            break
-    
-    if message_to_update_index == -1:
-        logger.error(f"Could not find assistant message placeholder with ID {asst_msg_id_to_update} to update.")
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": f"Intern feil: Kunne ikke oppdatere svar (ID: {asst_msg_id_to_update}).",
-            "id": f"error_update_{asst_msg_id_to_update}"
-        })
-        st.rerun()
+def render_job_progress(job: Job):
+    """
+    Viser køplass, eller en live tidslinje over agentens steg og det endelige
+    svaret mens det strømmes, for en jobb som kjører.
+    """
+    if job.status == JobStatus.QUEUED:
+        position = job_executor.position(job.id)
+        st.markdown(f"⏳ Forespørselen din står i kø (plass {position}).")
         return
 
-    token_callback = TokenUsageCallbackHandler()
-    final_df = None
-    sql_query_found = None
-    agent_steps_for_display = []
-    assistant_response_content = "" 
-
-    try:
-        logger.info(f"Processing message: '{prompt_to_process}' with agent.")
-        if not st.session_state.get("agent"):
-            raise Exception("Agent not available for processing.")
-
-        response = st.session_state.agent.invoke(
-            {"input": prompt_to_process},
-            config={"callbacks": [token_callback]}
-        )
-        logger.info("Agent invoke finished.")
-        agent_output_text = response.get('output', 'Beklager, jeg fikk ikke noe svar fra agenten.')
-        intermediate_steps = response.get('intermediate_steps', [])
-
-        if intermediate_steps:
-            for idx, (action, observation) in enumerate(intermediate_steps):
-                tool_name = getattr(action, 'tool', 'Unknown Tool')
-                raw_tool_input = getattr(action, 'tool_input', '')
-                tool_input_str = str(raw_tool_input)
-                
-                step_detail = {
-                    "type": "Verktøy brukt", "name": tool_name, "input": tool_input_str,
-                    "output": str(observation), "log": getattr(action, 'log', '').strip().replace('\n', ' ')
-                }
-                agent_steps_for_display.append(step_detail)
-                
-                if 'sql' in tool_name.lower() and \
-                   ('query' in tool_name.lower() or 'tool' in tool_name.lower() or 'db' in tool_name.lower()):
-                    sql_query_found = tool_input_str
-                    logger.info(f"Found SQL query (Tool: {tool_name}): {sql_query_found}")
-        else:
-            logger.info("Agent reported no intermediate steps.")
-
-        if sql_query_found:
-            assistant_response_content, final_df = process_sql_to_dataframe(sql_query_found, agent_output_text)
-        else:
-            logger.info("No SQL query was executed by the agent, or the SQL tool was not recognized by the logger.")
-            assistant_response_content = agent_output_text
-
-    except Exception as e:
-        logger.exception("Error during agent execution or data processing")
-        assistant_response_content = f"En feil oppstod under behandling av din forespørsel: {type(e).__name__} - {e}"
-        final_df = None
-    finally:
-        usage_report = token_callback.get_report()
-        report_summary_for_log = copy.deepcopy(usage_report)
-        report_summary_for_log.pop('detailed_steps', None) 
-        logger.info(f"Token Usage Report Summary for query '{prompt_to_process}': {report_summary_for_log}")
-        
-        current_message_tokens = usage_report.get('total_tokens_used', 0)
-        current_message_gco2e = current_message_tokens * TOKEN_TO_GCO2E_FACTOR
-
-        usage_report_summary_for_user = (
-            f"\n\n---\n*Ressursbruk (denne meldingen):*\n"
-            f"*Tokens brukt: {current_message_tokens:,} "
-            f"(Input: {usage_report.get('prompt_tokens_used',0):,}, Output: {usage_report.get('completion_tokens_used',0):,})*\n"
-            f"*Estimert utslipp: {current_message_gco2e:.4f} gCO₂e 🌳*\n" 
-            f"*Antall LLM-kall: {usage_report.get('successful_llm_requests',0)}*"
-        )
-        if usage_report.get('llm_errors',0) > 0:
-             usage_report_summary_for_user += f"\n*Antall LLM-feil: {usage_report['llm_errors']}*"
-        
-        assistant_response_content += usage_report_summary_for_user
-        
-        st.session_state.session_total_tokens = st.session_state.get("session_total_tokens", 0) + current_message_tokens
-        st.session_state.session_total_gco2e = st.session_state.get("session_total_gco2e", 0.0) + current_message_gco2e
+    token_callback = job.progress
+    progress = token_callback.snapshot()
+
+    if progress["final_answer"]:
+        st.markdown(progress["final_answer"] + " ▌")
+    else:
+        elapsed = time.time() - (job.started_at or job.submitted_at)
+        st.markdown(f"{PROCESSING_MESSAGE_CONTENT} ({elapsed:.0f} s)")
+
+    now = time.monotonic()
+    for step in progress["timeline"]:
+        running = step["ended_at"] is None
+        icon = "❌" if step["error"] else ("⏳" if running else "✅")
+        duration = (step["ended_at"] or now) - step["started_at"]
+        label = step["label"]
+        if running and step["kind"] == "llm" and not progress["final_answer"]:
+            thought = progress["current_llm_text"].strip().splitlines()
+            if thought:
+                label += f": {thought[0].removeprefix('Thought:').strip()[:120]}"
+        st.caption(f"{icon} {label} · {duration:.1f} s")
+        if running and step["name"] in SQL_TOOL_NAMES and step["detail"]:
+            st.code(step["detail"], language="sql")
+
+    if progress["sql_draft"] and not progress["final_answer"]:
+        st.caption("✍️ Skriver SQL:")
+        st.code(progress["sql_draft"], language="sql")
+
+    st.caption(
+        f"LLM-kall: {token_callback.successful_llm_requests} · "
+        f"Tokens så langt: {token_callback.total_tokens_used:,}"
+    )
+
+
+@st.fragment(run_every=AGENT_POLL_INTERVAL_SECONDS)
+def render_pending_message(message_id: str):
+    """
+    Poller jobben til en ventende melding uten å blokkere resten av appen.
+    Når jobben er ferdig, skrives resultatet inn i meldingen og hele appen kjøres på nytt.
+    """
+    message = _find_message(message_id)
+    if message is None or "job_id" not in message:
+        return
 
-        st.session_state.messages[message_to_update_index]["content"] = assistant_response_content
-        
-        if final_df is not None: 
-            st.session_state.messages[message_to_update_index]["dataframe"] = final_df 
-            if not final_df.empty: 
-                output = BytesIO()
-                final_df.to_csv(output, index=False)
-                csv_bytes = output.getvalue()
-                output.close()
-                st.session_state.messages[message_to_update_index]["csv_data"] = csv_bytes
-            else: 
-                st.session_state.messages[message_to_update_index].pop("csv_data", None) 
-        else: 
-            st.session_state.messages[message_to_update_index].pop("dataframe", None)
-            st.session_state.messages[message_to_update_index].pop("csv_data", None)
-
-        if agent_steps_for_display:
-            st.session_state.messages[message_to_update_index]["agent_steps"] = agent_steps_for_display
-        else: 
-            st.session_state.messages[message_to_update_index].pop("agent_steps", None)
-        
-        if final_df is not None and not final_df.empty:
-            st.session_state.last_message_id_for_ai_viz = asst_msg_id_to_update
+    job = job_executor.get(message["job_id"])
+    if job is None:
+        logger.error(f"Job {message['job_id']} for message {message_id} not found.")
+        message.pop("job_id", None)
+        message["content"] = f"Intern feil: Kunne ikke finne forespørselen (ID: {message_id}). Prøv igjen."
+        st.rerun()
 
+    if job.finished:
+        apply_job_result(message, job)
+        job_executor.discard(job.id)
         st.rerun()
+
+    render_job_progress(job)
+
+
+def apply_job_result(message: dict, job: Job):
+    """Skriver resultatet av en ferdig agentjobb inn i assistentmeldingen og oppdaterer øktens totaler."""
+    message.pop("job_id", None)
+    token_callback = job.progress
+    prompt_to_process = message.get("prompt", "")
+
+    if job.status == JobStatus.DONE:
+        result = job.result
+    else:
+        result = {
+            "content": f"En feil oppstod under behandling av din forespørsel: {type(job.error).__name__} - {job.error}",
+            "dataframe": None,
+            "agent_steps": [],
+            "from_cache": False,
+            "engine": "agent",
+            "latency_ms": (job.finished_at - job.started_at) * 1000 if job.started_at else 0.0,
+            "sql": None,
+        }
+    assistant_response_content = result["content"]
+    final_df = result["dataframe"]
+    agent_steps_for_display = result["agent_steps"]
+
+    usage_report = token_callback.get_summary()
+
+    llm_ms = token_callback.llm_time_ms()
+    db_ms = result.get("timings", {}).get("db_ms", 0.0)
+    timings = {
+        "total_ms": result["latency_ms"],
+        "llm_ms": llm_ms,
+        "db_ms": db_ms,
+        "db_queries": result.get("timings", {}).get("db_queries", 0),
+        "overhead_ms": max(result["latency_ms"] - llm_ms - db_ms, 0.0),
+        "queue_ms": (job.started_at - job.submitted_at) * 1000 if job.started_at else 0.0,
+    }
+    logger.info(f"Token Usage Report Summary for query '{prompt_to_process}': {usage_report}")
+    
+    current_message_tokens = usage_report.get('total_tokens_used', 0)
+    current_message_gco2e = current_message_tokens * TOKEN_TO_GCO2E_FACTOR
+
+    usage_report_summary_for_user = (
+        f"\n\n---\n*Ressursbruk (denne meldingen):*\n"
+        f"*Tokens brukt: {current_message_tokens:,} "
+        f"(Input: {usage_report.get('prompt_tokens_used',0):,}, Output: {usage_report.get('completion_tokens_used',0):,})*\n"
+        f"*Estimert utslipp: {current_message_gco2e:.4f} gCO₂e 🌳*\n" 
+        f"*Antall LLM-kall: {usage_report.get('successful_llm_requests',0)}*\n"
+        f"*Motor: {ENGINE_LABELS.get(result['engine'], result['engine'])} · {result['latency_ms'] / 1000:.1f} s "
+        f"(LLM {timings['llm_ms'] / 1000:.1f} s, database {timings['db_ms'] / 1000:.2f} s)*"
+    )
+    if usage_report.get('llm_errors',0) > 0:
+         usage_report_summary_for_user += f"\n*Antall LLM-feil: {usage_report['llm_errors']}*"
+    
+    assistant_response_content += usage_report_summary_for_user
+    
+    st.session_state.session_total_tokens = st.session_state.get("session_total_tokens", 0) + current_message_tokens
+    st.session_state.session_total_gco2e = st.session_state.get("session_total_gco2e", 0.0) + current_message_gco2e
+
+    message["content"] = assistant_response_content
+    message["from_cache"] = result["from_cache"]
+    message["engine"] = result["engine"]
+    message["latency_ms"] = result["latency_ms"]
+    message["total_tokens"] = current_message_tokens
+    message["timings"] = timings
+    message["timeline"] = _timeline_for_display(token_callback.get_timings())
+
+    record_usage(
+        user=st.session_state.get("user_identifier", "Unknown User"),
+        kind="question",
+        usage_report=usage_report,
+        gco2e=current_message_gco2e,
+        latency_ms=result["latency_ms"],
+        message_id=message["id"],
+        engine=result["engine"],
+        cache_outcome="hit" if result["from_cache"] else "miss",
+        sql_query=result.get("sql"),
+    )
+    
+    if final_df is not None: 
+        message["dataframe"] = final_df 
+        if result.get("sql") and len(final_df) > RESULT_PAGER_THRESHOLD_ROWS:
+            # Store resultater blas i fra databasen; meldingen beholder bare et utdrag.
+            # row_count er antall rader som ble hentet, altså en nedre grense.
+            message["paged"] = True
+            message["result_sql"] = result["sql"]
+            message["row_count"] = len(final_df)
+            message["dataframe"] = final_df.head(RESULT_PAGER_THRESHOLD_ROWS)
+    else: 
+        message.pop("dataframe", None)
+
+    if agent_steps_for_display:
+        message["agent_steps"] = agent_steps_for_display
+    else: 
+        message.pop("agent_steps", None)
+
+    if result_store is not None:
+        # Data og agentsteg flyttes til disk; meldingen i session_state beholder bare håndtaket.
+        try:
+            message["result_handle"] = result_store.put(
+                st.session_state.result_session_id, message["id"],
+                message.get("dataframe"), message.get("agent_steps")
+            )
+            message.pop("dataframe", None)
+            message.pop("agent_steps", None)
+        except Exception as e:
+            logger.error(f"Kunne ikke lagre resultatet for melding {message['id']} på disk: {e}", exc_info=True)
+    
+    if final_df is not None and not final_df.empty:
+        st.session_state.last_message_id_for_ai_viz = message["id"]
@@ -0,0 +1,152 @@
+import streamlit as st
+import pandas as pd
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable
+
+from backend.config import FEEDBACK_ADMIN_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = "feedback_viewer"
+SORT_OPTIONS = {
+    "Tidspunkt": "ts",
+    "Tilbakemeldingstype": "feedback_type",
+    "Motor": "engine",
+    "Svartid": "latency_ms",
+    "Tokens": "total_tokens",
+}
+TABLE_COLUMNS = ["timestamp", "feedback_type", "user_query", "assistant_response", "message_id", "engine", "latency_ms"]
+PREVIEW_CHARS = 80
+
+
+@dataclass(frozen=True)
+class FeedbackSource:
+    """
+    Det visningen trenger for å bla i tilbakemeldinger, uavhengig av om de ligger i
+    feedback-lageret eller i JSONL-filen.
+
+    Attributes:
+        total (int): Antall tilbakemeldinger som matcher filtrene.
+        fetch_page (Callable): (sort_column, descending, offset, limit) -> radene på siden.
+        locate (Callable): (message_id, sort_column, descending) -> posisjon fra 0, eller None.
+        load_record (Callable): rad -> hele posten, inkludert agentsteg.
+        view_key (Hashable): Endres når filtrene endres, så visningen går tilbake til første side.
+    """
+
+    total: int
+    fetch_page: Callable[[str, bool, int, int], list[dict[str, Any]]]
+    locate: Callable[[str, str, bool], int | None]
+    load_record: Callable[[dict[str, Any]], dict[str, Any] | None]
+    view_key: Hashable
+
+
+@st.fragment
+def render_feedback_viewer(source: FeedbackSource, page_size: int = FEEDBACK_ADMIN_PAGE_SIZE):
+    """
+    Viser tilbakemeldingene side for side. Bare siden som vises hentes, sorteringen
+    gjøres av kilden, og JSON bygges bare for posten som er valgt.
+
+    Args:
+        source (FeedbackSource): Hvor radene hentes fra.
+        page_size (int): Antall rader per side.
+    """
+    state = st.session_state.setdefault(
+        STATE_KEY, {"page": 0, "view": None, "selected": None, "nonce": 0, "jump_error": None}
+    )
+
+    col_sort, col_dir, col_jump = st.columns([2, 1, 3])
+    sort_label = col_sort.selectbox("Sorter etter", list(SORT_OPTIONS), key=f"{STATE_KEY}_sort")
+    descending = col_dir.toggle("Synkende", value=True, key=f"{STATE_KEY}_desc")
+    col_jump.text_input(
+        "Gå til melding-ID", key=f"{STATE_KEY}_jump", placeholder="msg_...",
+        on_change=_jump_to_message, args=(state, source, page_size),
+    )
+    sort_column = SORT_OPTIONS[sort_label]
+
+    view = (source.view_key, sort_column, descending)
+    if state["view"] != view:
+        state.update(page=0, view=view, selected=None, nonce=state["nonce"] + 1)
+    if state["jump_error"]:
+        st.warning(state["jump_error"])
+
+    page_count = max((source.total + page_size - 1) // page_size, 1)
+    state["page"] = min(state["page"], page_count - 1)
+    offset = state["page"] * page_size
+    try:
+        rows = source.fetch_page(sort_column, descending, offset, page_size)
+    except Exception as e:
+        logger.error(f"Kunne ikke hente side {state['page']} av tilbakemeldingene: {e}", exc_info=True)
+        st.error(f"Kunne ikke hente tilbakemeldingene: {e}")
+        return
+
+    page_frame = pd.DataFrame(rows)
+    st.dataframe(
+        page_frame[[c for c in TABLE_COLUMNS if c in page_frame.columns]],
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    col_prev, col_position, col_next = st.columns([1, 4, 1])
+    col_prev.button(
+        "◀", key=f"{STATE_KEY}_prev", disabled=state["page"] == 0, on_click=_move_page, args=(state, -1)
+    )
+    col_position.caption(
+        f"Side {state['page'] + 1} av {page_count} · rad {offset + 1 if rows else 0}–{offset + len(rows)} av {source.total}"
+    )
+    col_next.button(
+        "▶", key=f"{STATE_KEY}_next", disabled=state["page"] >= page_count - 1, on_click=_move_page, args=(state, 1)
+    )
+
+    st.subheader("🔍 Rådata (JSON)")
+    selected = state["selected"] - offset if state["selected"] is not None else None
+    choice = st.selectbox(
+        "Vis detaljer for",
+        range(len(rows)),
+        index=selected if selected is not None and 0 <= selected < len(rows) else None,
+        format_func=lambda i: _row_label(rows[i]),
+        placeholder="Velg en tilbakemelding på siden",
+        key=f"{STATE_KEY}_select_{state['nonce']}",
+    )
+    if choice is not None:
+        state["selected"] = offset + choice
+        record = source.load_record(rows[choice])
+        if record is None:
+            st.warning("Tilbakemeldingen finnes ikke lenger.")
+        else:
+            st.json(record)
+
+
+def _row_label(row: dict[str, Any]) -> str:
+    query = str(row.get("user_query") or "")
+    if len(query) > PREVIEW_CHARS:
+        query = query[:PREVIEW_CHARS] + "…"
+    return f"{row.get('timestamp')} · {row.get('feedback_type') or 'N/A'} · {row.get('message_id')} · {query}"
+
+
+def _move_page(state: dict, step: int):
+    state["page"] = max(state["page"] + step, 0)
+    state["selected"] = None
+    state["nonce"] += 1
+
+
+def _jump_to_message(state: dict, source: FeedbackSource, page_size: int):
+    message_id = st.session_state.get(f"{STATE_KEY}_jump", "").strip()
+    state["jump_error"] = None
+    if not message_id:
+        return
+    sort_column = SORT_OPTIONS[st.session_state.get(f"{STATE_KEY}_sort", next(iter(SORT_OPTIONS)))]
+    descending = st.session_state.get(f"{STATE_KEY}_desc", True)
+    try:
+        position = source.locate(message_id, sort_column, descending)
+    except Exception as e:
+        logger.error(f"Kunne ikke finne melding {message_id}: {e}", exc_info=True)
+        position = None
+    if position is None:
+        state["jump_error"] = f"Fant ingen tilbakemelding for melding-ID '{message_id}' med de valgte filtrene."
+        return
+    # Setter view her, så visningen ikke nullstiller siden når sorteringen leses på nytt.
+    state.update(
+        page=position // page_size, selected=position, nonce=state["nonce"] + 1,
+        view=(source.view_key, sort_column, descending),
+    )
@@ -0,0 +1,87 @@
+import streamlit as st
+import logging
+
+from backend.config import RESULT_PAGE_SIZE, RESULT_PREFETCH_PAGES
+from backend.result_pages import PageRequest, count_rows, fetch_page
+
+logger = logging.getLogger(__name__)
+
+NO_SORT_LABEL = "(ingen sortering)"
+NO_FILTER_LABEL = "(ingen filter)"
+
+
+@st.fragment
+def render_result_pager(message_id: str, sql_query: str, columns: list[str], row_count_hint: int | None = None):
+    """
+    Viser et stort resultat side for side. Bare siden som vises (og et forhåndshentet
+    vindu) hentes fra databasen, og sortering og filter utføres i SQL.
+
+    Kjøres som et fragment, så bla/sortering/filter bare tegner tabellen på nytt.
+
+    Args:
+        message_id (str): Meldingen resultatet hører til (brukes i widget-nøkler).
+        sql_query (str): SQL-spørringen som ga resultatet.
+        columns (list[str]): Kolonnenavnene i resultatet.
+        row_count_hint (int | None): Antall rader agenten fikk, vises før eksakt telling.
+    """
+    key = f"pager_{message_id}"
+    state = st.session_state.setdefault(key, {"page": 0, "view": None, "total": None})
+
+    col_sort, col_dir, col_filter_col, col_filter_text = st.columns([3, 1, 3, 3])
+    sort_column = col_sort.selectbox("Sorter etter", [NO_SORT_LABEL] + columns, key=f"{key}_sort")
+    descending = col_dir.toggle("Synkende", key=f"{key}_desc")
+    filter_column = col_filter_col.selectbox("Filtrer kolonne", [NO_FILTER_LABEL] + columns, key=f"{key}_filter_col")
+    filter_text = col_filter_text.text_input("Inneholder", key=f"{key}_filter_text")
+
+    request = PageRequest(
+        sql=sql_query,
+        columns=tuple(columns),
+        sort_column=None if sort_column == NO_SORT_LABEL else sort_column,
+        descending=descending,
+        filter_column=None if filter_column == NO_FILTER_LABEL else filter_column,
+        filter_text=filter_text.strip() or None,
+    )
+    if state["view"] != request:
+        state.update(page=0, view=request, total=None)
+
+    try:
+        page = fetch_page(request, state["page"], RESULT_PAGE_SIZE, RESULT_PREFETCH_PAGES)
+    except Exception as e:
+        logger.error(f"Kunne ikke hente side {state['page']} for SQL: {sql_query}: {e}", exc_info=True)
+        st.error(f"Kunne ikke hente resultatsiden: {e}")
+        return
+    if page.total_rows is not None:
+        state["total"] = page.total_rows
+
+    if page.result.row_count:
+        st.dataframe(page.result.to_dataframe(), hide_index=True)
+    else:
+        st.caption("Ingen rader matcher filteret.")
+
+    total = state["total"]
+    first_row = page.offset + 1 if page.result.row_count else 0
+    last_row = page.offset + page.result.row_count
+    if total is not None:
+        position = f"Rad {first_row:,}–{last_row:,} av {total:,}"
+    elif row_count_hint is not None and request.is_plain:
+        position = f"Rad {first_row:,}–{last_row:,} av minst {row_count_hint:,}"
+    else:
+        position = f"Rad {first_row:,}–{last_row:,}"
+
+    col_prev, col_position, col_count, col_next = st.columns([1, 3, 2, 1])
+    col_prev.button("◀", key=f"{key}_prev", disabled=state["page"] == 0, on_click=_move_page, args=(state, -1))
+    col_position.caption(position)
+    if total is None:
+        col_count.button("Tell alle rader", key=f"{key}_count", on_click=_count_total, args=(state, request))
+    col_next.button("▶", key=f"{key}_next", disabled=not page.has_more, on_click=_move_page, args=(state, 1))
+
+
+def _move_page(state: dict, step: int):
+    state["page"] = max(state["page"] + step, 0)
+
+
+def _count_total(state: dict, request: PageRequest):
+    try:
+        state["total"] = count_rows(request)
+    except Exception as e:
+        logger.error(f"Kunne ikke telle rader for SQL: {request.sql}: {e}", exc_info=True)
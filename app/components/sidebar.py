@@ -67,6 +67,15 @@ def render_sidebar(logo_path: str | None = None):
 
     st.sidebar.markdown(f"👤 **Bruker:** {user_identifier}")
     st.sidebar.markdown(f"⚡ **Tokens brukt:** {total_tokens:,}")
+
+    render_stats = st.session_state.get("render_stats")
+    if render_stats:
+        fragment_ms = render_stats.get("last_fragment_ms")
+        st.sidebar.caption(
+            f"🖥️ Rendring av chatten: {render_stats['total_ms']:.0f} ms "
+            f"({render_stats['full']} fulle, {render_stats['summaries']} sammendrag)"
+            + (f" · siste melding: {fragment_ms:.0f} ms" if fragment_ms is not None else "")
+        )
     
     st.sidebar.markdown("---")
     
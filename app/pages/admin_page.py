@@ -1,147 +1,151 @@
 import streamlit as st
 import pandas as pd
-import json
 import os
 import sys
 import altair as alt
-from datetime import datetime, time
+from datetime import datetime, time, timezone
 
 PROJECT_ROOT_FOR_IMPORT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 if PROJECT_ROOT_FOR_IMPORT not in sys.path:
     sys.path.append(PROJECT_ROOT_FOR_IMPORT)
 
-PROJECT_ROOT_FOR_LOGS = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-FEEDBACK_LOG_FILE = os.path.join(PROJECT_ROOT_FOR_LOGS, "logs", "feedback_log.jsonl")
-
-def load_feedback_data():
-    logs = []
-    if os.path.exists(FEEDBACK_LOG_FILE):
-        try:
-            with open(FEEDBACK_LOG_FILE, "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        logs.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        print(f"Warning: Could not decode a line in the log file: {line.strip()}")
-                        continue
-        except Exception as e:
-            st.error(f"En feil oppstod under lesing av loggfilen: {e}")
-            return []
-    return logs
+from backend.question_cache import question_cache
+from backend.feedback_store import FeedbackFilter, feedback_store
+from backend.feedback_writer import feedback_writer
+from backend.feedback_log import feedback_log_segments
+from backend.usage_ledger import usage_ledger
+from backend.result_cache import result_cache
+from backend.chart_recommender import chart_suggestion_cache
+from backend.job_executor import job_executor
+from backend.rollups import rollup_manager
+from backend.db_client import get_pool_stats
+from backend.query_governor import query_governor
+from services.result_store import result_store
+from services.feedback_loader import LOCATION_COLUMNS, feedback_log_loader
+from components.feedback_viewer import FeedbackSource, render_feedback_viewer
+from backend.metrics import registry as metrics_registry
+from backend.config import FEEDBACK_LOG_FILE, METRICS_HTTP_HOST, METRICS_HTTP_PORT, METRICS_FILE_PATH
+
+
+def render_feedback_overview(total: int, feedback_counts: pd.DataFrame, feedback_over_time: pd.DataFrame):
+    """
+    Viser antall tilbakemeldinger, fordelingen positive/negative og daglig trend.
+
+    Args:
+        total (int): Antall tilbakemeldinger.
+        feedback_counts (pd.DataFrame): Kolonnene 'feedback_type' og 'count'.
+        feedback_over_time (pd.DataFrame): 'timestamp' (dag) og én kolonne per tilbakemeldingstype.
+    """
+    color_scale = alt.Scale(
+        domain=['thumbs_up', 'thumbs_down'],
+        range=['#3CB371', '#FF4500'] 
+    )
 
-def display_admin_page_content():
-    if not os.path.exists(FEEDBACK_LOG_FILE):
+    pie_chart = alt.Chart(feedback_counts).mark_arc(innerRadius=20).encode(
+        theta=alt.Theta(field="count", type="quantitative"),
+        color=alt.Color(
+            field="feedback_type", 
+            type="nominal", 
+            scale=color_scale,
+            legend=None 
+        ),
+        tooltip=['feedback_type', 'count']
+    ).properties(
+        title="",
+        height=100,
+    )
+
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns([1,1,1,1])
+
+    with metric_col1:
+        st.markdown("Antall tilbakemeldinger")
+        st.markdown("<h3 style='color: dodgerblue; margin-top: -20px;'>"+str(total), unsafe_allow_html=True)
+
+    with metric_col2:
+        st.markdown("Positive 👍")
+        st.markdown("<h3 style='color: mediumseagreen; margin-top: -20px;'>"+str(feedback_counts[feedback_counts['feedback_type'] == 'thumbs_up']['count'].iloc[0] if 'thumbs_up' in feedback_counts['feedback_type'].values else 0)+"</h1>", unsafe_allow_html=True)
+
+    with metric_col3:
+        st.markdown("Negative 👎")
+        st.markdown("<h3 style='color: orangered; margin-top: -20px;'>"+str(feedback_counts[feedback_counts['feedback_type'] == 'thumbs_down']['count'].iloc[0] if 'thumbs_down' in feedback_counts['feedback_type'].values else 0)+"</h1>", unsafe_allow_html=True)
+        
+    with metric_col4:
+        st.altair_chart(pie_chart, use_container_width=True)
+
+    st.markdown("---")
+
+    if 'thumbs_up' not in feedback_over_time.columns:
+        feedback_over_time['thumbs_up'] = 0
+    if 'thumbs_down' not in feedback_over_time.columns:
+        feedback_over_time['thumbs_down'] = 0
+    
+    feedback_over_time_long = feedback_over_time.melt(
+        id_vars=['timestamp'], 
+        value_vars=['thumbs_up', 'thumbs_down'],
+        var_name='feedback_type', 
+        value_name='count'
+    )
+
+    if not feedback_over_time_long.empty:
+        feedback_over_time_long['timestamp'] = pd.to_datetime(feedback_over_time_long['timestamp'])
+
+        time_chart = alt.Chart(feedback_over_time_long).mark_area(
+            point=alt.OverlayMarkDef(),
+            opacity=0.2, 
+            line=True    
+        ).encode(
+            x=alt.X('timestamp:T', title='Dato', axis=alt.Axis(format='%d.%m.%y')), 
+            y=alt.Y('count:Q', title='Antall Tilbakemeldinger', stack=None),
+            color=alt.Color('feedback_type:N', 
+                            scale=color_scale, 
+                            legend=alt.Legend(title='Tilbakemeldingstype')),
+            tooltip=[
+                alt.Tooltip('timestamp:T', title='Dato', format='%e %b %Y %H:%M'),
+                alt.Tooltip('feedback_type:N', title='Type'),
+                alt.Tooltip('count:Q', title='Antall')
+            ]
+        ).properties(
+            title='Daglig trend av tilbakemeldinger'
+        ).interactive()
+
+        st.altair_chart(time_chart, use_container_width=True)
+    else:
+        st.write("Ingen data for tilbakemeldinger over tid å vise.")
+
+
+def display_feedback_log_content():
+    """Tilbakemeldingene lest fra JSONL-filen (brukes når feedback-lageret er slått av)."""
+    if not feedback_log_segments(FEEDBACK_LOG_FILE):
         st.warning(f"Loggfilen ({FEEDBACK_LOG_FILE}) ble ikke funnet. Ingen data å vise.")
         st.caption("Loggfilen blir opprettet når den første tilbakemeldingen blir gitt.")
         return
 
-    logs = load_feedback_data()
+    try:
+        df_logs_original = feedback_log_loader.load()
+    except Exception as e:
+        st.error(f"En feil oppstod under lesing av loggfilen: {e}")
+        return
 
-    if not logs:
+    if df_logs_original.empty:
         st.info("Ingen tilbakemeldinger er logget ennå.")
         return
 
-    df_logs_original = pd.DataFrame(logs)
-
     if 'timestamp' not in df_logs_original.columns:
         st.error("Loggfilen mangler 'timestamp'-kolonnen, som er nødvendig for dashboardet.")
         return
-    
-    try:
-        df_logs_original['timestamp'] = pd.to_datetime(df_logs_original['timestamp'])
-    except Exception as e:
-        st.error(f"Kunne ikke konvertere 'timestamp'-kolonnen til datoformat: {e}. Sjekk loggformatet.")
-        return
-    
+
     df_logs = df_logs_original.copy()
 
 
     if 'feedback_type' in df_logs.columns:
         feedback_counts = df_logs['feedback_type'].value_counts().reset_index()
         feedback_counts.columns = ['feedback_type', 'count']
-        color_scale = alt.Scale(
-            domain=['thumbs_up', 'thumbs_down'],
-            range=['#3CB371', '#FF4500'] 
-        )
-
-        pie_chart = alt.Chart(feedback_counts).mark_arc(innerRadius=20).encode(
-            theta=alt.Theta(field="count", type="quantitative"),
-            color=alt.Color(
-                field="feedback_type", 
-                type="nominal", 
-                scale=color_scale,
-                legend=None 
-            ),
-            tooltip=['feedback_type', 'count']
-        ).properties(
-            title="",
-            height=100,
-        )
-
-        metric_col1, metric_col2, metric_col3, metric_col4 = st.columns([1,1,1,1])
-
-        with metric_col1:
-            st.markdown("Antall tilbakemeldinger")
-            st.markdown("<h3 style='color: dodgerblue; margin-top: -20px;'>"+str(df_logs.shape[0]), unsafe_allow_html=True)
-
-        with metric_col2:
-            st.markdown("Positive 👍")
-            st.markdown("<h3 style='color: mediumseagreen; margin-top: -20px;'>"+str(feedback_counts[feedback_counts['feedback_type'] == 'thumbs_up']['count'].iloc[0] if 'thumbs_up' in feedback_counts['feedback_type'].values else 0)+"</h1>", unsafe_allow_html=True)
-
-        with metric_col3:
-            st.markdown("Negative 👎")
-            st.markdown("<h3 style='color: orangered; margin-top: -20px;'>"+str(feedback_counts[feedback_counts['feedback_type'] == 'thumbs_down']['count'].iloc[0] if 'thumbs_down' in feedback_counts['feedback_type'].values else 0)+"</h1>", unsafe_allow_html=True)
-            
-        with metric_col4:
-            st.altair_chart(pie_chart, use_container_width=True)
-    else:
-        st.info("Ingen 'feedback_type' kolonne funnet i loggene for å lage diagram.")
-
-    st.markdown("---")
 
-    if 'feedback_type' in df_logs.columns and not df_logs.empty:
         df_time_series = df_logs.set_index('timestamp')
         feedback_over_time = df_time_series.groupby([pd.Grouper(freq='D'), 'feedback_type']).size().unstack(fill_value=0)
-        
-        if 'thumbs_up' not in feedback_over_time.columns:
-            feedback_over_time['thumbs_up'] = 0
-        if 'thumbs_down' not in feedback_over_time.columns:
-            feedback_over_time['thumbs_down'] = 0
-            
-        feedback_over_time = feedback_over_time.reset_index()
-        
-        feedback_over_time_long = feedback_over_time.melt(
-            id_vars=['timestamp'], 
-            value_vars=['thumbs_up', 'thumbs_down'],
-            var_name='feedback_type', 
-            value_name='count'
-        )
-
-        if not feedback_over_time_long.empty:
-            feedback_over_time_long['timestamp'] = pd.to_datetime(feedback_over_time_long['timestamp'])
-
-            time_chart = alt.Chart(feedback_over_time_long).mark_area(
-                point=alt.OverlayMarkDef(),
-                opacity=0.2, 
-                line=True    
-            ).encode(
-                x=alt.X('timestamp:T', title='Dato', axis=alt.Axis(format='%d.%m.%y')), 
-                y=alt.Y('count:Q', title='Antall Tilbakemeldinger', stack=None),
-                color=alt.Color('feedback_type:N', 
-                                scale=color_scale, 
-                                legend=alt.Legend(title='Tilbakemeldingstype')),
-                tooltip=[
-                    alt.Tooltip('timestamp:T', title='Dato', format='%e %b %Y %H:%M'),
-                    alt.Tooltip('feedback_type:N', title='Type'),
-                    alt.Tooltip('count:Q', title='Antall')
-                ]
-            ).properties(
-                title='Daglig trend av tilbakemeldinger'
-            ).interactive()
-
-            st.altair_chart(time_chart, use_container_width=True)
-        else:
-            st.write("Ingen data for tilbakemeldinger over tid å vise.")
+        render_feedback_overview(df_logs.shape[0], feedback_counts, feedback_over_time.reset_index())
+    else:
+        st.info("Ingen 'feedback_type' kolonne funnet i loggene for å lage diagram.")
     st.markdown("---")
 
     st.header("📜 Detaljert loggdata")
@@ -218,49 +222,406 @@ def display_admin_page_content():
         st.info("Ingen logger samsvarer med de valgte filtrene.")
     else:
         st.write(f"Fant {df_logs_filtered.shape[0]} loggoppføringer etter filtrering.")
-        try:
-            df_display = df_logs_filtered.copy()
-            
-            if 'timestamp' in df_display.columns:
-                try:
-                    df_display['timestamp'] = pd.to_datetime(df_display['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S UTC')
-                except Exception as e:
-                    st.warning(f"Kunne ikke formatere 'timestamp'-kolonnen for visning: {e}.")
-            
-            if 'timestamp_dt' in df_display.columns:
-                 df_display = df_display.drop(columns=['timestamp_dt'])
+        view_key = (
+            str(st.session_state.get("date_filter_admin")),
+            tuple(st.session_state.get("feedback_type_filter_admin") or ()),
+            search_term,
+            df_logs_filtered.shape[0],
+        )
+        render_feedback_viewer(_dataframe_feedback_source(df_logs_filtered.drop(columns=['timestamp_dt'], errors='ignore'), view_key))
 
-            columns_to_show_preference = [
-                'timestamp', 'feedback_type', 'feedback_score_value', 'user_query', 
-                'assistant_response', 'message_id', 'preceding_user_message_id'
-            ]
-            
-            existing_columns_in_df = df_display.columns.tolist()
-            final_columns_to_display = [col for col in columns_to_show_preference if col in existing_columns_in_df]
-            for col in existing_columns_in_df:
-                if col not in final_columns_to_display:
-                    final_columns_to_display.append(col)
-            
-            st.dataframe(df_display[final_columns_to_display], use_container_width=True)
 
-            st.markdown("---")
-            st.subheader("🔍 Rådata (JSON)")
-            st.caption("Klikk på en rad for å se detaljer.")
-            
-            for index, row in df_logs_filtered.iterrows():
-                expander_label = f"Logg #{index + 1} - Tid: {row.get('timestamp').strftime('%Y-%m-%d %H:%M:%S UTC') if pd.notnull(row.get('timestamp')) else 'N/A'} | Type: {row.get('feedback_type', 'N/A')}"
-                row_dict = row.to_dict()
-                if 'timestamp' in row_dict and pd.notnull(row_dict['timestamp']) and isinstance(row_dict['timestamp'], datetime):
-                     row_dict['timestamp'] = row_dict['timestamp'].isoformat()
-                if 'timestamp_dt' in row_dict and pd.notnull(row_dict['timestamp_dt']) and isinstance(row_dict['timestamp_dt'], datetime): 
-                     row_dict['timestamp_dt'] = row_dict['timestamp_dt'].isoformat()
+def _dataframe_feedback_source(df_logs_filtered: pd.DataFrame, view_key: tuple) -> FeedbackSource:
+    """Kilde for tilbakemeldingsvisningen når tilbakemeldingene er lest fra JSONL-filen."""
+    def sorted_frame(sort_column: str, descending: bool) -> pd.DataFrame:
+        column = 'timestamp' if sort_column == 'ts' else sort_column
+        if column not in df_logs_filtered.columns:
+            column = 'timestamp'
+        return df_logs_filtered.sort_values(column, ascending=not descending, kind='stable', na_position='last')
+
+    def fetch_page(sort_column: str, descending: bool, offset: int, limit: int) -> list[dict]:
+        page = sorted_frame(sort_column, descending).iloc[offset:offset + limit]
+        return [_json_safe_row(row) for row in page.to_dict('records')]
+
+    def locate(message_id: str, sort_column: str, descending: bool) -> int | None:
+        if 'message_id' not in df_logs_filtered.columns:
+            return None
+        matches = (sorted_frame(sort_column, descending)['message_id'] == message_id).to_numpy().nonzero()[0]
+        return int(matches[0]) if len(matches) else None
+
+    def load_record(row: dict) -> dict:
+        record = {k: v for k, v in row.items() if k not in LOCATION_COLUMNS}
+        record.update(feedback_log_loader.load_heavy_fields(row))
+        return record
+
+    return FeedbackSource(df_logs_filtered.shape[0], fetch_page, locate, load_record, view_key)
 
-                with st.expander(expander_label):
-                    st.json(row_dict)
 
-        except Exception as e:
-            st.error(f"En feil oppstod under behandling av loggdata for DataFrame: {e}")
-            st.dataframe(df_logs_filtered.head())
+def _json_safe_row(row: dict) -> dict:
+    safe = {}
+    for key, value in row.items():
+        if isinstance(value, pd.Timestamp):
+            value = value.isoformat()
+        elif isinstance(value, float) and pd.isna(value):
+            value = None
+        safe[key] = value
+    return safe
+
+
+def display_admin_page_content():
+    if feedback_store is None:
+        display_feedback_log_content()
+    else:
+        display_feedback_store_content()
+
+
+def display_feedback_store_content():
+    """Tilbakemeldingene fra feedback-lageret. Filtre og søk kjøres som indekserte SQL-spørringer."""
+    bounds = feedback_store.time_bounds()
+    if bounds is None:
+        st.info("Ingen tilbakemeldinger er logget ennå.")
+        return
+
+    type_counts = feedback_store.type_counts()
+    feedback_counts = pd.DataFrame(list(type_counts.items()), columns=['feedback_type', 'count'])
+    daily = pd.DataFrame(feedback_store.daily_counts(), columns=['day', 'feedback_type', 'count'])
+    feedback_over_time = daily.pivot_table(index='day', columns='feedback_type', values='count', fill_value=0)
+    feedback_over_time = feedback_over_time.rename_axis(index='timestamp', columns=None).reset_index()
+    render_feedback_overview(sum(type_counts.values()), feedback_counts, feedback_over_time)
+    st.markdown("---")
+
+    st.header("📜 Detaljert loggdata")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        min_date_val = datetime.fromtimestamp(bounds[0], tz=timezone.utc).date()
+        max_date_val = datetime.fromtimestamp(bounds[1], tz=timezone.utc).date()
+        date_range = st.date_input(
+            "Velg datoperiode",
+            value=(min_date_val, max_date_val),
+            min_value=min_date_val,
+            max_value=max_date_val,
+            key="date_filter_admin"
+        )
+    with col2:
+        unique_feedback_types = sorted(type_counts)
+        selected_feedback_types = st.multiselect(
+            "Filtrer på tilbakemeldingstype",
+            options=unique_feedback_types,
+            default=unique_feedback_types,
+            key="feedback_type_filter_admin"
+        )
+    search_term = st.text_input(
+        "Søk i 'user_query' eller 'assistant_response'",
+        key="search_term_filter_admin",
+        placeholder="Skriv søkeord her..."
+    )
+
+    start_ts = end_ts = None
+    if len(date_range) == 2:
+        start_ts = datetime.combine(date_range[0], time.min, tzinfo=timezone.utc).timestamp()
+        end_ts = datetime.combine(date_range[1], time.max, tzinfo=timezone.utc).timestamp()
+    filters = FeedbackFilter(
+        start_ts=start_ts,
+        end_ts=end_ts,
+        feedback_types=tuple(selected_feedback_types) if selected_feedback_types else None,
+        search=search_term.strip() or None,
+    )
+
+    total = feedback_store.count(filters)
+    if total == 0:
+        st.info("Ingen logger samsvarer med de valgte filtrene.")
+        return
+    st.write(f"Fant {total} loggoppføringer etter filtrering.")
+    render_feedback_viewer(FeedbackSource(
+        total=total,
+        fetch_page=lambda sort_column, descending, offset, limit: feedback_store.list_entries(
+            filters, limit=limit, offset=offset, sort_column=sort_column, descending=descending
+        ),
+        locate=lambda message_id, sort_column, descending: feedback_store.position_of(
+            message_id, filters, sort_column=sort_column, descending=descending
+        ),
+        load_record=lambda row: feedback_store.get(row['id']),
+        view_key=filters,
+    ))
+
+
+def display_usage_admin():
+    st.subheader("💰 Ressursbruk og gjennomstrømning")
+    if usage_ledger is None:
+        st.info("Bruksloggen er slått av (USAGE_LEDGER_ENABLED).")
+        return
+
+    days = st.selectbox("Periode", [1, 7, 14, 30, 90], index=2, format_func=lambda d: f"Siste {d} dager", key="usage_days_admin")
+    daily = pd.DataFrame(usage_ledger.daily_summary(days))
+    if daily.empty:
+        st.info("Ingen forespørsler er logget i perioden.")
+        return
+
+    today_rows = daily[daily["day"] == datetime.now(timezone.utc).strftime("%Y-%m-%d")]
+    today = today_rows.iloc[0] if not today_rows.empty else None
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Forespørsler", int(daily["requests"].sum()))
+    col2.metric("Tokens", f"{int(daily['total_tokens'].sum()):,}")
+    col3.metric("gCO₂e", f"{daily['gco2e'].sum():.2f}")
+    col4.metric(
+        "Svartid p50 / p95 i dag (UTC)",
+        f"{today['p50_latency_ms'] / 1000:.1f} / {today['p95_latency_ms'] / 1000:.1f} s" if today is not None else "–",
+    )
+    col5.metric("Treff i spørsmålscachen", f"{int(daily['cache_hits'].sum())} / {int(daily['questions'].sum())}")
+
+    daily["day"] = pd.to_datetime(daily["day"])
+    latency_long = daily.melt(
+        id_vars=["day"], value_vars=["p50_latency_ms", "p95_latency_ms"], var_name="percentil", value_name="ms"
+    ).dropna()
+    latency_long["percentil"] = latency_long["percentil"].map({"p50_latency_ms": "p50", "p95_latency_ms": "p95"})
+    latency_long["sekunder"] = latency_long["ms"] / 1000
+
+    chart_col1, chart_col2 = st.columns(2)
+    with chart_col1:
+        st.altair_chart(
+            alt.Chart(daily).mark_bar().encode(
+                x=alt.X("day:T", title="Dato", axis=alt.Axis(format="%d.%m")),
+                y=alt.Y("requests:Q", title="Forespørsler"),
+                tooltip=[alt.Tooltip("day:T", title="Dato"), alt.Tooltip("requests:Q", title="Forespørsler"),
+                         alt.Tooltip("users:Q", title="Brukere")],
+            ).properties(title="Forespørsler per dag", height=220),
+            use_container_width=True,
+        )
+    with chart_col2:
+        st.altair_chart(
+            alt.Chart(latency_long).mark_line(point=True).encode(
+                x=alt.X("day:T", title="Dato", axis=alt.Axis(format="%d.%m")),
+                y=alt.Y("sekunder:Q", title="Svartid (s)"),
+                color=alt.Color("percentil:N", title="Persentil"),
+                tooltip=[alt.Tooltip("day:T", title="Dato"), "percentil:N", alt.Tooltip("sekunder:Q", format=".2f")],
+            ).properties(title="Svartid per dag", height=220),
+            use_container_width=True,
+        )
+
+    user_day = pd.DataFrame(usage_ledger.user_day_tokens(days))
+    if not user_day.empty:
+        user_day["day"] = pd.to_datetime(user_day["day"])
+        st.altair_chart(
+            alt.Chart(user_day).mark_bar().encode(
+                x=alt.X("day:T", title="Dato", axis=alt.Axis(format="%d.%m")),
+                y=alt.Y("total_tokens:Q", title="Tokens"),
+                color=alt.Color("user:N", title="Bruker"),
+                tooltip=[alt.Tooltip("day:T", title="Dato"), alt.Tooltip("user:N", title="Bruker"),
+                         alt.Tooltip("total_tokens:Q", title="Tokens", format=",")],
+            ).properties(title="Tokens per dag og bruker", height=250),
+            use_container_width=True,
+        )
+
+    per_user = pd.DataFrame(usage_ledger.per_user_summary(days))
+    per_user["last_seen"] = pd.to_datetime(per_user["last_seen"], unit="s").dt.strftime("%Y-%m-%d %H:%M")
+    per_user["avg_latency_ms"] = (per_user["avg_latency_ms"] / 1000).round(1)
+    st.dataframe(
+        per_user.rename(columns={
+            "user": "Bruker", "requests": "Forespørsler", "total_tokens": "Tokens", "gco2e": "gCO₂e",
+            "avg_latency_ms": "Snitt svartid (s)", "last_seen": "Sist aktiv",
+        }),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    throughput = pd.DataFrame(usage_ledger.hourly_throughput(24))
+    if not throughput.empty:
+        throughput["hour"] = pd.to_datetime(throughput["hour"], unit="s")
+        st.caption("Forespørsler per time, siste døgn (UTC)")
+        st.bar_chart(throughput, x="hour", y="requests", height=150)
+
+
+def display_question_cache_admin():
+    st.markdown("---")
+    st.header("⚡ Hurtigbuffer for spørsmål")
+
+    if question_cache is None:
+        st.info("Hurtigbufferen er slått av (QUESTION_CACHE_ENABLED).")
+        return
+
+    stats = question_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else "–"
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Oppføringer", stats["entries"])
+    col2.metric("Treff", stats["hits"])
+    col3.metric("Bom", stats["misses"])
+    col4.metric("Treffrate", hit_rate)
+
+    entries = question_cache.list_entries()
+    if not entries:
+        st.caption("Hurtigbufferen er tom.")
+        return
+
+    df_cache = pd.DataFrame(entries)
+    for col in ("created_at", "last_access"):
+        df_cache[col] = pd.to_datetime(df_cache[col], unit="s", utc=True).dt.strftime('%Y-%m-%d %H:%M:%S UTC')
+
+    selection = st.dataframe(
+        df_cache.drop(columns=["cache_key"]),
+        use_container_width=True,
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="multi-row",
+        key="question_cache_table_admin",
+    )
+    selected_rows = selection.selection.rows if selection else []
+
+    btn_col1, btn_col2 = st.columns(2)
+    with btn_col1:
+        if st.button("Slett valgte oppføringer", disabled=not selected_rows, key="invalidate_selected_cache_admin"):
+            deleted = question_cache.invalidate(df_cache.iloc[selected_rows]["cache_key"].tolist())
+            st.toast(f"Slettet {deleted} oppføringer fra hurtigbufferen.")
+            st.rerun()
+    with btn_col2:
+        if st.button("Tøm hele hurtigbufferen", type="primary", key="invalidate_all_cache_admin"):
+            deleted = question_cache.invalidate()
+            st.toast(f"Slettet {deleted} oppføringer fra hurtigbufferen.")
+            st.rerun()
+
+
+def display_result_cache_admin():
+    st.subheader("🗄️ Resultatcache for SQL")
+    if result_cache is None:
+        st.info("Resultatcachen er slått av (RESULT_CACHE_ENABLED).")
+        return
+
+    stats = result_cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Resultater", stats["entries"])
+    col2.metric("Størrelse", f"{stats['bytes'] / 1024 / 1024:.1f} / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    col3.metric("Treff", stats["hits"])
+    col4.metric("Bom", stats["misses"])
+    if st.button("Tøm resultatcachen", key="clear_result_cache_admin"):
+        result_cache.clear()
+        st.toast("Resultatcachen er tømt.")
+        st.rerun()
+
+
+def display_chart_suggestion_cache_admin():
+    st.subheader("📊 Cache for visualiseringsforslag")
+    if chart_suggestion_cache is None:
+        st.info("Cachen for visualiseringsforslag er slått av (CHART_SUGGESTION_CACHE_ENABLED).")
+        return
+
+    stats = chart_suggestion_cache.stats()
+    col1, col2 = st.columns(2)
+    col1.metric("Resultatformer", stats["entries"])
+    col2.metric("Gjenbrukte AI-forslag", stats["hits"])
+    if st.button("Tøm cachen for visualiseringsforslag", key="clear_chart_cache_admin"):
+        deleted = chart_suggestion_cache.invalidate()
+        st.toast(f"Slettet {deleted} visualiseringsforslag.")
+        st.rerun()
+
+
+def display_result_store_admin():
+    st.subheader("💾 Resultatlager for meldinger")
+    if result_store is None:
+        st.info("Resultatlageret er slått av (RESULT_STORE_ENABLED).")
+        return
+
+    stats = result_store.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Økter på disk", stats["sessions"])
+    col2.metric("Størrelse", f"{stats['size_bytes'] / 1024 / 1024:.1f} MB")
+    col3.metric("I minnet", stats["in_memory"])
+    col4.metric("Treff i minnet / lest fra disk", f"{stats['memory_hits']} / {stats['disk_reads']}")
+    if st.button("Slett gamle økter nå", key="gc_result_store_admin"):
+        removed = result_store.collect_garbage()
+        st.toast(f"Slettet {removed} gamle øktmapper.")
+        st.rerun()
+
+
+def display_rollup_admin():
+    st.subheader("🧮 Rollup-tabeller")
+    if rollup_manager is None:
+        st.info("Rollups er slått av (ROLLUPS_ENABLED).")
+        return
+
+    stats = rollup_manager.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Besvart fra rollup", stats["hits"])
+    col2.metric("Ikke omskrivbar", stats["not_rewritable"])
+    col3.metric("Utdatert (basistabell brukt)", stats["stale_skips"])
+    col4.metric("Avvik ved verifisering", stats["mismatches"])
+    if stats["building"]:
+        st.caption("Bygger rollups i bakgrunnen...")
+    if stats["last_error"]:
+        st.error(f"Siste bygging feilet: {stats['last_error']}")
+    if stats["tables"]:
+        st.dataframe(pd.DataFrame(stats["tables"]), hide_index=True, use_container_width=True)
+    if st.button("Bygg rollups på nytt", key="rebuild_rollups_admin"):
+        with st.spinner("Bygger rollups..."):
+            rollup_manager.rebuild()
+        st.toast("Rollups er bygget på nytt.")
+        st.rerun()
+
+
+def display_job_queue_admin():
+    st.markdown("---")
+    st.header("🧵 Agentkø")
+    stats = job_executor.stats()
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Kjører", f"{stats['running']} / {stats['max_workers']}")
+    col2.metric("I kø", f"{stats['queued']} / {stats['max_queue']}")
+    col3.metric("Fullført", stats["completed"])
+    col4.metric("Feilet", stats["failed"])
+    col5.metric("Avvist (full kø)", stats["rejected"])
+
+    st.subheader("🔌 Databasetilkoblinger")
+    pool = get_pool_stats()
+    col1, col2, col3, col4, col5 = st.columns(5)
+    if "size" in pool:
+        col1.metric("I bruk", f"{pool['checked_out']} / {pool['size']}")
+        col2.metric("Overflow", f"{pool['overflow']} / {pool['max_overflow']}")
+    col3.metric("Ventetid snitt / p95", f"{pool['avg_wait_ms']:.1f} / {pool['p95_wait_ms']:.1f} ms")
+    col4.metric("Maks ventetid", f"{pool['max_wait_ms']:.0f} ms")
+    col5.metric("Tidsavbrudd", pool["timeouts"])
+    st.caption(f"{pool['checkouts']} uttak fra {pool['pool']}. Høy ventetid betyr at poolen, ikke spørringene, er flaskehalsen.")
+
+    st.subheader("⏱️ Spørringsgrenser")
+    governor_stats = query_governor.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Kjører nå", governor_stats["active"])
+    col2.metric("Tidsavbrudd", governor_stats["timeouts"])
+    col3.metric("Avbrutt", governor_stats["cancellations"])
+    col4.metric("Avkortet", governor_stats["truncations"])
+    st.caption(
+        f"Grenser: {query_governor.timeout_seconds:.0f} s, {query_governor.max_rows:,} rader, "
+        f"{query_governor.max_bytes / 1024 / 1024:.0f} MB per spørring."
+    )
+    for query in query_governor.active_queries():
+        col_sql, col_button = st.columns([5, 1])
+        col_sql.code(query["sql"], language="sql")
+        col_sql.caption(f"{query['running_s']} s i tråd {query['thread']}")
+        if col_button.button("Avbryt", key=f"cancel_query_{query['id']}"):
+            query_governor.cancel(query["id"])
+            st.toast("Spørringen blir avbrutt.")
+            st.rerun()
+
+
+def display_metrics_admin():
+    st.subheader("📈 Metrikker (Prometheus)")
+    targets = []
+    if METRICS_HTTP_PORT:
+        targets.append(f"http://{METRICS_HTTP_HOST}:{METRICS_HTTP_PORT}/metrics")
+    if METRICS_FILE_PATH:
+        targets.append(METRICS_FILE_PATH)
+    if targets:
+        st.caption("Eksporteres til: " + ", ".join(targets))
+    else:
+        st.caption("Ingen eksport er slått på (METRICS_HTTP_PORT / METRICS_FILE_PATH).")
+    if feedback_writer is not None:
+        writer_stats = feedback_writer.stats()
+        st.caption(
+            f"Tilbakemeldingsskriver: {writer_stats['queue_depth']} i kø, "
+            f"{writer_stats['records_written']} skrevet i {writer_stats['batches_written']} batcher, "
+            f"{writer_stats['rotations']} roteringer"
+        )
+    with st.expander("Vis metrikker i tekstformat"):
+        st.code(metrics_registry.render(), language="text")
 
 
 if not st.session_state.get("password_correct"):
@@ -270,6 +631,14 @@ if not st.session_state.get("password_correct"):
 else:
     if st.session_state.get("user_identifier") == "admin":
         display_admin_page_content()
+        display_usage_admin()
+        display_question_cache_admin()
+        display_result_cache_admin()
+        display_chart_suggestion_cache_admin()
+        display_result_store_admin()
+        display_rollup_admin()
+        display_job_queue_admin()
+        display_metrics_admin()
     else:
         st.error("Utilgjengelig.")
         st.warning("Du har ikke de nødvendige rettighetene for å se denne siden.")
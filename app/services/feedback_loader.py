@@ -0,0 +1,223 @@
+import json
+import os
+from threading import Lock
+from typing import IO, Any, Iterator
+
+import pandas as pd
+
+from backend.config import FEEDBACK_LOG_FILE
+from backend.feedback_log import feedback_log_segments, open_log_segment
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+HEAVY_FIELDS = ("agent_steps",)
+SEGMENT_COLUMN = "_log_segment"
+OFFSET_COLUMN = "_log_offset"
+LOCATION_COLUMNS = (SEGMENT_COLUMN, OFFSET_COLUMN)
+
+
+class FeedbackLogLoader:
+    """
+    Leser feedback-loggen (JSON lines) inkrementelt og holder resultatet i minnet.
+
+    Loggen består av roterte, gzip-komprimerte segmenter og den aktive filen (se
+    feedback_log_segments). De roterte segmentene endres aldri, så de parses én gang
+    og huskes per sti. For den aktive filen husker loaderen hvor langt den har lest
+    og hvilken fil det var (enhet og inode), og parser bare linjer som er lagt til
+    siden sist. Hvis filen er rotert, byttet ut eller har blitt kortere, leses den
+    på nytt fra start, og det nye segmentet plukkes opp fra listen.
+
+    Tunge felt (agent_steps) tas ikke med i tabellen. Hver rad har i stedet
+    segmentet og posisjonen til linjen sin, så feltene kan hentes med
+    load_heavy_fields() når raden vises.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = Lock()
+        self._segment_frames: dict[str, pd.DataFrame] = {}
+        self._reset_active(None)
+        self._frame = pd.DataFrame()
+
+    def _reset_active(self, identity: tuple[int, int] | None) -> None:
+        self._identity = identity
+        self._offset = 0
+        self._active_frame = pd.DataFrame()
+
+    def load(self) -> pd.DataFrame:
+        """
+        Returnerer alle tilbakemeldinger, fra alle segmenter, som en DataFrame, uten de tunge feltene.
+
+        DataFrame-en deles mellom økter og må ikke endres av kalleren.
+
+        Returns:
+            pd.DataFrame: Én rad per tilbakemelding, med 'timestamp' som UTC-tid.
+        """
+        with self._lock:
+            changed = self._load_rotated_segments()
+            changed = self._load_active_file() or changed
+            if changed:
+                frames = [f for f in (*self._segment_frames.values(), self._active_frame) if not f.empty]
+                self._frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            return self._frame
+
+    def _load_rotated_segments(self) -> bool:
+        rotated = [segment for segment in feedback_log_segments(self.path) if segment != self.path]
+        changed = set(self._segment_frames) != set(rotated)
+        frames = {}
+        for segment in rotated:
+            if segment in self._segment_frames:
+                frames[segment] = self._segment_frames[segment]
+                continue
+            try:
+                with open_log_segment(segment) as f:
+                    records, _ = self._parse_lines(f, segment, 0)
+            except (OSError, EOFError) as e:
+                # Segmentet komprimeres kanskje fortsatt; det leses neste gang.
+                logger.warning(f"Could not read rotated feedback log segment {segment}: {e}")
+                continue
+            logger.info(f"Read {len(records)} feedback records from rotated segment {segment}")
+            frames[segment] = _records_frame(records)
+            changed = True
+        self._segment_frames = frames
+        return changed
+
+    def _load_active_file(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            changed = not self._active_frame.empty
+            self._reset_active(None)
+            return changed
+        changed = False
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self._identity or stat.st_size < self._offset:
+            if self._identity is not None:
+                logger.info(f"Feedback log {self.path} was rotated, replaced or truncated, reading it from the start.")
+            changed = not self._active_frame.empty
+            self._reset_active(identity)
+        if stat.st_size > self._offset:
+            with open(self.path, "r", encoding="utf-8", newline="") as f:
+                f.seek(self._offset)
+                records, position = self._parse_lines(f, self.path, self._offset)
+            logger.info(f"Read {len(records)} new feedback records ({position - self._offset} bytes) from {self.path}")
+            self._offset = position
+            if records:
+                new_frame = _records_frame(records)
+                self._active_frame = new_frame if self._active_frame.empty else pd.concat(
+                    [self._active_frame, new_frame], ignore_index=True
+                )
+                changed = True
+        return changed
+
+    @staticmethod
+    def _parse_lines(f: IO[str], segment: str, position: int) -> tuple[list[dict], int]:
+        """Parser hele linjer fra `position` og returnerer postene og posisjonen etter siste hele linje."""
+        records = []
+        for line, line_offset in _lines_with_offsets(f, position):
+            position = line_offset + len(line.encode("utf-8"))
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Could not decode feedback log line at byte {line_offset} in {segment}: {line[:200]!r}")
+                continue
+            steps = record.pop("agent_steps", None)
+            record["agent_step_count"] = len(steps) if isinstance(steps, list) else 0
+            for field in HEAVY_FIELDS:
+                record.pop(field, None)
+            record[SEGMENT_COLUMN] = segment
+            record[OFFSET_COLUMN] = line_offset
+            records.append(record)
+        return records, position
+
+    def load_heavy_fields(self, row: dict[str, Any]) -> dict[str, Any]:
+        """
+        Leser de tunge feltene (f.eks. agent_steps) for én tilbakemelding.
+
+        Linjen slås opp på segmentet og posisjonen i raden, og posten som leses
+        tilbake må ha samme message_id og timestamp som raden. Hvis ikke (f.eks.
+        fordi den aktive filen er rotert siden raden ble lest), letes det etter
+        posten i alle segmentene, nyeste først.
+
+        Args:
+            row (dict): Raden fra load(), med '_log_segment', '_log_offset', 'message_id' og 'timestamp'.
+
+        Returns:
+            dict: Feltnavn til verdi. Tom hvis posten ikke finnes.
+        """
+        segment, offset = row.get(SEGMENT_COLUMN), row.get(OFFSET_COLUMN)
+        record = None
+        if segment and offset is not None and not pd.isna(offset):
+            record = self._read_record_at(segment, int(offset))
+        if record is None or not _same_feedback(record, row):
+            logger.info(f"Feedback record for message_id {row.get('message_id')} moved, searching all log segments.")
+            record = self._find_record(row)
+        if record is None:
+            logger.warning(f"Could not find feedback record for message_id {row.get('message_id')} in {self.path}")
+            return {}
+        return {field: record[field] for field in HEAVY_FIELDS if field in record}
+
+    @staticmethod
+    def _read_record_at(segment: str, offset: int) -> dict | None:
+        try:
+            with open_log_segment(segment) as f:
+                if segment.endswith(".gz"):
+                    # Posisjonen gjelder den dekomprimerte strømmen; gzip søker ved å lese fram.
+                    f.buffer.seek(offset)
+                else:
+                    f.seek(offset)
+                return json.loads(f.readline())
+        except (OSError, EOFError, json.JSONDecodeError) as e:
+            logger.info(f"Could not read feedback record at byte {offset} in {segment}: {e}")
+            return None
+
+    def _find_record(self, row: dict[str, Any]) -> dict | None:
+        for segment in reversed(feedback_log_segments(self.path)):
+            try:
+                with open_log_segment(segment) as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        if _same_feedback(record, row):
+                            return record
+            except (OSError, EOFError) as e:
+                logger.warning(f"Could not search feedback log segment {segment}: {e}")
+        return None
+
+
+def _lines_with_offsets(f: IO[str], position: int) -> Iterator[tuple[str, int]]:
+    """Hele linjer med byteposisjonen de starter på. En siste linje uten linjeskift skrives fortsatt og hoppes over."""
+    for line in f:
+        if not line.endswith("\n"):
+            break
+        yield line, position
+        position += len(line.encode("utf-8"))
+
+
+def _records_frame(records: list[dict]) -> pd.DataFrame:
+    frame = pd.DataFrame(records)
+    if "timestamp" in frame.columns:
+        frame["timestamp"] = pd.to_datetime(frame["timestamp"], errors="coerce", utc=True)
+    return frame
+
+
+def _same_feedback(record: dict, row: dict[str, Any]) -> bool:
+    """Om posten fra loggen er den samme tilbakemeldingen som raden (message_id og timestamp)."""
+    if record.get("message_id") != row.get("message_id"):
+        return False
+    record_ts = pd.to_datetime(record.get("timestamp"), errors="coerce", utc=True)
+    row_ts = pd.to_datetime(row.get("timestamp"), errors="coerce", utc=True)
+    if pd.isna(record_ts) or pd.isna(row_ts):
+        return pd.isna(record_ts) and pd.isna(row_ts)
+    return record_ts == row_ts
+
+
+feedback_log_loader = FeedbackLogLoader(FEEDBACK_LOG_FILE)
@@ -4,19 +4,30 @@ import os
 import logging
 from datetime import datetime, timezone
 
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-FEEDBACK_LOG_DIR = os.path.join(PROJECT_ROOT, "logs")
-FEEDBACK_LOG_FILE = os.path.join(FEEDBACK_LOG_DIR, "feedback_log.jsonl")
+from backend.config import FEEDBACK_LOG_DIR, FEEDBACK_LOG_FILE
+from backend.feedback_store import feedback_store
+from backend.feedback_writer import feedback_writer
+from services.result_store import message_agent_steps
 
 logger = logging.getLogger(__name__)
 
 def log_feedback_to_file(feedback_data: dict):
     """
-    Skriver feedback til JSON lines.
+    Skriver feedback til JSON lines (revisjonsloggen) og til feedback-lageret.
+
+    Med bakgrunnsskriveren legges posten bare i køen, og skriveren tar seg av
+    begge deler. Ellers skrives den direkte.
 
     Args:
         feedback_data (dict): Dict med feedback info.
     """
+    if feedback_writer is not None:
+        if feedback_writer.submit(feedback_data):
+            logger.info(f"Feedback queued for message_id: {feedback_data.get('message_id')}")
+        else:
+            st.error("Kunne ikke lagre tilbakemeldingen akkurat nå. Prøv igjen om litt.")
+        return
+
     try:
         if not os.path.exists(FEEDBACK_LOG_DIR):
             os.makedirs(FEEDBACK_LOG_DIR)
@@ -29,6 +40,12 @@ def log_feedback_to_file(feedback_data: dict):
         st.error(f"Kunne ikke skrive tilbakemeldingslogg: {e}")
         logger.error(f"Klarte ikke skrive tilbakemelding til {FEEDBACK_LOG_FILE}: {e}", exc_info=True)
 
+    if feedback_store is not None:
+        try:
+            feedback_store.add(feedback_data)
+        except Exception as e:
+            logger.error(f"Klarte ikke skrive tilbakemelding til {feedback_store.path}: {e}", exc_info=True)
+
 def process_all_feedback():
     """
     Prosesserer all feedback, logger både negative og positive tilbakemeldinger.
@@ -70,7 +87,11 @@ def process_all_feedback():
                     "feedback_score_value": feedback_score,
                     "message_id": message_id,
                     "preceding_user_message_id": preceding_user_message_id,
-                    "agent_steps": message.get("agent_steps", [])
+                    "agent_steps": message_agent_steps(message),
+                    "engine": message.get("engine"),
+                    "latency_ms": message.get("latency_ms"),
+                    "total_tokens": message.get("total_tokens"),
+                    "timings": message.get("timings"),
                 }
 
                 if feedback_score == 0:
@@ -3,11 +3,28 @@ import pandas as pd
 import ast
 import logging
 import json
+import time
+from uuid import uuid4
 
 from backend.agent_builder import build_agent
-from backend.db_client import db
+from backend.db_client import QueryResult, get_schema_fingerprint, track_db_time
+from backend.query_capture import QUERY_TOOL_NAME, take_captured_result
+from backend.question_cache import question_cache
+from backend.result_cache import cached_fetch_result, result_cache
 from backend.llm_client import llm as llm_instance
 from backend.token_tracer import TokenUsageCallbackHandler 
+from backend.metrics import CHART_SUGGESTIONS, QUESTION_LATENCY, QUESTIONS
+from backend.chart_recommender import chart_suggestion_cache, recommend_chart, shape_signature, suggestion_columns
+from backend.usage_ledger import record_usage
+from backend.sql_fast_path import FastPathError, run_fast_path
+from backend.rollups import rollup_manager
+from backend.query_governor import QueryCancelledError, QueryTimeoutError
+from backend.config import (
+    CHART_RECOMMENDER_ENABLED,
+    RESULT_PAGER_THRESHOLD_ROWS,
+    SCHEMA_CONTEXT_ENABLED,
+    SQL_FAST_PATH_ENABLED,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -29,22 +46,38 @@ def get_agent():
     try:
         agent_executor = build_agent()
         logger.info("Agent built successfully.")
+        if rollup_manager is not None:
+            rollup_manager.refresh_if_stale()
         return agent_executor
     except Exception as e:
         logger.exception("Failed to build agent in get_agent")
         st.error(f"Kritisk feil: Kunne ikke initialisere chatbot-agenten: {e}")
         return None
 
-def process_sql_to_dataframe(sql_query: str, original_agent_text: str) -> tuple[str, pd.DataFrame | None]:
+def process_sql_to_dataframe(
+    sql_query: str,
+    original_agent_text: str,
+    captured_result: QueryResult | None = None,
+) -> tuple[str, pd.DataFrame | None]:
     """
     Utfører en SQL-spørring mot databasen og prøver å konvertere resultatet
     til en Pandas DataFrame.
 
+    Hvis agentens SQL-verktøy allerede har et resultat for spørringen
+    (`captured_result`), bygges DataFrame direkte fra det uten ny kjøring.
+    Ellers hentes høyst RESULT_PAGER_THRESHOLD_ROWS + 1 rader via den prosessfelles
+    resultatcachen. Flere rader enn grensen betyr at resultatet blas i fra
+    databasen, så resten hentes aldri her.
+
     Args:
         sql_query (str): SQL-spørringen .
         original_agent_text (str): Den opprinnelige teksten fra agenten, brukt som
                                    en fallback-melding hvis DataFrame-konvertering feiler
                                    eller hvis det ikke er noe resultat.
+        captured_result (QueryResult | None): Resultatet agenten fikk da den kjørte
+                                              spørringen. Kjøres på nytt hvis None,
+                                              eller hvis det er avkortet før grensen
+                                              for blaing.
 
     Returns:
         tuple[str, pd.DataFrame | None]: En tuple som inneholder:
@@ -56,72 +89,208 @@ def process_sql_to_dataframe(sql_query: str, original_agent_text: str) -> tuple[
     df = None
     final_output_text = original_agent_text
     try:
-        logger.info(f"Executing SQL via db.run: {sql_query}")
-        sql_result_structured = db.run(sql_query, fetch="all", include_columns=True)
-        logger.info(f"db.run finished, result type: {type(sql_result_structured)}")
-
-        parsed_data_for_df = None
+        if captured_result is not None and (
+            captured_result.truncation_reason != "row_limit"
+            or captured_result.row_count > RESULT_PAGER_THRESHOLD_ROWS
+        ):
+            logger.info(
+                f"Reusing agent's result for SQL ({captured_result.row_count} rows, "
+                f"{captured_result.elapsed_ms:.1f} ms), skipping re-execution."
+            )
+            result = captured_result
+            if result_cache is not None and result.truncation_reason != "row_limit":
+                result_cache.put(result)
+        else:
+            if captured_result is not None:
+                logger.info("Agent's captured result was truncated, re-executing SQL.")
+            logger.info(f"Executing SQL via result cache/fetch_result: {sql_query}")
+            result = cached_fetch_result(sql_query, max_rows=RESULT_PAGER_THRESHOLD_ROWS + 1)
 
-        if isinstance(sql_result_structured, list) and sql_result_structured:
-            if all(isinstance(row, dict) for row in sql_result_structured):
-                parsed_data_for_df = sql_result_structured
-            else:
-                logger.warning(f"SQL result is a list but not of dicts. Type of first element: {type(sql_result_structured[0]) if sql_result_structured else 'N/A'}. Attempting direct conversion.")
-                parsed_data_for_df = sql_result_structured
-        elif isinstance(sql_result_structured, str):
-            potential_data_str = sql_result_structured.strip()
-            if potential_data_str.startswith('[') and potential_data_str.endswith(']'):
-                try:
-                    parsed_data_for_df = ast.literal_eval(potential_data_str)
-                    if not (isinstance(parsed_data_for_df, list) and all(isinstance(row, dict) for row in parsed_data_for_df)):
-                        logger.warning(f"Parsed string to list, but it's not a list of dicts. Type: {type(parsed_data_for_df)}. Fallback to original string.")
-                        final_output_text = f"Spørringen ble utført, men resultatformatet var uventet (streng som ikke kunne tolkes til tabell): {sql_result_structured}"
-                        parsed_data_for_df = None
-                except Exception as parse_err:
-                    logger.warning(f"Could not parse SQL result string as list: {parse_err}. Raw data: {potential_data_str}")
-                    final_output_text = f"Spørringen ble utført, men resultatformatet var uventet (streng som ikke kunne tolkes): {sql_result_structured}"
-            elif potential_data_str: 
-                final_output_text = potential_data_str
-            else: 
-                final_output_text = "Spørringen ble utført, men returnerte ingen resultater (tom streng)."
-        elif sql_result_structured is None:
-             final_output_text = "Spørringen ble utført, men returnerte ingen data (None)."
-        else: 
-            logger.warning(f"SQL result has an unexpected type: {type(sql_result_structured)}. Attempting direct DataFrame conversion.")
-            parsed_data_for_df = sql_result_structured 
-
-        if parsed_data_for_df is not None:
+        if not result.columns:
+            final_output_text = "Spørringen ble utført, men returnerte ingen data."
+        elif result.row_count == 0:
+            final_output_text = "Spørringen kjørte vellykket, men returnerte ingen treff."
+        else:
             try:
-                if isinstance(parsed_data_for_df, list) and not parsed_data_for_df: 
-                    df = pd.DataFrame() 
-                elif not isinstance(parsed_data_for_df, (list, dict)): 
-                     df = pd.DataFrame([parsed_data_for_df]) 
-                else:
-                    df = pd.DataFrame(parsed_data_for_df)
-
-                if df is not None and not df.empty:
-                    if not any(keyword in final_output_text.lower() for keyword in ["beklager", "error", "feil", "kunne ikke"]):
-                        final_output_text = "Her er resultatene for spørringen din:"
-                else: 
-                    if isinstance(parsed_data_for_df, list) and not parsed_data_for_df: 
-                        final_output_text = "Spørringen kjørte vellykket, men returnerte ingen treff."
-                    elif df is not None and df.empty: 
-                         final_output_text = "Spørringen resulterte i et tomt datasett."
-                    df = None 
+                df = result.to_dataframe()
+                if not any(keyword in final_output_text.lower() for keyword in ["beklager", "error", "feil", "kunne ikke"]):
+                    final_output_text = "Her er resultatene for spørringen din:"
+                # Avkortet på radgrensen betyr bare at tabellen blas i fra databasen.
+                if result.truncated and result.truncation_reason != "row_limit":
+                    final_output_text += (
+                        f"\n\n*Resultatet ble avkortet til de første {result.row_count:,} radene "
+                        f"fordi det overskred grensen for størrelse. Avgrens spørsmålet for å se alt.*"
+                    )
             except Exception as df_err:
-                logger.error(f"Kunne ikke lage DataFrame fra resultater: {df_err}. Rådata: {str(parsed_data_for_df)[:500]}", exc_info=True)
-                final_output_text = f"Kunne ikke lage DataFrame fra SQL-resultater: {df_err}\nRådata mottatt: {str(parsed_data_for_df)[:200]}..."
+                logger.error(f"Kunne ikke lage DataFrame fra resultater: {df_err}. Kolonner: {result.columns}", exc_info=True)
+                final_output_text = f"Kunne ikke lage DataFrame fra SQL-resultater: {df_err}"
                 df = None
-        elif sql_result_structured is None or (isinstance(sql_result_structured, str) and not sql_result_structured.strip()):
-             if not final_output_text or final_output_text == original_agent_text:
-                final_output_text = "Spørringen ble utført, men returnerte ingen data."
 
     except Exception as db_err:
         logger.error(f"Feil under SQL-kjøring eller resultatbehandling: {db_err}", exc_info=True)
-        final_output_text = f"Beklager, en feil oppstod under kjøring av SQL eller behandling av resultat: {db_err}"
+        if isinstance(db_err, (QueryTimeoutError, QueryCancelledError)):
+            final_output_text = f"Beklager, spørringen ble stoppet: {db_err}"
+        else:
+            final_output_text = f"Beklager, en feil oppstod under kjøring av SQL eller behandling av resultat: {db_err}"
         df = None
     return final_output_text, df
 
+def run_agent_request(
+    agent,
+    prompt: str,
+    token_callback: TokenUsageCallbackHandler,
+    bypass_cache: bool = False,
+) -> dict:
+    """
+    Besvarer ett spørsmål: slår opp i spørsmålscachen, prøver ellers hurtigstien
+    (ett LLM-kall som skriver SQL direkte) og faller tilbake til agenten hvis den
+    feiler, og bygger DataFrame fra SQL-resultatet.
+
+    Funksjonen bruker ikke st.session_state, så den kan kjøres i en arbeidertråd.
+
+    Args:
+        agent (AgentExecutor): Agenten som skal kjøres.
+        prompt (str): Brukerens spørsmål.
+        token_callback (TokenUsageCallbackHandler): Callback for token- og fremdriftssporing.
+        bypass_cache (bool): Hopp over spørsmålscachen for denne meldingen.
+
+    Returns:
+        dict: 'content' (svartekst), 'dataframe' (pd.DataFrame | None),
+              'agent_steps' (list[dict]), 'from_cache' (bool), 'engine'
+              ("cache", "fast_path" eller "agent"), 'latency_ms' (float) og
+              'sql' (SQL-en som ga tabellen, eller None) og 'timings' (LLM-tid,
+              databasetid og antall spørringer).
+    """
+    agent_run_id = uuid4()
+    final_df = None
+    sql_query_found = None
+    agent_steps_for_display = []
+    assistant_response_content = ""
+    cache_entry = None
+    fast_path_result = None
+    engine = "agent"
+    started = time.perf_counter()
+
+    with track_db_time() as db_timer:
+        try:
+            logger.info(f"Processing message: '{prompt}' with agent.")
+            if not agent:
+                raise Exception("Agent not available for processing.")
+
+            schema_hash = None
+            if question_cache is not None and not bypass_cache:
+                schema_hash = get_schema_fingerprint()
+                cache_entry = question_cache.get(prompt, schema_hash)
+
+            if cache_entry is None and SQL_FAST_PATH_ENABLED:
+                try:
+                    fast_path_result = run_fast_path(prompt, callbacks=[token_callback])
+                except FastPathError as e:
+                    logger.info(f"Fast path failed, falling back to agent: {e}")
+                    agent_steps_for_display.append({
+                        "type": "Hurtigsti forkastet", "name": "sql_fast_path",
+                        "log": f"{e} Agenten tar over."
+                    })
+
+            if cache_entry is not None:
+                engine = "cache"
+                agent_output_text = cache_entry["answer_text"]
+                sql_query_found = cache_entry["sql_query"]
+                agent_steps_for_display.append({
+                    "type": "Hurtigbuffer", "name": QUERY_TOOL_NAME, "input": sql_query_found,
+                    "log": "Svar hentet fra hurtigbuffer, agenten ble ikke kjørt."
+                })
+                assistant_response_content, final_df = process_sql_to_dataframe(sql_query_found, agent_output_text)
+                if final_df is None:
+                    logger.info("Cached SQL no longer returns data, invalidating cache entry.")
+                    question_cache.invalidate([cache_entry["cache_key"]])
+            elif fast_path_result is not None:
+                engine = "fast_path"
+                sql_query_found = fast_path_result.sql
+                agent_steps_for_display.append({
+                    "type": "Hurtigsti", "name": QUERY_TOOL_NAME, "input": sql_query_found,
+                    "log": (
+                        f"SQL generert med ett LLM-kall ({fast_path_result.llm_ms:.0f} ms), "
+                        f"validert ({fast_path_result.validate_ms:.0f} ms) og kjørt "
+                        f"({fast_path_result.result.elapsed_ms:.0f} ms)."
+                    )
+                })
+                assistant_response_content, final_df = process_sql_to_dataframe(
+                    sql_query_found, "", captured_result=fast_path_result.result
+                )
+                if question_cache is not None and final_df is not None:
+                    question_cache.put(
+                        prompt, schema_hash or get_schema_fingerprint(),
+                        sql_query_found, assistant_response_content
+                    )
+            else:
+                response = agent.invoke(
+                    {"input": prompt},
+                    config={"callbacks": [token_callback], "run_id": agent_run_id}
+                )
+                logger.info("Agent invoke finished.")
+                agent_output_text = response.get('output', 'Beklager, jeg fikk ikke noe svar fra agenten.')
+                intermediate_steps = response.get('intermediate_steps', [])
+
+                if intermediate_steps:
+                    for idx, (action, observation) in enumerate(intermediate_steps):
+                        tool_name = getattr(action, 'tool', 'Unknown Tool')
+                        raw_tool_input = getattr(action, 'tool_input', '')
+                        tool_input_str = str(raw_tool_input)
+
+                        step_detail = {
+                            "type": "Verktøy brukt", "name": tool_name, "input": tool_input_str,
+                            "output": str(observation), "log": getattr(action, 'log', '').strip().replace('\n', ' ')
+                        }
+                        agent_steps_for_display.append(step_detail)
+
+                        if tool_name == QUERY_TOOL_NAME:
+                            sql_query_found = tool_input_str
+                            logger.info(f"Found SQL query (Tool: {tool_name}): {sql_query_found}")
+                else:
+                    logger.info("Agent reported no intermediate steps.")
+                logger.info(
+                    f"Agent used {len(intermediate_steps)} tool calls "
+                    f"(schema context in prompt: {SCHEMA_CONTEXT_ENABLED})"
+                )
+
+                if sql_query_found:
+                    captured_result = take_captured_result(agent_run_id, sql_query_found)
+                    assistant_response_content, final_df = process_sql_to_dataframe(
+                        sql_query_found, agent_output_text, captured_result=captured_result
+                    )
+                    if question_cache is not None and final_df is not None:
+                        question_cache.put(
+                            prompt, schema_hash or get_schema_fingerprint(),
+                            sql_query_found, agent_output_text
+                        )
+                else:
+                    logger.info("No SQL query was executed by the agent, or the SQL tool was not recognized by the logger.")
+                    assistant_response_content = agent_output_text
+
+        except Exception as e:
+            logger.exception("Error during agent execution or data processing")
+            assistant_response_content = f"En feil oppstod under behandling av din forespørsel: {type(e).__name__} - {e}"
+            final_df = None
+
+    latency_seconds = time.perf_counter() - started
+    QUESTIONS.inc(engine=engine)
+    QUESTION_LATENCY.observe(latency_seconds, engine=engine)
+    return {
+        "content": assistant_response_content,
+        "dataframe": final_df,
+        "agent_steps": agent_steps_for_display,
+        "from_cache": cache_entry is not None,
+        "engine": engine,
+        "latency_ms": latency_seconds * 1000,
+        "sql": sql_query_found if final_df is not None else None,
+        "timings": {
+            "llm_ms": token_callback.llm_time_ms(),
+            "db_ms": db_timer.elapsed_ms,
+            "db_queries": db_timer.queries,
+        },
+    }
+
 def get_visualization_suggestion(df: pd.DataFrame) -> dict | None:
     """
     Ber en LLM om å foreslå en passende visualisering.
@@ -187,6 +356,7 @@ def get_visualization_suggestion(df: pd.DataFrame) -> dict | None:
     
     vis_token_callback = TokenUsageCallbackHandler()
     suggestion = None
+    started = time.perf_counter()
 
     try:
         response = llm_instance.invoke(
@@ -222,7 +392,7 @@ def get_visualization_suggestion(df: pd.DataFrame) -> dict | None:
         logger.exception(f"Error during LLM call for visualization suggestion: {e}")
         st.toast(f"Feil under henting av visualiseringsforslag: {e}", icon="⚠️")
     finally:
-        usage_report = vis_token_callback.get_report()
+        usage_report = vis_token_callback.get_summary()
         
         viz_tokens_used = usage_report.get('total_tokens_used', 0)
         viz_prompt_tokens = usage_report.get('prompt_tokens_used', 0)
@@ -247,4 +417,61 @@ def get_visualization_suggestion(df: pd.DataFrame) -> dict | None:
             
             logger.info(f"Session totals updated after visualization: Tokens={st.session_state.session_total_tokens}, gCO2e={st.session_state.session_total_gco2e:.4f}")
 
-    return suggestion
\ No newline at end of file
+        record_usage(
+            user=st.session_state.get("user_identifier", "Unknown User"),
+            kind="visualization",
+            usage_report=usage_report,
+            gco2e=viz_tokens_used * TOKEN_TO_GCO2E_FACTOR,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            message_id=st.session_state.get("last_message_id_for_ai_viz"),
+        )
+
+    return suggestion
+
+
+def suggest_visualization(df: pd.DataFrame) -> dict | None:
+    """
+    Foreslår en visualisering. Den regelbaserte anbefalingen prøves først; bare
+    tvetydige resultatformer går til LLM-en, og svaret caches per resultatform.
+
+    Args:
+        df (pd.DataFrame): df som skal visualiseres.
+
+    Returns:
+        dict | None: Forslaget i samme format som `get_visualization_suggestion`, med
+                      'source' satt til "heuristic", "cache" eller "llm". None hvis
+                      ingen forslag kunne lages.
+    """
+    if df is None or df.empty:
+        return None
+
+    if CHART_RECOMMENDER_ENABLED:
+        suggestion = recommend_chart(df)
+        if suggestion is not None:
+            logger.info(f"Heuristic visualization suggestion: {suggestion}")
+            CHART_SUGGESTIONS.inc(source="heuristic")
+            return {**suggestion, "source": "heuristic"}
+
+    signature = shape_signature(df)
+    if chart_suggestion_cache is not None:
+        try:
+            suggestion = chart_suggestion_cache.get(signature)
+        except Exception as e:
+            logger.error(f"Oppslag i grafforslag-cachen feilet: {e}", exc_info=True)
+            suggestion = None
+        if suggestion is not None:
+            logger.info(f"Visualization suggestion from cache: {suggestion}")
+            CHART_SUGGESTIONS.inc(source="cache")
+            return {**suggestion, "source": "cache"}
+
+    suggestion = get_visualization_suggestion(df)
+    if suggestion is None:
+        return None
+    CHART_SUGGESTIONS.inc(source="llm")
+    # Forslag som peker på kolonner som ikke finnes, caches ikke.
+    if chart_suggestion_cache is not None and all(c in df.columns for c in suggestion_columns(suggestion)):
+        try:
+            chart_suggestion_cache.put(signature, df, suggestion)
+        except Exception as e:
+            logger.error(f"Kunne ikke lagre grafforslag i cachen: {e}", exc_info=True)
+    return {**suggestion, "source": "llm"}
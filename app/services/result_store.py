@@ -0,0 +1,235 @@
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+
+from backend.config import (
+    RESULT_STORE_ENABLED,
+    RESULT_STORE_DIR,
+    RESULT_STORE_MEMORY_ITEMS,
+    RESULT_STORE_MAX_AGE_HOURS,
+)
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESULT_FILE_NAME = "result.arrow"
+STEPS_FILE_NAME = "agent_steps.json"
+GC_INTERVAL_SECONDS = 600
+
+
+@dataclass(frozen=True)
+class ResultHandle:
+    """Peker til et resultat på disk. Dette er det eneste som ligger igjen i meldingen."""
+
+    session_id: str
+    message_id: str
+    row_count: int
+    has_dataframe: bool
+    has_agent_steps: bool
+
+    @property
+    def key(self) -> str:
+        return f"{self.session_id}/{self.message_id}"
+
+
+class ResultStore:
+    """
+    Lagrer DataFrame og agentsteg for hver melding på disk, i én mappe per økt,
+    slik at st.session_state bare holder et lite håndtak.
+
+    DataFrames skrives som Arrow IPC-filer og leses tilbake som minnemappede
+    pa.Table-er, som vises direkte uten å kopieres til heapen. Konvertering til
+    pandas skjer bare når noen ber om en DataFrame (f.eks. til visualisering), og
+    resultatet av den caches ikke. De siste tabellene holdes i en liten LRU. Øktmapper
+    som ikke er brukt på RESULT_STORE_MAX_AGE_HOURS timer slettes.
+    """
+
+    def __init__(self, root_dir: str, memory_items: int, max_age_seconds: float) -> None:
+        self.root_dir = root_dir
+        self.memory_items = memory_items
+        self.max_age_seconds = max_age_seconds
+        self._memory: OrderedDict[str, pa.Table] = OrderedDict()
+        self._lock = Lock()
+        self._last_gc = 0.0
+        os.makedirs(root_dir, exist_ok=True)
+        self.hits = 0
+        self.disk_reads = 0
+
+    def _message_dir(self, session_id: str, message_id: str) -> str:
+        return os.path.join(self.root_dir, session_id, message_id)
+
+    def _remember(self, key: str, table: pa.Table) -> None:
+        with self._lock:
+            self._memory[key] = table
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def put(
+        self,
+        session_id: str,
+        message_id: str,
+        df: pd.DataFrame | None,
+        agent_steps: list[dict[str, Any]] | None,
+    ) -> ResultHandle:
+        """
+        Skriver resultatet og agentstegene til en melding til disk.
+
+        Args:
+            session_id (str): Økten meldingen hører til.
+            message_id (str): Meldingens ID.
+            df (pd.DataFrame | None): Resultattabellen.
+            agent_steps (list[dict] | None): Agentens steg til debugvisningen.
+
+        Returns:
+            ResultHandle: Håndtaket som lagres i meldingen i stedet for dataene.
+        """
+        message_dir = self._message_dir(session_id, message_id)
+        os.makedirs(message_dir, exist_ok=True)
+        table = None
+        if df is not None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            tmp_path = os.path.join(message_dir, RESULT_FILE_NAME + ".tmp")
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, os.path.join(message_dir, RESULT_FILE_NAME))
+        if agent_steps:
+            with open(os.path.join(message_dir, STEPS_FILE_NAME), "w", encoding="utf-8") as f:
+                json.dump(agent_steps, f, ensure_ascii=False, default=str)
+
+        handle = ResultHandle(
+            session_id, message_id,
+            row_count=len(df) if df is not None else 0,
+            has_dataframe=df is not None,
+            has_agent_steps=bool(agent_steps),
+        )
+        if table is not None:
+            self._remember(handle.key, table)
+        os.utime(os.path.join(self.root_dir, session_id))
+        self.collect_garbage_if_due()
+        return handle
+
+    def get_table(self, handle: ResultHandle) -> pa.Table | None:
+        """Henter resultattabellen, fra LRU-en hvis den er brukt nylig, ellers minnemappet fra disk (uten kopi)."""
+        if not handle.has_dataframe:
+            return None
+        with self._lock:
+            table = self._memory.get(handle.key)
+            if table is not None:
+                self._memory.move_to_end(handle.key)
+                self.hits += 1
+                return table
+
+        path = os.path.join(self._message_dir(handle.session_id, handle.message_id), RESULT_FILE_NAME)
+        try:
+            # Bufferne i tabellen peker inn i minnemappingen, som lever så lenge tabellen gjør.
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+        except FileNotFoundError:
+            logger.warning(f"Result file for message {handle.key} is gone (session directory collected?).")
+            return None
+        self.disk_reads += 1
+        os.utime(os.path.join(self.root_dir, handle.session_id))
+        self._remember(handle.key, table)
+        return table
+
+    def get_dataframe(self, handle: ResultHandle, max_rows: int | None = None) -> pd.DataFrame | None:
+        """Resultattabellen (eventuelt bare de første `max_rows` radene) konvertert til pandas. Kopien caches ikke."""
+        table = self.get_table(handle)
+        if table is None:
+            return None
+        if max_rows is not None:
+            table = table.slice(0, max_rows)
+        return table.to_pandas()
+
+    def get_agent_steps(self, handle: ResultHandle) -> list[dict[str, Any]]:
+        if not handle.has_agent_steps:
+            return []
+        path = os.path.join(self._message_dir(handle.session_id, handle.message_id), STEPS_FILE_NAME)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"Agent steps for message {handle.key} are gone (session directory collected?).")
+            return []
+
+    def collect_garbage_if_due(self) -> None:
+        if time.time() - self._last_gc >= GC_INTERVAL_SECONDS:
+            self.collect_garbage()
+
+    def collect_garbage(self) -> int:
+        """
+        Sletter øktmapper som ikke er skrevet til på `max_age_seconds`.
+
+        Returns:
+            int: Antall mapper som ble slettet.
+        """
+        self._last_gc = time.time()
+        cutoff = self._last_gc - self.max_age_seconds
+        removed = 0
+        for entry in os.scandir(self.root_dir):
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        if removed:
+            with self._lock:
+                for key in [k for k in self._memory if not os.path.isdir(os.path.join(self.root_dir, k.split("/")[0]))]:
+                    del self._memory[key]
+            logger.info(f"Result store removed {removed} stale session directories.")
+        return removed
+
+    def stats(self) -> dict[str, int]:
+        sessions = sum(1 for entry in os.scandir(self.root_dir) if entry.is_dir())
+        size_bytes = sum(
+            os.path.getsize(os.path.join(dirpath, name))
+            for dirpath, _, names in os.walk(self.root_dir) for name in names
+        )
+        with self._lock:
+            in_memory = len(self._memory)
+        return {
+            "sessions": sessions,
+            "size_bytes": size_bytes,
+            "in_memory": in_memory,
+            "memory_hits": self.hits,
+            "disk_reads": self.disk_reads,
+        }
+
+
+result_store = ResultStore(
+    RESULT_STORE_DIR,
+    memory_items=RESULT_STORE_MEMORY_ITEMS,
+    max_age_seconds=RESULT_STORE_MAX_AGE_HOURS * 3600,
+) if RESULT_STORE_ENABLED else None
+
+
+def message_table(message: dict) -> pa.Table | pd.DataFrame | None:
+    """Resultattabellen til visning: minnemappet pa.Table fra resultatlageret, ellers DataFrame-en i meldingen."""
+    handle = message.get("result_handle")
+    if handle is not None and result_store is not None:
+        return result_store.get_table(handle)
+    return message.get("dataframe")
+
+
+def message_dataframe(message: dict) -> pd.DataFrame | None:
+    """DataFrame for en melding, enten den ligger i meldingen eller i resultatlageret."""
+    handle = message.get("result_handle")
+    if handle is not None and result_store is not None:
+        return result_store.get_dataframe(handle)
+    return message.get("dataframe")
+
+
+def message_agent_steps(message: dict) -> list[dict[str, Any]]:
+    """Agentstegene for en melding, enten de ligger i meldingen eller i resultatlageret."""
+    handle = message.get("result_handle")
+    if handle is not None and result_store is not None:
+        return result_store.get_agent_steps(handle)
+    return message.get("agent_steps", [])
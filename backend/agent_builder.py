@@ -2,7 +2,10 @@ from langchain_community.agent_toolkits import create_sql_agent
 from langchain.agents import AgentExecutor
 from langchain.agents.agent_types import AgentType
 from backend.llm_client import llm
-from backend.db_client import toolkit
+from backend.db_client import db
+from backend.query_capture import CapturingSQLDatabaseToolkit
+from backend.schema_context import build_schema_context_prompt, schema_context
+from backend.config import SCHEMA_CONTEXT_ENABLED
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,12 +14,20 @@ def build_agent() -> AgentExecutor:
     """Bygger og returnerer en LangChain-agent for SQL-spørringer."""
     logger.info('Bygger agent...')
     try:
+        toolkit = CapturingSQLDatabaseToolkit(db=db, llm=llm, include_schema_tools=not SCHEMA_CONTEXT_ENABLED)
+        logger.info("Toolkit bygget")
+        prompt_kwargs = {}
+        if SCHEMA_CONTEXT_ENABLED:
+            schema_context.get()
+            prompt_kwargs["prompt"] = build_schema_context_prompt()
+            logger.info("Agent bruker forhåndsberegnet skjemakontekst")
         raw_agent = create_sql_agent(
         llm=llm,
         toolkit=toolkit,
         agent_type="zero-shot-react-description",
         verbose=False,
         top_k=1000,
+        **prompt_kwargs,
         )
         agent_executor = AgentExecutor.from_agent_and_tools(
             agent=raw_agent.agent,
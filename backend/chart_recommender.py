@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+
+import pandas as pd
+
+from backend.config import (
+    CHART_SUGGESTION_CACHE_ENABLED,
+    CHART_SUGGESTION_CACHE_MAX_ENTRIES,
+    CHART_SUGGESTION_CACHE_PATH,
+)
+from backend.metrics import CACHE_LOOKUPS
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_SERIES = 5
+MAX_COLOR_CATEGORIES = 10
+SAMPLE_VALUES = 5
+
+LAT_NAMES = {"lat", "latitude", "breddegrad"}
+LON_NAMES = {"lon", "lng", "long", "longitude", "lengdegrad"}
+TEMPORAL_NAMES = {
+    "dato", "date", "dag", "day", "tid", "time", "tidspunkt", "timestamp", "uke", "week",
+    "måned", "maaned", "month", "kvartal", "quarter", "år", "aar", "year", "periode", "period",
+}
+ID_NAMES = {"id", "nr", "nummer", "kode", "code"}
+
+_NAME_TOKEN_RE = re.compile(r"[^\wæøå]+|_", re.IGNORECASE)
+# Datoer fra SQLite kommer som tekst: 2024, 2024-05, 2024-05-17, 2024-05-17T12:00 osv.
+_ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}(-\d{2})?([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chart_suggestions (
+    signature TEXT PRIMARY KEY,
+    columns_json TEXT NOT NULL,
+    suggestion_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hit_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_chart_suggestions_last_access ON chart_suggestions(last_access);
+"""
+
+
+@dataclass(frozen=True)
+class ColumnProfile:
+    """
+    Hvordan en kolonne kan brukes i en graf.
+
+    Attributes:
+        name (str): Kolonnenavnet.
+        role (str): "temporal", "measure", "category", "lat" eller "lon".
+    """
+
+    name: str
+    role: str
+
+
+def _name_tokens(name: str) -> set[str]:
+    return {token for token in _NAME_TOKEN_RE.split(str(name).casefold()) if token}
+
+
+def _looks_like_dates(series: pd.Series) -> bool:
+    # Ser bare på de første verdiene, så kostnaden ikke vokser med antall rader.
+    sample = [v for v in series.array[:SAMPLE_VALUES * 2].tolist() if not pd.isna(v)][:SAMPLE_VALUES]
+    return bool(sample) and all(isinstance(v, str) and _ISO_DATE_RE.match(v) for v in sample)
+
+
+def profile_column(name: str, series: pd.Series) -> ColumnProfile:
+    """Klassifiserer en kolonne ut fra datatype, navn og (for tekst) noen få verdier."""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return ColumnProfile(name, "category")
+    if pd.api.types.is_datetime64_any_dtype(dtype) or isinstance(dtype, pd.PeriodDtype):
+        return ColumnProfile(name, "temporal")
+    if pd.api.types.is_numeric_dtype(dtype):
+        tokens = _name_tokens(name)
+        if tokens & LAT_NAMES:
+            return ColumnProfile(name, "lat")
+        if tokens & LON_NAMES:
+            return ColumnProfile(name, "lon")
+        if tokens & TEMPORAL_NAMES and pd.api.types.is_integer_dtype(dtype):
+            return ColumnProfile(name, "temporal")
+        if tokens & ID_NAMES:
+            return ColumnProfile(name, "category")
+        return ColumnProfile(name, "measure")
+    if _looks_like_dates(series):
+        return ColumnProfile(name, "temporal")
+    return ColumnProfile(name, "category")
+
+
+def _series_label(columns: list[str]) -> str:
+    return ", ".join(columns)
+
+
+def recommend_chart(df: pd.DataFrame) -> dict | None:
+    """
+    Regelbasert grafvalg for de vanlige resultatformene, uten LLM-kall.
+
+    - lat/lon-kolonner gir kart.
+    - Én tidskolonne og måltall gir linjediagram (med farge for én kategori med få verdier).
+    - Én kategori og måltall gir søylediagram; to kategorier og ett måltall gir søyler
+      farget etter kategorien med færrest verdier.
+    - To måltall og ingenting annet gir punktdiagram.
+
+    Args:
+        df (pd.DataFrame): Resultatet som skal visualiseres.
+
+    Returns:
+        dict | None: Forslag i samme format som LLM-en gir, eller None hvis formen er tvetydig.
+    """
+    if df is None or df.empty:
+        return None
+
+    profiles = [profile_column(name, series) for name, series in df.items()]
+    by_role: dict[str, list[ColumnProfile]] = {}
+    for profile in profiles:
+        by_role.setdefault(profile.role, []).append(profile)
+    temporal = by_role.get("temporal", [])
+    measures = [p.name for p in by_role.get("measure", [])]
+    categories = [p.name for p in by_role.get("category", [])]
+
+    if by_role.get("lat") and by_role.get("lon"):
+        lat, lon = by_role["lat"][0].name, by_role["lon"][0].name
+        return {"chart_type": "map", "params": {"lat": lat, "lon": lon}, "title": "Kart over resultatet"}
+
+    if not measures or len(measures) > MAX_SERIES:
+        return None
+
+    if len(temporal) == 1:
+        x = temporal[0].name
+        if not categories:
+            return {
+                "chart_type": "line_chart",
+                "params": {"x": x, "y": measures},
+                "title": f"{_series_label(measures)} over tid",
+            }
+        if len(categories) == 1 and len(measures) == 1 and df[categories[0]].nunique() <= MAX_COLOR_CATEGORIES:
+            color = categories[0]
+            return {
+                "chart_type": "line_chart",
+                "params": {"x": x, "y": measures[0], "color": color},
+                "title": f"{measures[0]} over tid per {color}",
+            }
+        return None
+
+    if temporal:
+        return None
+
+    if len(categories) == 1:
+        x = categories[0]
+        return {
+            "chart_type": "bar_chart",
+            "params": {"x": x, "y": measures},
+            "title": f"{_series_label(measures)} per {x}",
+        }
+
+    if len(categories) == 2 and len(measures) == 1:
+        # Kategorien med færrest verdier blir farge, den andre x-akse.
+        color, x = sorted(categories, key=lambda name: df[name].nunique())
+        if df[color].nunique() > MAX_COLOR_CATEGORIES:
+            return None
+        return {
+            "chart_type": "bar_chart",
+            "params": {"x": x, "y": measures[0], "color": color},
+            "title": f"{measures[0]} per {x} og {color}",
+        }
+
+    if not categories and len(measures) == 2:
+        x, y = measures
+        return {"chart_type": "scatter_chart", "params": {"x": x, "y": y}, "title": f"{y} mot {x}"}
+
+    return None
+
+
+def shape_signature(df: pd.DataFrame) -> str:
+    """Signatur for resultatformen: kolonnenavn og datatyper i rekkefølge."""
+    shape = [[str(name), str(dtype)] for name, dtype in df.dtypes.items()]
+    return hashlib.sha256(json.dumps(shape, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def suggestion_columns(suggestion: dict) -> list[str]:
+    """Kolonnene et forslag refererer til (x, y, color, size, lat, lon)."""
+    columns = []
+    for value in (suggestion.get("params") or {}).values():
+        if isinstance(value, list):
+            columns.extend(str(v) for v in value if v)
+        elif value:
+            columns.append(str(value))
+    return columns
+
+
+class ChartSuggestionCache:
+    """
+    Persistent cache for LLM-ens visualiseringsforslag, lagret i SQLite.
+
+    Nøkkelen er signaturen for resultatformen (kolonnenavn og datatyper), så et
+    nytt resultat med samme form gjenbruker forslaget uten nytt LLM-kall. De minst
+    nylig brukte oppføringene kastes når det er flere enn `max_entries`.
+    """
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+        logger.info(f"Chart suggestion cache opened at {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get(self, signature: str) -> dict | None:
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT suggestion_json FROM chart_suggestions WHERE signature = ?", (signature,)
+            ).fetchone()
+            if row is None:
+                CACHE_LOOKUPS.inc(cache="chart", result="miss")
+                return None
+            conn.execute(
+                "UPDATE chart_suggestions SET last_access = ?, hit_count = hit_count + 1 WHERE signature = ?",
+                (time.time(), signature),
+            )
+        CACHE_LOOKUPS.inc(cache="chart", result="hit")
+        return json.loads(row["suggestion_json"])
+
+    def put(self, signature: str, df: pd.DataFrame, suggestion: dict) -> None:
+        """Lagrer forslaget for resultatformen og kaster de minst nylig brukte over `max_entries`."""
+        now = time.time()
+        columns = [[str(name), str(dtype)] for name, dtype in df.dtypes.items()]
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chart_suggestions "
+                "(signature, columns_json, suggestion_json, created_at, last_access, hit_count) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (signature, json.dumps(columns, ensure_ascii=False), json.dumps(suggestion, ensure_ascii=False), now, now),
+            )
+            conn.execute(
+                "DELETE FROM chart_suggestions WHERE signature IN ("
+                "SELECT signature FROM chart_suggestions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self) -> int:
+        with closing(self._connect()) as conn, conn:
+            deleted = conn.execute("DELETE FROM chart_suggestions").rowcount
+        logger.info(f"Chart suggestion cache invalidated {deleted} entries")
+        return deleted
+
+    def stats(self) -> dict[str, int]:
+        with closing(self._connect()) as conn:
+            entries, hits = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM chart_suggestions"
+            ).fetchone()
+        return {"entries": entries, "hits": hits}
+
+
+chart_suggestion_cache = ChartSuggestionCache(
+    CHART_SUGGESTION_CACHE_PATH,
+    max_entries=CHART_SUGGESTION_CACHE_MAX_ENTRIES,
+) if CHART_SUGGESTION_CACHE_ENABLED else None
@@ -7,6 +7,19 @@ logger = logging.getLogger(__name__)
 load_dotenv(override=True)
 
 
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(PROJECT_ROOT, 'cache'))
+FEEDBACK_LOG_DIR = os.path.join(PROJECT_ROOT, 'logs')
+FEEDBACK_LOG_FILE = os.path.join(FEEDBACK_LOG_DIR, 'feedback_log.jsonl')
+
+
 AZURE_OPENAI_API_KEY = os.getenv('AZURE_OPENAI_API_KEY')
 AZURE_OPENAI_ENDPOINT = os.getenv('AZURE_OPENAI_ENDPOINT')
 
@@ -19,3 +32,150 @@ if DATABASE_URI == 'sqlite:///data-ekom.db':
     logger.warning("Environment variable DATABASE_URI not set. Using default: %s", DATABASE_URI)
 elif not DATABASE_URI:
     logger.critical("Missing required environment variable: DATABASE_URI and no default set.")
+
+# Tilkoblingspool og skrivebeskyttet oppsett for databasen (chat-arbeidslasten leser bare).
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '30'))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv('DB_POOL_RECYCLE_SECONDS', '1800'))
+DB_READ_ONLY = _env_flag('DB_READ_ONLY', True)
+# WAL endrer databasefilen varig (og krever skrivetilgang én gang), derfor av som standard.
+SQLITE_WAL = _env_flag('SQLITE_WAL', False)
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', str(64 * 1024)))
+
+# Grenser for generert SQL: tidsgrense per spørring og maks rader/bytes i et resultat.
+QUERY_TIMEOUT_SECONDS = float(os.getenv('QUERY_TIMEOUT_SECONDS', '30'))
+QUERY_MAX_ROWS = int(os.getenv('QUERY_MAX_ROWS', '200000'))
+QUERY_MAX_BYTES = int(os.getenv('QUERY_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# Maks antall rader agentens SQL-verktøy tar vare på for visning i UI.
+# Resultater med flere rader hentes på nytt ved visning.
+QUERY_CAPTURE_MAX_ROWS = int(os.getenv('QUERY_CAPTURE_MAX_ROWS', '10000'))
+
+# Antall rader per fetchmany-kall når SQL-resultater bygges kolonnevis.
+FETCH_BATCH_SIZE = int(os.getenv('FETCH_BATCH_SIZE', '5000'))
+
+# Persistent cache fra spørsmål til SQL og svar (hopper over agenten ved treff).
+QUESTION_CACHE_ENABLED = _env_flag('QUESTION_CACHE_ENABLED', True)
+QUESTION_CACHE_PATH = os.getenv('QUESTION_CACHE_PATH', os.path.join(CACHE_DIR, 'question_cache.db'))
+QUESTION_CACHE_MAX_ENTRIES = int(os.getenv('QUESTION_CACHE_MAX_ENTRIES', '500'))
+QUESTION_CACHE_TTL_SECONDS = int(os.getenv('QUESTION_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Prosessfelles cache for SQL-resultater. Nøkkel: normalisert SQL + dataversjon.
+# For SQLite brukes filens endringstid som versjon; for andre databaser kan en
+# probe-spørring settes (f.eks. "SELECT max(sist_oppdatert) FROM ekom").
+RESULT_CACHE_ENABLED = _env_flag('RESULT_CACHE_ENABLED', True)
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+RESULT_CACHE_VERSION_PROBE = os.getenv('RESULT_CACHE_VERSION_PROBE') or None
+RESULT_CACHE_PROBE_INTERVAL_SECONDS = float(os.getenv('RESULT_CACHE_PROBE_INTERVAL_SECONDS', '5'))
+RESULT_CACHE_FALLBACK_TTL_SECONDS = float(os.getenv('RESULT_CACHE_FALLBACK_TTL_SECONDS', '300'))
+
+# Agentforespørsler kjøres i en prosessfelles trådpool med begrenset kø.
+AGENT_MAX_WORKERS = int(os.getenv('AGENT_MAX_WORKERS', '4'))
+AGENT_MAX_QUEUE = int(os.getenv('AGENT_MAX_QUEUE', '32'))
+AGENT_JOB_RETENTION_SECONDS = float(os.getenv('AGENT_JOB_RETENTION_SECONDS', '3600'))
+AGENT_POLL_INTERVAL_SECONDS = float(os.getenv('AGENT_POLL_INTERVAL_SECONDS', '0.5'))
+
+# Strøm LLM-svar token for token (on_llm_new_token), slik at UI-et kan vise
+# agentens steg og det endelige svaret mens det skrives.
+LLM_STREAMING = _env_flag('LLM_STREAMING', True)
+
+# Maks antall callback-eventer som holdes per forespørsel i tokensporingen (ringbuffer).
+# 0 betyr ingen grense.
+TOKEN_TRACE_MAX_STEPS = int(os.getenv('TOKEN_TRACE_MAX_STEPS', '2000'))
+
+# Forhåndsberegnet skjemakontekst i agentprompten i stedet for verktøykall
+# til sql_db_list_tables/sql_db_schema.
+SCHEMA_CONTEXT_ENABLED = _env_flag('SCHEMA_CONTEXT_ENABLED', True)
+SCHEMA_CONTEXT_SAMPLE_ROWS = int(os.getenv('SCHEMA_CONTEXT_SAMPLE_ROWS', '3'))
+SCHEMA_CONTEXT_MAX_VALUES = int(os.getenv('SCHEMA_CONTEXT_MAX_VALUES', '10'))
+
+# Hurtigsti: ett LLM-kall genererer SQL fra skjemakonteksten, som valideres og
+# kjøres direkte. ReAct-agenten brukes bare hvis validering eller kjøring feiler.
+SQL_FAST_PATH_ENABLED = _env_flag('SQL_FAST_PATH_ENABLED', True)
+
+# Indeksrådgiver (python -m backend.index_advisor). Foreslåtte indekser opprettes
+# bare med --apply, og da i en administrert kopi av SQLite-databasen.
+INDEX_ADVISOR_DB_PATH = os.getenv('INDEX_ADVISOR_DB_PATH', os.path.join(CACHE_DIR, 'indexed', 'data-indexed.db'))
+INDEX_ADVISOR_MAX_COLUMNS = int(os.getenv('INDEX_ADVISOR_MAX_COLUMNS', '4'))
+
+# Forhåndsaggregerte rollup-tabeller for ekom, lagret i en egen SQLite-fil.
+# COUNT/GROUP BY-spørringer som kan besvares fra en rollup skrives om før kjøring.
+# ROLLUP_DIMENSION_SETS kan angi faste kombinasjoner, f.eks. "tilbyder,teknologi;hovedkategori".
+ROLLUPS_ENABLED = _env_flag('ROLLUPS_ENABLED', True)
+ROLLUP_SOURCE_TABLE = os.getenv('ROLLUP_SOURCE_TABLE', 'ekom')
+ROLLUP_DIMENSIONS = [
+    d.strip() for d in os.getenv(
+        'ROLLUP_DIMENSIONS', 'tilbyder,hovedkategori,delkategori,teknologi,hovedgruppe,markedssegment'
+    ).split(',') if d.strip()
+]
+ROLLUP_DIMENSION_SETS = [
+    [d.strip() for d in group.split(',') if d.strip()]
+    for group in os.getenv('ROLLUP_DIMENSION_SETS', '').split(';') if group.strip()
+]
+ROLLUP_MAX_TABLES = int(os.getenv('ROLLUP_MAX_TABLES', '8'))
+ROLLUP_DB_PATH = os.getenv('ROLLUP_DB_PATH', os.path.join(CACHE_DIR, 'rollups.db'))
+# Kjør også mot basistabellen og sammenlign (for feilsøking, dobler kjøretiden).
+ROLLUP_VERIFY = _env_flag('ROLLUP_VERIFY', False)
+
+# Store resultater vises side for side: hver side hentes med LIMIT/OFFSET fra SQL,
+# med et forhåndshentet vindu på RESULT_PREFETCH_PAGES sider. Sortering og filter
+# legges inn i SQL-en.
+RESULT_PAGER_THRESHOLD_ROWS = int(os.getenv('RESULT_PAGER_THRESHOLD_ROWS', '1000'))
+RESULT_PAGE_SIZE = int(os.getenv('RESULT_PAGE_SIZE', '100'))
+RESULT_PREFETCH_PAGES = int(os.getenv('RESULT_PREFETCH_PAGES', '5'))
+
+# Eksport av resultater (CSV, Parquet, Excel) lages først når brukeren trykker last ned,
+# og kodes EXPORT_CHUNK_ROWS rader om gangen.
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '10000'))
+
+# Resultatlager: DataFrame og agentsteg for hver melding skrives til disk (Arrow IPC)
+# i én mappe per økt, og meldingen holder bare et håndtak. De siste resultatene
+# holdes i minnet, og øktmapper eldre enn RESULT_STORE_MAX_AGE_HOURS slettes.
+RESULT_STORE_ENABLED = _env_flag('RESULT_STORE_ENABLED', True)
+RESULT_STORE_DIR = os.getenv('RESULT_STORE_DIR', os.path.join(CACHE_DIR, 'results'))
+RESULT_STORE_MEMORY_ITEMS = int(os.getenv('RESULT_STORE_MEMORY_ITEMS', '8'))
+RESULT_STORE_MAX_AGE_HOURS = float(os.getenv('RESULT_STORE_MAX_AGE_HOURS', '24'))
+
+# Chatloggen tegner bare de siste CHAT_FULL_RENDER_MESSAGES meldingene fullt ut;
+# eldre meldinger vises som sammendrag som kan utvides.
+CHAT_FULL_RENDER_MESSAGES = int(os.getenv('CHAT_FULL_RENDER_MESSAGES', '6'))
+
+# Prosessfelles metrikker i Prometheus' tekstformat. Sett METRICS_HTTP_PORT for et
+# lokalt /metrics-endepunkt, og/eller METRICS_FILE_PATH for fil til node_exporters
+# textfile-collector.
+METRICS_HTTP_HOST = os.getenv('METRICS_HTTP_HOST', '127.0.0.1')
+METRICS_HTTP_PORT = int(os.getenv('METRICS_HTTP_PORT', '0'))
+METRICS_FILE_PATH = os.getenv('METRICS_FILE_PATH') or None
+METRICS_FILE_INTERVAL_SECONDS = float(os.getenv('METRICS_FILE_INTERVAL_SECONDS', '15'))
+
+# Varig logg over ressursbruk per forespørsel (tokens, gCO₂e, svartid, SQL), til
+# kostnads- og gjennomstrømningsoversikten på admin-siden.
+USAGE_LEDGER_ENABLED = _env_flag('USAGE_LEDGER_ENABLED', True)
+USAGE_LEDGER_PATH = os.getenv('USAGE_LEDGER_PATH', os.path.join(FEEDBACK_LOG_DIR, 'usage_ledger.db'))
+
+# Tilbakemeldinger lagres også i SQLite (indeksert, med fulltekstsøk) som admin-siden
+# søker i. JSONL-filen over beholdes som revisjonslogg.
+FEEDBACK_STORE_ENABLED = _env_flag('FEEDBACK_STORE_ENABLED', True)
+FEEDBACK_STORE_PATH = os.getenv('FEEDBACK_STORE_PATH', os.path.join(FEEDBACK_LOG_DIR, 'feedback.db'))
+FEEDBACK_ADMIN_PAGE_SIZE = int(os.getenv('FEEDBACK_ADMIN_PAGE_SIZE', '50'))
+
+# Tilbakemeldinger skrives av én bakgrunnstråd per prosess, i batcher. FSYNC er
+# "batch", "rotate" eller "never". Loggen roteres ved FEEDBACK_LOG_MAX_BYTES
+# (0 = aldri) og/eller ved datoskifte, og roterte segmenter gzip-komprimeres.
+FEEDBACK_WRITER_ENABLED = _env_flag('FEEDBACK_WRITER_ENABLED', True)
+FEEDBACK_WRITER_FLUSH_SECONDS = float(os.getenv('FEEDBACK_WRITER_FLUSH_SECONDS', '1'))
+FEEDBACK_WRITER_BATCH_SIZE = int(os.getenv('FEEDBACK_WRITER_BATCH_SIZE', '100'))
+FEEDBACK_WRITER_MAX_QUEUE = int(os.getenv('FEEDBACK_WRITER_MAX_QUEUE', '10000'))
+FEEDBACK_WRITER_FSYNC = os.getenv('FEEDBACK_WRITER_FSYNC', 'batch')
+FEEDBACK_LOG_MAX_BYTES = int(os.getenv('FEEDBACK_LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+FEEDBACK_LOG_ROTATE_DAILY = _env_flag('FEEDBACK_LOG_ROTATE_DAILY', False)
+
+# Visualiseringsforslag: en regelbasert anbefaling velger graf ut fra datatyper og
+# kolonnenavn, og LLM-en spørres bare for tvetydige resultatformer. LLM-forslagene
+# caches per resultatform (kolonnenavn og datatyper).
+CHART_RECOMMENDER_ENABLED = _env_flag('CHART_RECOMMENDER_ENABLED', True)
+CHART_SUGGESTION_CACHE_ENABLED = _env_flag('CHART_SUGGESTION_CACHE_ENABLED', True)
+CHART_SUGGESTION_CACHE_PATH = os.getenv('CHART_SUGGESTION_CACHE_PATH', os.path.join(CACHE_DIR, 'chart_suggestions.db'))
+CHART_SUGGESTION_CACHE_MAX_ENTRIES = int(os.getenv('CHART_SUGGESTION_CACHE_MAX_ENTRIES', '1000'))
@@ -1,7 +1,35 @@
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
 from langchain_community.utilities import SQLDatabase
-from backend.config import DATABASE_URI
-from backend.llm_client import llm
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from decimal import Decimal
+from threading import Lock
+from typing import Any, Callable, Iterator
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+import pandas as pd
+from backend.config import (
+    DATABASE_URI,
+    FETCH_BATCH_SIZE,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_POOL_RECYCLE_SECONDS,
+    DB_READ_ONLY,
+    SQLITE_WAL,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE_KB,
+)
+from backend.query_governor import query_governor
+from backend.metrics import SQL_LATENCY, SQL_QUERIES, SQL_ROWS
 
 import logging
 
@@ -11,15 +39,423 @@ TABLES = [
     'ekom', 'femsiffer'
 ]
 
+
+@dataclass
+class QueryResult:
+    """
+    Typet, kolonnevis resultat fra én SQL-spørring.
+
+    `column_data` har én liste per kolonne, i samme rekkefølge som `columns`.
+    """
+    sql: str
+    columns: list[str]
+    column_data: list[list[Any]]
+    elapsed_ms: float
+    truncated: bool = False
+    captured_at: float = field(default_factory=time.time)
+    rewritten_sql: str | None = None
+    truncation_reason: str | None = None
+
+    @property
+    def row_count(self) -> int:
+        return len(self.column_data[0]) if self.column_data else 0
+
+    def iter_rows(self) -> Iterator[tuple[Any, ...]]:
+        return zip(*self.column_data)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Bygger en DataFrame med datatyper utledet per kolonne."""
+        df = pd.DataFrame({i: _to_typed_array(values) for i, values in enumerate(self.column_data)})
+        df.columns = self.columns
+        return df
+
+
+def _to_typed_array(values: list[Any]) -> Any:
+    """
+    Utleder en pandas-array for én kolonne. Heltall og bool med NULL får nullable
+    typer i stedet for float/object, og Decimal (f.eks. Postgres NUMERIC) blir Float64.
+    """
+    non_null = [v for v in values if v is not None]
+    if non_null and all(isinstance(v, Decimal) for v in non_null):
+        return pd.array([float(v) if v is not None else None for v in values], dtype="Float64")
+    try:
+        return pd.array(values)
+    except (TypeError, ValueError):
+        return pd.array(values, dtype=object)
+
+
+class DbTimer:
+    """Summerer tiden brukt i fetch_result innenfor en `track_db_time`-blokk."""
+
+    __slots__ = ("elapsed_ms", "queries")
+
+    def __init__(self) -> None:
+        self.elapsed_ms = 0.0
+        self.queries = 0
+
+
+_db_timer: ContextVar[DbTimer | None] = ContextVar("db_timer", default=None)
+
+
+@contextmanager
+def track_db_time() -> Iterator[DbTimer]:
+    """
+    Måler samlet databasetid for alle fetch_result-kall i blokken (i samme tråd/kontekst),
+    også spørringer som agentens verktøy kjører.
+    """
+    timer = DbTimer()
+    token = _db_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _db_timer.reset(token)
+
+
+def _add_db_time(elapsed_ms: float) -> None:
+    timer = _db_timer.get()
+    if timer is not None:
+        timer.elapsed_ms += elapsed_ms
+        timer.queries += 1
+
+
+QueryInterceptor = Callable[[str, "int | None"], "QueryResult | None"]
+_query_interceptors: list[QueryInterceptor] = []
+
+
+def register_query_interceptor(interceptor: QueryInterceptor) -> None:
+    """
+    Registrerer en funksjon som får se hver spørring før den kjøres mot databasen
+    (f.eks. omskriving til rollup-tabeller). Returnerer den et QueryResult brukes
+    det i stedet for å kjøre spørringen; None betyr at spørringen kjøres som vanlig.
+    """
+    if interceptor not in _query_interceptors:
+        _query_interceptors.append(interceptor)
+
+
+def fetch_result(
+    sql_query: str,
+    max_rows: int | None = None,
+    batch_size: int = FETCH_BATCH_SIZE,
+    target_engine: Any = None,
+    intercept: bool = True,
+) -> QueryResult:
+    """
+    Kjører en SQL-spørring og bygger et kolonnevis resultat direkte fra cursoren,
+    uten å gå via strengrepresentasjonen til db.run.
+
+    Args:
+        sql_query (str): SQL-spørringen som skal kjøres.
+        max_rows (int | None): Maks antall rader som hentes. Hvis spørringen gir
+                               flere rader settes `truncated` på resultatet. Alle
+                               spørringer er i tillegg begrenset av query_governor
+                               (tidsgrense, QUERY_MAX_ROWS og QUERY_MAX_BYTES).
+        batch_size (int): Antall rader per fetchmany-kall.
+        target_engine (Engine | None): Kjør mot en annen database enn hoveddatabasen.
+        intercept (bool): La registrerte interceptorer svare i stedet (standard).
+
+    Returns:
+        QueryResult: Kolonnenavn, kolonnedata og kjøretid.
+    """
+    if intercept:
+        for interceptor in _query_interceptors:
+            intercepted = interceptor(sql_query, max_rows)
+            if intercepted is not None:
+                return intercepted
+
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        truncation_reason = None
+        row_limit, row_limit_reason = query_governor.row_limit(max_rows)
+        byte_budget = query_governor.max_bytes
+        size_bytes = 0
+        with (target_engine or engine).connect() as connection, \
+                query_governor.govern(connection, sql_query) as governed:
+            cursor = connection.execution_options(stream_results=True).execute(text(sql_query))
+            if not cursor.returns_rows:
+                outcome = "ok"
+                return QueryResult(sql_query, [], [], (time.perf_counter() - started) * 1000)
+            columns = list(cursor.keys())
+            column_data: list[list[Any]] = [[] for _ in columns]
+            fetched = 0
+            while True:
+                governed.check()
+                batch = cursor.fetchmany(min(batch_size, row_limit + 1 - fetched))
+                if not batch:
+                    break
+                if fetched + len(batch) > row_limit:
+                    batch = batch[:row_limit - fetched]
+                    truncation_reason = row_limit_reason
+                batch_bytes = _estimate_rows_bytes(batch)
+                if size_bytes + batch_bytes > byte_budget:
+                    keep = 0
+                    while keep < len(batch) and size_bytes + _estimate_rows_bytes(batch[keep:keep + 1]) <= byte_budget:
+                        size_bytes += _estimate_rows_bytes(batch[keep:keep + 1])
+                        keep += 1
+                    batch = batch[:keep]
+                    truncation_reason = "byte_budget"
+                else:
+                    size_bytes += batch_bytes
+                for values, column_value in zip(column_data, zip(*batch)):
+                    values.extend(column_value)
+                fetched += len(batch)
+                if truncation_reason:
+                    break
+            cursor.close()
+        outcome = "truncated" if truncation_reason else "ok"
+    finally:
+        _add_db_time((time.perf_counter() - started) * 1000)
+        SQL_QUERIES.inc(outcome=outcome)
+        SQL_LATENCY.observe(time.perf_counter() - started)
+    SQL_ROWS.observe(fetched)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if truncation_reason in ("row_budget", "byte_budget"):
+        query_governor.record_truncation(sql_query, truncation_reason, fetched, size_bytes)
+    logger.info(f"SQL kjørt på {elapsed_ms:.1f} ms, {fetched} rader (avkortet: {truncation_reason or False})")
+    return QueryResult(
+        sql_query, columns, column_data, elapsed_ms,
+        truncated=truncation_reason is not None, truncation_reason=truncation_reason,
+    )
+
+
+def stream_result_chunks(
+    sql_query: str,
+    chunk_rows: int = FETCH_BATCH_SIZE,
+    target_engine: Any = None,
+) -> Iterator[QueryResult]:
+    """
+    Kjører en SQL-spørring og gir resultatet bit for bit fra én cursor, så bare én
+    bit ligger i minnet om gangen. Går utenom interceptorene og resultatcachen.
+
+    Tidsgrensen og QUERY_MAX_ROWS fra query_governor gjelder som for fetch_result.
+    Byte-budsjettet gjelder ikke, siden bitene ikke holdes samlet.
+
+    Args:
+        sql_query (str): SQL-spørringen som skal kjøres.
+        chunk_rows (int): Maks antall rader per bit.
+        target_engine (Engine | None): Kjør mot en annen database enn hoveddatabasen.
+
+    Yields:
+        QueryResult: Én bit av resultatet. Minst én bit (eventuelt tom) gis alltid,
+        så kolonnenavnene er kjent; den siste har `truncated` satt hvis radgrensen ble nådd.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    fetched = 0
+    truncation_reason = None
+    row_limit, row_limit_reason = query_governor.row_limit(None)
+    try:
+        with (target_engine or engine).connect() as connection, \
+                query_governor.govern(connection, sql_query) as governed:
+            cursor = connection.execution_options(stream_results=True).execute(text(sql_query))
+            columns = list(cursor.keys()) if cursor.returns_rows else []
+            yielded = False
+            while cursor.returns_rows:
+                governed.check()
+                batch = cursor.fetchmany(min(chunk_rows, row_limit + 1 - fetched))
+                if not batch:
+                    break
+                if fetched + len(batch) > row_limit:
+                    batch = batch[:row_limit - fetched]
+                    truncation_reason = row_limit_reason
+                fetched += len(batch)
+                yield QueryResult(
+                    sql_query, columns, [list(values) for values in zip(*batch)] or [[] for _ in columns],
+                    (time.perf_counter() - started) * 1000,
+                    truncated=truncation_reason is not None, truncation_reason=truncation_reason,
+                )
+                yielded = True
+                if truncation_reason:
+                    break
+            cursor.close()
+            if not yielded:
+                yield QueryResult(sql_query, columns, [[] for _ in columns], (time.perf_counter() - started) * 1000)
+        outcome = "truncated" if truncation_reason else "ok"
+    finally:
+        _add_db_time((time.perf_counter() - started) * 1000)
+        SQL_QUERIES.inc(outcome=outcome)
+        SQL_LATENCY.observe(time.perf_counter() - started)
+    SQL_ROWS.observe(fetched)
+    if truncation_reason == "row_budget":
+        query_governor.record_truncation(sql_query, truncation_reason, fetched, 0)
+    logger.info(
+        f"SQL strømmet på {(time.perf_counter() - started) * 1000:.1f} ms, {fetched} rader "
+        f"(avkortet: {truncation_reason or False})"
+    )
+
+
+def _estimate_rows_bytes(rows: list[Any]) -> int:
+    """Omtrentlig minnebruk for rader fra cursoren (summen av verdienes størrelse)."""
+    return sum(sys.getsizeof(value) for row in rows for value in row)
+
+
+_schema_fingerprint_cache: dict[str, Any] = {"value": None, "checked_at": 0.0}
+SCHEMA_FINGERPRINT_TTL_SECONDS = 60
+
+
+def get_schema_fingerprint() -> str:
+    """
+    Returnerer en hash av kolonnenavn og -typer for tabellene i TABLES.
+
+    Verdien caches i SCHEMA_FINGERPRINT_TTL_SECONDS så den kan brukes i cachenøkler
+    uten å inspisere databasen for hvert spørsmål.
+    """
+    now = time.time()
+    cached = _schema_fingerprint_cache["value"]
+    if cached is not None and now - _schema_fingerprint_cache["checked_at"] < SCHEMA_FINGERPRINT_TTL_SECONDS:
+        return cached
+    inspector = inspect(engine)
+    schema = {
+        table: [(col["name"], str(col["type"])) for col in inspector.get_columns(table)]
+        for table in TABLES
+    }
+    fingerprint = hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    _schema_fingerprint_cache.update(value=fingerprint, checked_at=now)
+    return fingerprint
+
+
+class PoolStats:
+    """Teller tilkoblingsuttak og hvor lenge de ventet på poolen."""
+
+    def __init__(self, window: int = 1000) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self._recent_waits: deque[float] = deque(maxlen=window)
+        self._lock = Lock()
+
+    def record_wait(self, wait_ms: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self._recent_waits.append(wait_ms)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            recent = sorted(self._recent_waits)
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": self.total_wait_ms / self.checkouts if self.checkouts else 0.0,
+                # Nærmeste rang i de siste ventetidene, så p95 aldri blir større enn maks.
+                "p95_wait_ms": recent[min(int(len(recent) * 0.95), len(recent) - 1)] if recent else 0.0,
+                "max_wait_ms": self.max_wait_ms,
+            }
+
+
+pool_stats = PoolStats()
+
+
+class MonitoredQueuePool(QueuePool):
+    """QueuePool som måler tiden det tar å få en tilkobling (venting på ledig plass + eventuell oppkobling)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            pool_stats.record_timeout()
+            logger.warning(f"Timed out waiting for a database connection after {self._timeout} s: {self.status()}")
+            raise
+        finally:
+            pool_stats.record_wait((time.perf_counter() - started) * 1000)
+
+
+def _enable_sqlite_wal(path: str) -> None:
+    """Setter journal_mode=WAL i databasefilen (varig innstilling, krever skrivetilgang én gang)."""
+    try:
+        with sqlite3.connect(path) as conn:
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        logger.info(f"SQLite journal_mode for {path}: {mode}")
+    except sqlite3.Error as e:
+        logger.warning(f"Kunne ikke sette WAL for {path}: {e}")
+
+
+def build_engine(database_uri: str) -> Engine:
+    """
+    Bygger en SQLAlchemy-engine tilpasset en chat-arbeidslast som bare leser.
+
+    - SQLite-fil: åpnes skrivebeskyttet (mode=ro) med PRAGMA query_only, mmap_size
+      og cache_size på hver tilkobling, og eventuelt WAL (SQLITE_WAL).
+    - Andre databaser (Postgres): pool med pre-ping, recycle og lesetransaksjoner.
+
+    Begge bruker MonitoredQueuePool, så get_pool_stats() kan vise ventetid på tilkoblinger.
+    """
+    url = make_url(database_uri)
+    pool_kwargs = {
+        "poolclass": MonitoredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+    }
+
+    if url.get_backend_name() == "sqlite":
+        database = url.database or ""
+        if not database or database == ":memory:" or database.startswith("file::memory:"):
+            return create_engine(url)
+        path = database.removeprefix("file:").split("?")[0]
+        if SQLITE_WAL:
+            _enable_sqlite_wal(path)
+        if DB_READ_ONLY:
+            url = url.set(database=f"file:{path}", query={**url.query, "mode": "ro", "uri": "true"})
+        sqlite_engine = create_engine(url, connect_args={"check_same_thread": False}, **pool_kwargs)
+
+        @event.listens_for(sqlite_engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+            if DB_READ_ONLY:
+                cursor.execute("PRAGMA query_only = ON")
+            cursor.close()
+
+        return sqlite_engine
+
+    connect_args = {}
+    if DB_READ_ONLY and url.get_backend_name() == "postgresql":
+        connect_args["options"] = "-c default_transaction_read_only=on"
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        connect_args=connect_args,
+        **pool_kwargs,
+    )
+
+
+def get_pool_stats() -> dict[str, Any]:
+    """
+    Status for tilkoblingspoolen: hvor mange tilkoblinger som er i bruk, overflow
+    og ventetid for å få en tilkobling. Lang ventetid betyr at poolen er flaskehalsen,
+    ikke selve spørringene.
+    """
+    pool = engine.pool
+    stats: dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    stats.update(pool_stats.snapshot())
+    return stats
+
+
 try:
-    db = SQLDatabase.from_uri(
-    DATABASE_URI,
+    engine = build_engine(DATABASE_URI)
+    db = SQLDatabase(
+    engine,
     include_tables=TABLES
     )
     logger.info('Database koblet til: %s', DATABASE_URI)
-
-    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-    logger.info("Toolkit bygget")
 except Exception as e:
     logger.exception("Database tilkobling feilet: %s", e)
     raise e 
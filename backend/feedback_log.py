@@ -0,0 +1,22 @@
+import glob
+import gzip
+import os
+from typing import IO
+
+from backend.config import FEEDBACK_LOG_FILE
+
+
+def feedback_log_segments(path: str = FEEDBACK_LOG_FILE) -> list[str]:
+    """Roterte (gzip-komprimerte) segmenter av loggen, eldste først, og til slutt den aktive filen."""
+    stem, extension = os.path.splitext(path)
+    segments = sorted(glob.glob(f"{glob.escape(stem)}-*{extension}.gz"))
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+
+def open_log_segment(path: str) -> IO[str]:
+    """Åpner et loggsegment for lesing, gzip-komprimert eller ikke."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
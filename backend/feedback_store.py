@@ -0,0 +1,347 @@
+"""
+Indeksert lager for tilbakemeldinger i SQLite, med fulltekstsøk (FTS5) i spørsmål og svar.
+
+JSONL-filen (FEEDBACK_LOG_FILE) skrives fortsatt og er revisjonsloggen. Lageret
+er det admin-siden filtrerer og søker i. Eksisterende JSONL-filer importeres én
+gang når lageret opprettes, og kan importeres manuelt:
+
+    python -m backend.feedback_store --import logs/feedback_log.jsonl
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+from backend.config import (
+    FEEDBACK_LOG_FILE,
+    FEEDBACK_STORE_ENABLED,
+    FEEDBACK_STORE_PATH,
+)
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Feltene som får egne kolonner; resten (agent_steps, timings osv.) ligger i extra_json.
+COLUMNS = (
+    "timestamp", "feedback_type", "feedback_score_value", "user_query", "assistant_response",
+    "message_id", "preceding_user_message_id", "engine", "latency_ms", "total_tokens",
+)
+LIST_COLUMNS = ("id",) + COLUMNS
+SORT_COLUMNS = ("ts", "feedback_type", "engine", "latency_ms", "total_tokens")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    feedback_type TEXT,
+    feedback_score_value INTEGER,
+    user_query TEXT,
+    assistant_response TEXT,
+    message_id TEXT,
+    preceding_user_message_id TEXT,
+    engine TEXT,
+    latency_ms REAL,
+    total_tokens INTEGER,
+    extra_json TEXT,
+    UNIQUE (message_id, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_ts ON feedback(ts);
+CREATE INDEX IF NOT EXISTS idx_feedback_type_ts ON feedback(feedback_type, ts);
+CREATE TABLE IF NOT EXISTS feedback_meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS feedback_fts USING fts5(
+    user_query, assistant_response, content='feedback', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS feedback_fts_insert AFTER INSERT ON feedback BEGIN
+    INSERT INTO feedback_fts(rowid, user_query, assistant_response)
+    VALUES (new.id, new.user_query, new.assistant_response);
+END;
+CREATE TRIGGER IF NOT EXISTS feedback_fts_delete AFTER DELETE ON feedback BEGIN
+    INSERT INTO feedback_fts(feedback_fts, rowid, user_query, assistant_response)
+    VALUES ('delete', old.id, old.user_query, old.assistant_response);
+END;
+"""
+
+
+@dataclass(frozen=True)
+class FeedbackFilter:
+    """Filtrene fra admin-siden. Tidene er Unix-tid i UTC; None betyr ingen grense."""
+
+    start_ts: float | None = None
+    end_ts: float | None = None
+    feedback_types: tuple[str, ...] | None = None
+    search: str | None = None
+
+
+def _to_epoch(timestamp: Any) -> float:
+    parsed = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _fts_query(search: str) -> str | None:
+    """Gjør søketeksten om til en FTS5-spørring der alle ordene må finnes (som prefiks)."""
+    terms = re.findall(r"\w+", search, flags=re.UNICODE)
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+
+class FeedbackStore:
+    """
+    Tilbakemeldinger i SQLite, med indekser på tidspunkt og type og et FTS5-indeks
+    over spørsmål og svar. Filtre, søk og tellinger kjøres som indekserte spørringer,
+    og bare radene som vises hentes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            try:
+                conn.executescript(_FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError as e:
+                logger.warning(f"FTS5 is not available in this SQLite build, falling back to LIKE search: {e}")
+                self.has_fts = False
+        logger.info(f"Feedback store opened at {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _row_values(record: dict[str, Any]) -> tuple:
+        extra = {k: v for k, v in record.items() if k not in COLUMNS}
+        return (
+            _to_epoch(record["timestamp"]),
+            *(record.get(column) for column in COLUMNS),
+            json.dumps(extra, ensure_ascii=False, default=str) if extra else None,
+        )
+
+    def _insert(self, conn: sqlite3.Connection, records: list[dict[str, Any]]) -> int:
+        placeholders = ", ".join("?" * (len(COLUMNS) + 2))
+        return conn.executemany(
+            f"INSERT OR IGNORE INTO feedback (ts, {', '.join(COLUMNS)}, extra_json) VALUES ({placeholders})",
+            [self._row_values(record) for record in records],
+        ).rowcount
+
+    def add(self, record: dict[str, Any]) -> None:
+        """Lagrer én tilbakemelding (samme dict som skrives til JSONL-filen)."""
+        self.add_many([record])
+
+    def add_many(self, records: list[dict[str, Any]]) -> int:
+        """Lagrer flere tilbakemeldinger i én transaksjon. Returnerer antall nye."""
+        with closing(self._connect()) as conn, conn:
+            return self._insert(conn, records)
+
+    def import_jsonl(self, path: str, batch_size: int = 500) -> int:
+        """
+        Importerer en JSONL-fil (også gzip-komprimerte, roterte segmenter). Linjer som
+        allerede finnes (samme message_id og timestamp) hoppes over, så importen kan
+        kjøres flere ganger.
+
+        Returns:
+            int: Antall nye tilbakemeldinger.
+        """
+        imported = 0
+        batch: list[dict[str, Any]] = []
+        opener = gzip.open if path.endswith(".gz") else open
+        with closing(self._connect()) as conn, conn, opener(path, "rt", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    _to_epoch(record["timestamp"])
+                except (json.JSONDecodeError, KeyError, ValueError) as e:
+                    logger.warning(f"Skipping line {line_number} in {path}: {e}")
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    imported += self._insert(conn, batch)
+                    batch = []
+            if batch:
+                imported += self._insert(conn, batch)
+            conn.execute(
+                "INSERT OR REPLACE INTO feedback_meta(name, value) VALUES (?, ?)",
+                (f"imported:{os.path.abspath(path)}", datetime.now(timezone.utc).isoformat()),
+            )
+        logger.info(f"Imported {imported} feedback records from {path}")
+        return imported
+
+    def import_jsonl_once(self, path: str) -> int:
+        """Importerer JSONL-filen hvis den finnes og ikke er importert før."""
+        if not os.path.exists(path):
+            return 0
+        with closing(self._connect()) as conn:
+            done = conn.execute(
+                "SELECT 1 FROM feedback_meta WHERE name = ?", (f"imported:{os.path.abspath(path)}",)
+            ).fetchone()
+        return 0 if done else self.import_jsonl(path)
+
+    def _where(self, filters: FeedbackFilter) -> tuple[str, list[Any]]:
+        clauses, params = [], []
+        if filters.start_ts is not None:
+            clauses.append("feedback.ts >= ?")
+            params.append(filters.start_ts)
+        if filters.end_ts is not None:
+            clauses.append("feedback.ts <= ?")
+            params.append(filters.end_ts)
+        if filters.feedback_types is not None:
+            if not filters.feedback_types:
+                clauses.append("0")
+            else:
+                clauses.append(f"feedback.feedback_type IN ({', '.join('?' * len(filters.feedback_types))})")
+                params.extend(filters.feedback_types)
+        fts_query = _fts_query(filters.search) if filters.search else None
+        if fts_query and self.has_fts:
+            clauses.append("feedback.id IN (SELECT rowid FROM feedback_fts WHERE feedback_fts MATCH ?)")
+            params.append(fts_query)
+        elif fts_query:
+            clauses.append("(feedback.user_query LIKE ? OR feedback.assistant_response LIKE ?)")
+            params.extend([f"%{filters.search}%"] * 2)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, filters: FeedbackFilter = FeedbackFilter()) -> int:
+        where, params = self._where(filters)
+        with closing(self._connect()) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM feedback{where}", params).fetchone()[0]
+
+    @staticmethod
+    def _order_by(sort_column: str, descending: bool) -> str:
+        if sort_column not in SORT_COLUMNS:
+            raise ValueError(f"Kan ikke sortere på {sort_column!r}; gyldige kolonner er {SORT_COLUMNS}.")
+        direction = "DESC" if descending else "ASC"
+        return f" ORDER BY feedback.{sort_column} {direction}, feedback.id {direction}"
+
+    def list_entries(
+        self,
+        filters: FeedbackFilter = FeedbackFilter(),
+        limit: int = 100,
+        offset: int = 0,
+        sort_column: str = "ts",
+        descending: bool = True,
+    ) -> list[dict[str, Any]]:
+        """
+        Henter én side med tilbakemeldinger (uten agentsteg), sortert i SQL.
+
+        Args:
+            filters (FeedbackFilter): Tid, type og søketekst.
+            limit (int): Maks antall rader.
+            offset (int): Antall rader som hoppes over.
+            sort_column (str): En av SORT_COLUMNS. Standard er tidspunkt.
+            descending (bool): Synkende rekkefølge (nyeste først for tidspunkt).
+
+        Returns:
+            list[dict]: Radene, med 'id' som kan sendes til get().
+        """
+        where, params = self._where(filters)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(LIST_COLUMNS)} FROM feedback{where}"
+                f"{self._order_by(sort_column, descending)} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def position_of(
+        self,
+        message_id: str,
+        filters: FeedbackFilter = FeedbackFilter(),
+        sort_column: str = "ts",
+        descending: bool = True,
+    ) -> int | None:
+        """
+        Posisjonen (fra 0) til den nyeste tilbakemeldingen for `message_id` i den
+        filtrerte og sorterte listen, så visningen kan hoppe til riktig side.
+
+        Returns:
+            int | None: Posisjonen, eller None hvis meldingen ikke matcher filtrene.
+        """
+        where, params = self._where(filters)
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT MIN(position) FROM ("
+                f"SELECT feedback.message_id, ROW_NUMBER() OVER ({self._order_by(sort_column, descending).strip()}) - 1 "
+                f"AS position FROM feedback{where}) WHERE message_id = ?",
+                params + [message_id],
+            ).fetchone()
+        return row[0]
+
+    def get(self, feedback_id: int) -> dict[str, Any] | None:
+        """Hele tilbakemeldingen, inkludert agentsteg og andre felt fra extra_json."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(LIST_COLUMNS)}, extra_json FROM feedback WHERE id = ?", (feedback_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        extra = record.pop("extra_json")
+        if extra:
+            record.update(json.loads(extra))
+        return record
+
+    def type_counts(self, filters: FeedbackFilter = FeedbackFilter()) -> dict[str, int]:
+        where, params = self._where(filters)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT feedback_type, COUNT(*) FROM feedback{where} GROUP BY feedback_type", params
+            ).fetchall()
+        return {row[0]: row[1] for row in rows if row[0] is not None}
+
+    def daily_counts(self, filters: FeedbackFilter = FeedbackFilter()) -> list[dict[str, Any]]:
+        """Antall tilbakemeldinger per dag (UTC) og type."""
+        where, params = self._where(filters)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT date(feedback.ts, 'unixepoch') AS day, feedback_type, COUNT(*) AS count "
+                f"FROM feedback{where} GROUP BY day, feedback_type ORDER BY day",
+                params,
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def time_bounds(self) -> tuple[float, float] | None:
+        """Første og siste tidspunkt i lageret (Unix-tid), via indeksen på ts."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT MIN(ts), MAX(ts) FROM feedback").fetchone()
+        return None if row[0] is None else (row[0], row[1])
+
+
+feedback_store = FeedbackStore(FEEDBACK_STORE_PATH) if FEEDBACK_STORE_ENABLED else None
+
+if feedback_store is not None:
+    try:
+        feedback_store.import_jsonl_once(FEEDBACK_LOG_FILE)
+    except Exception as e:
+        logger.error(f"Kunne ikke importere {FEEDBACK_LOG_FILE} til feedback-lageret: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Importer tilbakemeldinger fra JSONL til feedback-lageret.")
+    parser.add_argument("--import", dest="paths", nargs="+", default=[FEEDBACK_LOG_FILE], help="JSONL-filer som skal importeres.")
+    args = parser.parse_args()
+    if feedback_store is None:
+        print("Feedback-lageret er slått av (FEEDBACK_STORE_ENABLED=false).")
+    else:
+        for path in args.paths:
+            print(f"{path}: {feedback_store.import_jsonl(path)} nye tilbakemeldinger")
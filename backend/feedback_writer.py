@@ -0,0 +1,242 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import IO, Any, Callable
+
+from backend.config import (
+    FEEDBACK_LOG_FILE,
+    FEEDBACK_WRITER_ENABLED,
+    FEEDBACK_WRITER_FLUSH_SECONDS,
+    FEEDBACK_WRITER_BATCH_SIZE,
+    FEEDBACK_WRITER_MAX_QUEUE,
+    FEEDBACK_WRITER_FSYNC,
+    FEEDBACK_LOG_MAX_BYTES,
+    FEEDBACK_LOG_ROTATE_DAILY,
+)
+from backend.feedback_store import feedback_store
+from backend.metrics import registry
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ("batch", "rotate", "never")
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+WRITTEN = registry.counter("sqlchat_feedback_records_written_total", "Tilbakemeldinger skrevet til JSONL-loggen.")
+DROPPED = registry.counter("sqlchat_feedback_records_dropped_total", "Tilbakemeldinger som ikke kom inn i skrivekøen.")
+
+
+class FeedbackWriter:
+    """
+    Prosessfelles skriver for tilbakemeldingsloggen. Øktene legger poster i en kø,
+    og én bakgrunnstråd skriver dem i batcher, så linjer fra samtidige økter ikke
+    blandes og brukerens rerun ikke venter på disken.
+
+    Batchen skrives når det har gått `flush_seconds` eller det ligger `batch_size`
+    poster i køen. Filen roteres når den blir større enn `max_bytes` eller (med
+    `rotate_daily`) når datoen skifter, og det roterte segmentet gzip-komprimeres.
+    `fsync` er "batch" (etter hver batch), "rotate" (bare før rotering) eller "never".
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_seconds: float,
+        batch_size: int,
+        max_queue: int,
+        fsync: str,
+        max_bytes: int,
+        rotate_daily: bool,
+        on_batch_written: Callable[[list[dict[str, Any]]], None] | None = None,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"FEEDBACK_WRITER_FSYNC må være en av {FSYNC_POLICIES}, fikk {fsync!r}")
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.on_batch_written = on_batch_written
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue(maxsize=max_queue)
+        self._file: IO[str] | None = None
+        self._file_day: str | None = None
+        self._stopped = threading.Event()
+        self.batches_written = 0
+        self.records_written = 0
+        self.rotations = 0
+        self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+        self._thread.start()
+        registry.gauge(
+            "sqlchat_feedback_queue_depth", "Tilbakemeldinger som venter på å bli skrevet.", function=self.queue_depth
+        )
+
+    def submit(self, record: dict[str, Any], timeout: float = 1.0) -> bool:
+        """
+        Legger en tilbakemelding i skrivekøen.
+
+        Args:
+            record (dict): Posten som skal skrives som én JSON-linje.
+            timeout (float): Hvor lenge det ventes hvis køen er full.
+
+        Returns:
+            bool: False hvis skriveren er stoppet eller køen fortsatt var full.
+        """
+        if self._stopped.is_set():
+            DROPPED.inc()
+            logger.error(f"Feedback writer is stopped, dropping record for message_id: {record.get('message_id')}")
+            return False
+        try:
+            self._queue.put(record, timeout=timeout)
+        except queue.Full:
+            DROPPED.inc()
+            logger.error(f"Feedback queue is full, dropping record for message_id: {record.get('message_id')}")
+            return False
+        return True
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: list[dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"Could not write {len(batch)} feedback records to {self.path}: {e}", exc_info=True)
+        # Poster som kom inn etter stoppsignalet skrives også.
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                remaining.append(item)
+        if remaining:
+            self._write_batch(remaining)
+        self._close_file(sync=self.fsync != "never")
+
+    def _open_file(self) -> IO[str]:
+        today = datetime.now().strftime("%Y-%m-%d")
+        if self._file is not None and not self._is_current_file():
+            # En annen prosess har rotert filen; skriv videre i den nye.
+            self._close_file(sync=self.fsync != "never")
+        if self._file is not None and self.rotate_daily and today != self._file_day:
+            self._rotate()
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if self.rotate_daily and os.path.exists(self.path):
+                file_day = datetime.fromtimestamp(os.path.getmtime(self.path)).strftime("%Y-%m-%d")
+                if file_day != today and os.path.getsize(self.path) > 0:
+                    self._rotate()
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._file_day = today
+        return self._file
+
+    def _is_current_file(self) -> bool:
+        try:
+            on_disk = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        opened = os.fstat(self._file.fileno())
+        return (on_disk.st_dev, on_disk.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def _write_batch(self, batch: list[dict[str, Any]]) -> None:
+        f = self._open_file()
+        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+        f.flush()
+        if self.fsync == "batch":
+            os.fsync(f.fileno())
+        self.batches_written += 1
+        self.records_written += len(batch)
+        WRITTEN.inc(len(batch))
+        logger.info(f"Wrote {len(batch)} feedback records to {self.path}")
+        if self.on_batch_written is not None:
+            try:
+                self.on_batch_written(batch)
+            except Exception as e:
+                logger.error(f"Feedback batch callback failed: {e}", exc_info=True)
+        if self.max_bytes and f.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _close_file(self, sync: bool) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def _rotate(self) -> None:
+        """Flytter den aktive filen til et tidsstemplet segment og gzip-komprimerer det."""
+        self._close_file(sync=self.fsync != "never")
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        stem, extension = os.path.splitext(self.path)
+        rotated = f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{extension}"
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as source, gzip.open(rotated + ".gz", "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.remove(rotated)
+        self.rotations += 1
+        logger.info(f"Rotated feedback log to {rotated}.gz")
+
+    def flush_and_stop(self, timeout: float = SHUTDOWN_TIMEOUT_SECONDS) -> None:
+        """Skriver det som ligger i køen og stopper tråden. Kalles ved avslutning (atexit)."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Feedback writer did not finish within {timeout} s; {self.queue_depth()} records may be lost.")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth(),
+            "records_written": self.records_written,
+            "batches_written": self.batches_written,
+            "rotations": self.rotations,
+            "running": self._thread.is_alive(),
+        }
+
+
+def _store_batch(batch: list[dict[str, Any]]) -> None:
+    if feedback_store is not None:
+        feedback_store.add_many(batch)
+
+
+feedback_writer = FeedbackWriter(
+    FEEDBACK_LOG_FILE,
+    flush_seconds=FEEDBACK_WRITER_FLUSH_SECONDS,
+    batch_size=FEEDBACK_WRITER_BATCH_SIZE,
+    max_queue=FEEDBACK_WRITER_MAX_QUEUE,
+    fsync=FEEDBACK_WRITER_FSYNC,
+    max_bytes=FEEDBACK_LOG_MAX_BYTES,
+    rotate_daily=FEEDBACK_LOG_ROTATE_DAILY,
+    on_batch_written=_store_batch,
+) if FEEDBACK_WRITER_ENABLED else None
+
+if feedback_writer is not None:
+    atexit.register(feedback_writer.flush_and_stop)
@@ -0,0 +1,476 @@
+"""
+Indeksrådgiver for SQLite-databasene.
+
+Henter SQL som faktisk er kjørt (agentsteg i tilbakemeldingsloggen og
+spørsmålscachen), grupperer spørringene etter form, finner kolonner brukt i
+WHERE, JOIN, GROUP BY og ORDER BY og foreslår indekser. Forslagene testes på en
+kopi av databasen med EXPLAIN QUERY PLAN og tidtaking før og etter.
+
+    python -m backend.index_advisor            # bare rapport
+    python -m backend.index_advisor --apply    # lagrer den indekserte kopien
+
+Originaldatabasen endres aldri. Med --apply skrives kopien med indeksene til
+INDEX_ADVISOR_DB_PATH, som DATABASE_URI deretter kan peke på.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter
+from contextlib import closing
+from dataclasses import dataclass, field
+
+from sqlalchemy.engine import make_url
+
+from backend.config import (
+    DATABASE_URI,
+    FEEDBACK_LOG_FILE,
+    INDEX_ADVISOR_DB_PATH,
+    INDEX_ADVISOR_MAX_COLUMNS,
+)
+from backend.feedback_log import feedback_log_segments, open_log_segment
+from backend.result_cache import canonicalize_sql, tokenize_sql
+from backend.sql_safety import read_only_violation
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUERY_TOOL_NAME = "sql_db_query"
+INDEX_PREFIX = "idx_advisor_"
+
+CLAUSE_KEYWORDS = {"select", "from", "join", "on", "where", "group", "order", "having", "limit", "union"}
+EQUALITY_OPERATORS = {"=", "==", "in", "is"}
+RANGE_OPERATORS = {"<", ">", "<=", ">=", "between", "like", "glob"}
+
+_PIECE_RE = re.compile(r"\w+(?:\.\w+)*|<=|>=|<>|!=|==|[^\w\s]")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+@dataclass
+class QueryShape:
+    """Én spørringsform (SQL med konstanter erstattet av ?) og kolonnene den bruker per tabell."""
+
+    shape: str
+    example_sql: str
+    count: int = 0
+    tables: list[str] = field(default_factory=list)
+    equality_columns: dict[str, list[str]] = field(default_factory=dict)
+    range_columns: dict[str, list[str]] = field(default_factory=dict)
+    group_columns: dict[str, list[str]] = field(default_factory=dict)
+    order_columns: dict[str, list[str]] = field(default_factory=dict)
+    referenced_columns: dict[str, list[str]] = field(default_factory=dict)
+    plan_before: str = ""
+    plan_after: str = ""
+    ms_before: float | None = None
+    ms_after: float | None = None
+
+
+@dataclass
+class IndexCandidate:
+    table: str
+    columns: list[str]
+    shapes: list[str] = field(default_factory=list)
+    estimated_rows_avoided: int = 0
+    used: bool = False
+
+    @property
+    def name(self) -> str:
+        suffix = "_".join(re.sub(r"\W+", "_", c).strip("_").lower() for c in self.columns)
+        return f"{INDEX_PREFIX}{self.table.lower()}_{suffix}"[:120]
+
+    @property
+    def ddl(self) -> str:
+        columns = ", ".join(_quote(c) for c in self.columns)
+        return f"CREATE INDEX IF NOT EXISTS {_quote(self.name)} ON {_quote(self.table)} ({columns})"
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _append_unique(target: dict[str, list[str]], table: str, column: str) -> None:
+    columns = target.setdefault(table, [])
+    if column not in columns:
+        columns.append(column)
+
+
+def load_workload(feedback_log: str | None = FEEDBACK_LOG_FILE, include_question_cache: bool = True) -> list[str]:
+    """
+    Samler kjørt SQL fra agentsteg i tilbakemeldingsloggen (inkludert roterte
+    segmenter) og fra spørsmålscachen.
+
+    Returns:
+        list[str]: Én oppføring per kjøring, så hyppige spørringer teller mer.
+    """
+    statements: list[str] = []
+    for segment in feedback_log_segments(feedback_log) if feedback_log else []:
+        with open_log_segment(segment) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                for step in entry.get("agent_steps") or []:
+                    if step.get("name") == QUERY_TOOL_NAME and step.get("input"):
+                        statements.append(step["input"])
+    if include_question_cache:
+        from backend.question_cache import question_cache
+        if question_cache is not None:
+            for entry in question_cache.list_entries(limit=10_000):
+                statements.extend([entry["sql_query"]] * max(1, entry["hit_count"] + 1))
+    logger.info(f"Loaded {len(statements)} executed SQL statements for index analysis")
+    return statements
+
+
+def query_shape(sql_query: str) -> str:
+    """Normalisert SQL der streng- og tallkonstanter er byttet ut med ?."""
+    parts = []
+    for kind, token in tokenize_sql(canonicalize_sql(sql_query)):
+        if kind == "string":
+            parts.append("?")
+        elif kind == "word":
+            parts.append(_NUMBER_RE.sub("?", token))
+        else:
+            parts.append(token)
+    return "".join(parts)
+
+
+def _pieces(sql_query: str) -> list[tuple[str, str]]:
+    """Deler SQL i ('ident', navn), ('string', tekst) og ('word', ord/operator) uten mellomrom og kommentarer."""
+    pieces = []
+    for kind, token in tokenize_sql(sql_query):
+        if kind == "ident":
+            pieces.append(("ident", token[1:-1].replace('""', '"')))
+        elif kind == "string":
+            pieces.append(("string", token))
+        elif kind in ("word", "char"):
+            pieces.extend(("word", piece) for piece in _PIECE_RE.findall(token))
+    return pieces
+
+
+def analyze_query(sql_query: str, schema: dict[str, list[str]]) -> QueryShape:
+    """
+    Finner tabellene og kolonnene spørringen bruker, fordelt på hvor i spørringen de står.
+
+    Args:
+        sql_query (str): SQL-spørringen.
+        schema (dict[str, list[str]]): Tabellnavn -> kolonnenavn.
+    """
+    shape = QueryShape(shape=query_shape(sql_query), example_sql=sql_query)
+    tables_by_name = {t.lower(): t for t in schema}
+    pieces = _pieces(sql_query)
+
+    for i, (kind, value) in enumerate(pieces):
+        previous = pieces[i - 1][1].lower() if i > 0 else ""
+        if previous in ("from", "join") and value.lower() in tables_by_name:
+            table = tables_by_name[value.lower()]
+            if table not in shape.tables:
+                shape.tables.append(table)
+
+    columns_by_name = {}
+    for table in shape.tables:
+        for column in schema[table]:
+            columns_by_name.setdefault(column.lower(), (table, column))
+
+    clause = None
+    for i, (kind, value) in enumerate(pieces):
+        lowered = value.lower()
+        if kind == "word" and lowered in CLAUSE_KEYWORDS:
+            clause = lowered
+            continue
+        if kind == "string":
+            continue
+        resolved = columns_by_name.get(lowered.rsplit(".", 1)[-1])
+        if resolved is None:
+            continue
+        table, column = resolved
+        _append_unique(shape.referenced_columns, table, column)
+
+        following = pieces[i + 1][1].lower() if i + 1 < len(pieces) else ""
+        if following == "not" and i + 2 < len(pieces):
+            following = pieces[i + 2][1].lower()
+        preceding = pieces[i - 1][1].lower() if i > 0 else ""
+        if clause in ("where", "on", "having"):
+            if following in EQUALITY_OPERATORS or preceding in ("=", "=="):
+                _append_unique(shape.equality_columns, table, column)
+            elif following in RANGE_OPERATORS or preceding in RANGE_OPERATORS:
+                _append_unique(shape.range_columns, table, column)
+        elif clause == "group":
+            _append_unique(shape.group_columns, table, column)
+        elif clause == "order":
+            _append_unique(shape.order_columns, table, column)
+    return shape
+
+
+def propose_indexes(shapes: list[QueryShape], max_columns: int = INDEX_ADVISOR_MAX_COLUMNS) -> list[IndexCandidate]:
+    """
+    Foreslår én indeks per tabell og spørringsform: likhetskolonner først, så én
+    intervallkolonne, så GROUP BY- og ORDER BY-kolonner. Når alle kolonnene
+    spørringen bruker får plass, blir indeksen dekkende. Indekser som er et
+    prefiks av en annen foreslått indeks slås sammen med den.
+    """
+    by_columns: dict[tuple[str, tuple[str, ...]], IndexCandidate] = {}
+    for shape in shapes:
+        for table in shape.tables:
+            columns: list[str] = []
+            for column in (
+                shape.equality_columns.get(table, [])
+                + shape.range_columns.get(table, [])[:1]
+                + shape.group_columns.get(table, [])
+                + shape.order_columns.get(table, [])
+            ):
+                if column not in columns:
+                    columns.append(column)
+            if not columns:
+                continue
+            referenced = shape.referenced_columns.get(table, [])
+            remaining = [c for c in referenced if c not in columns]
+            if len(columns) + len(remaining) <= max_columns:
+                columns += remaining
+            columns = columns[:max_columns]
+            candidate = by_columns.setdefault((table, tuple(columns)), IndexCandidate(table, columns))
+            candidate.shapes.append(shape.shape)
+
+    candidates = sorted(by_columns.values(), key=lambda c: len(c.columns), reverse=True)
+    merged: list[IndexCandidate] = []
+    for candidate in candidates:
+        covering = next(
+            (m for m in merged if m.table == candidate.table and m.columns[:len(candidate.columns)] == candidate.columns),
+            None,
+        )
+        if covering is not None:
+            covering.shapes.extend(candidate.shapes)
+        else:
+            merged.append(candidate)
+    return merged
+
+
+def read_schema(conn: sqlite3.Connection) -> dict[str, list[str]]:
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    return {t: [r[1] for r in conn.execute(f"PRAGMA table_info({_quote(t)})")] for t in tables}
+
+
+def explain_plan(conn: sqlite3.Connection, sql_query: str) -> str:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql_query}").fetchall()
+    return "; ".join(row[-1] for row in rows)
+
+
+def time_query(conn: sqlite3.Connection, sql_query: str, repeat: int) -> float:
+    """Median kjøretid i millisekunder over `repeat` kjøringer."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(sql_query).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def sqlite_path_from_uri(database_uri: str) -> str:
+    url = make_url(database_uri)
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        raise ValueError(f"Indeksrådgiveren støtter bare filbaserte SQLite-databaser, ikke {url.get_backend_name()}.")
+    return url.database.removeprefix("file:").split("?")[0]
+
+
+def same_database_file(source_path: str, target_path: str) -> bool:
+    """Om de to stiene peker på samme fil (også via lenker eller relative stier)."""
+    if os.path.exists(source_path) and os.path.exists(target_path):
+        return os.path.samefile(source_path, target_path)
+    return os.path.realpath(source_path) == os.path.realpath(target_path)
+
+
+def copy_database(source_path: str, target_path: str) -> None:
+    if same_database_file(source_path, target_path):
+        raise ValueError(f"Kopien kan ikke skrives over originaldatabasen ({source_path}).")
+    directory = os.path.dirname(target_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    with closing(sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)) as source, \
+            closing(sqlite3.connect(target_path)) as target:
+        source.backup(target)
+
+
+def advise(
+    statements: list[str],
+    source_path: str,
+    target_path: str,
+    repeat: int = 5,
+    min_count: int = 1,
+) -> tuple[list[QueryShape], list[IndexCandidate]]:
+    """
+    Analyserer arbeidsmengden og tester foreslåtte indekser på en kopi av databasen.
+
+    Bare rene lesespørringer (samme sjekk som hurtigstien) tas med, og de kjøres
+    med PRAGMA query_only, som bare slås av mens indeksene opprettes eller fjernes.
+    Indekser som ingen spørringsplan bruker etterpå, fjernes igjen fra kopien.
+    Kopien bygges i en midlertidig fil ved siden av `target_path` og flyttes på plass
+    med os.replace først når analysen er ferdig, så en feilet kjøring aldri etterlater
+    en halvskrevet eller manglende fil der.
+
+    Args:
+        statements (list[str]): Kjørt SQL, én per kjøring.
+        source_path (str): Originaldatabasen (åpnes skrivebeskyttet).
+        target_path (str): Hvor kopien med indekser skrives.
+        repeat (int): Antall kjøringer per spørring ved tidtaking.
+        min_count (int): Ignorer spørringsformer som er kjørt færre ganger enn dette.
+
+    Returns:
+        tuple[list[QueryShape], list[IndexCandidate]]: Spørringsformer og indeksforslag.
+
+    Raises:
+        ValueError: Hvis `target_path` er samme fil som `source_path`.
+    """
+    if same_database_file(source_path, target_path):
+        raise ValueError(f"Kopien kan ikke skrives over originaldatabasen ({source_path}).")
+
+    read_only = []
+    for statement in statements:
+        violation = read_only_violation(statement)
+        if violation:
+            logger.info(f"Skipping statement that is not a read-only query ({violation})")
+        else:
+            read_only.append(statement)
+    statements = read_only
+
+    directory = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, build_path = tempfile.mkstemp(suffix=".db", prefix=".index_advisor_", dir=directory)
+    os.close(fd)
+    try:
+        shapes, candidates = _advise_on_copy(statements, source_path, build_path, repeat, min_count)
+        os.replace(build_path, target_path)
+    finally:
+        if os.path.exists(build_path):
+            os.remove(build_path)
+    return shapes, candidates
+
+
+def _advise_on_copy(
+    statements: list[str],
+    source_path: str,
+    build_path: str,
+    repeat: int,
+    min_count: int,
+) -> tuple[list[QueryShape], list[IndexCandidate]]:
+    copy_database(source_path, build_path)
+    with closing(sqlite3.connect(build_path)) as conn:
+        conn.execute("PRAGMA query_only = ON")
+        schema = read_schema(conn)
+        row_counts = {t: conn.execute(f"SELECT COUNT(*) FROM {_quote(t)}").fetchone()[0] for t in schema}
+
+        counts = Counter(query_shape(s) for s in statements)
+        examples = {query_shape(s): s for s in statements}
+        shapes = []
+        for shape_text, count in counts.most_common():
+            if count < min_count:
+                continue
+            shape = analyze_query(examples[shape_text], schema)
+            shape.count = count
+            try:
+                shape.plan_before = explain_plan(conn, shape.example_sql)
+                shape.ms_before = time_query(conn, shape.example_sql, repeat)
+            except sqlite3.Error as e:
+                logger.info(f"Skipping query that no longer runs ({e}): {shape.example_sql}")
+                continue
+            shapes.append(shape)
+
+        candidates = propose_indexes(shapes)
+        conn.execute("PRAGMA query_only = OFF")
+        shapes_by_text = {s.shape: s for s in shapes}
+        for candidate in candidates:
+            for shape_text in candidate.shapes:
+                shape = shapes_by_text[shape_text]
+                full_scans = [
+                    step for step in shape.plan_before.split("; ")
+                    if step.startswith("SCAN ") and "INDEX" not in step
+                ]
+                if any(candidate.table in step for step in full_scans) or (full_scans and len(shape.tables) == 1):
+                    candidate.estimated_rows_avoided += shape.count * row_counts[candidate.table]
+            conn.execute(candidate.ddl)
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute("PRAGMA query_only = ON")
+
+        for shape in shapes:
+            shape.plan_after = explain_plan(conn, shape.example_sql)
+            shape.ms_after = time_query(conn, shape.example_sql, repeat)
+        conn.execute("PRAGMA query_only = OFF")
+        for candidate in candidates:
+            candidate.used = any(f"INDEX {candidate.name}" in s.plan_after for s in shapes)
+            if not candidate.used:
+                conn.execute(f"DROP INDEX IF EXISTS {_quote(candidate.name)}")
+        conn.commit()
+    return shapes, candidates
+
+
+def format_report(shapes: list[QueryShape], candidates: list[IndexCandidate]) -> str:
+    lines = ["Indeksforslag", "============="]
+    if not candidates:
+        lines.append("Ingen forslag (ingen spørringer filtrerer eller grupperer på kjente kolonner).")
+    for candidate in sorted(candidates, key=lambda c: c.estimated_rows_avoided, reverse=True):
+        status = "brukt" if candidate.used else "ikke brukt av noen plan, fjernet"
+        lines.append(f"{candidate.ddl};")
+        lines.append(
+            f"    {len(candidate.shapes)} spørringsform(er), anslått {candidate.estimated_rows_avoided:,} "
+            f"færre rader skannet, {status}"
+        )
+    lines += ["", "Tidtaking per spørringsform (median ms)", "======================================="]
+    for shape in shapes:
+        speedup = shape.ms_before / shape.ms_after if shape.ms_after else float("inf")
+        lines.append(f"[{shape.count}x] {shape.shape}")
+        lines.append(f"    før:   {shape.ms_before:8.2f} ms  {shape.plan_before}")
+        lines.append(f"    etter: {shape.ms_after:8.2f} ms  {shape.plan_after}  ({speedup:.1f}x)")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Foreslår indekser basert på SQL agenten har kjørt.")
+    parser.add_argument("--database", default=None, help="SQLite-fil (standard: fra DATABASE_URI).")
+    parser.add_argument("--feedback-log", default=FEEDBACK_LOG_FILE, help="Tilbakemeldingslogg (JSONL).")
+    parser.add_argument("--no-question-cache", action="store_true", help="Ikke bruk SQL fra spørsmålscachen.")
+    parser.add_argument("--sql-file", default=None, help="Ekstra SQL, én spørring per linje.")
+    parser.add_argument("--min-count", type=int, default=1, help="Minste antall kjøringer per spørringsform.")
+    parser.add_argument("--repeat", type=int, default=5, help="Kjøringer per spørring ved tidtaking.")
+    parser.add_argument("--apply", action="store_true",
+                        help=f"Behold den indekserte kopien i --output (standard {INDEX_ADVISOR_DB_PATH}).")
+    parser.add_argument("--output", default=INDEX_ADVISOR_DB_PATH, help="Sti til den administrerte kopien.")
+    args = parser.parse_args(argv)
+
+    source_path = args.database or sqlite_path_from_uri(DATABASE_URI)
+    if args.apply and same_database_file(source_path, args.output):
+        parser.error(f"--output ({args.output}) er samme fil som databasen som analyseres; velg en annen sti.")
+    statements = load_workload(args.feedback_log, include_question_cache=not args.no_question_cache)
+    if args.sql_file:
+        with open(args.sql_file, "r", encoding="utf-8") as f:
+            statements += [line.strip() for line in f if line.strip()]
+    if not statements:
+        print("Fant ingen kjørt SQL å analysere.")
+        return
+
+    if args.apply:
+        target_path = args.output
+    else:
+        fd, target_path = tempfile.mkstemp(suffix=".db", prefix="index_advisor_")
+        os.close(fd)
+    try:
+        shapes, candidates = advise(statements, source_path, target_path, repeat=args.repeat, min_count=args.min_count)
+        print(format_report(shapes, candidates))
+    finally:
+        if not args.apply and os.path.exists(target_path):
+            os.remove(target_path)
+    if args.apply:
+        print(f"\nIndeksert kopi skrevet til {target_path}. Sett DATABASE_URI=sqlite:///{target_path} for å bruke den.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    main()
@@ -0,0 +1,171 @@
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from threading import Lock
+from typing import Any, Callable
+
+from backend.config import AGENT_MAX_WORKERS, AGENT_MAX_QUEUE, AGENT_JOB_RETENTION_SECONDS
+from backend.metrics import registry
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class JobQueueFullError(RuntimeError):
+    """Kastes når køen for agentjobber er full."""
+
+
+class Job:
+    """Håndtak for en innsendt jobb. Feltene oppdateres av arbeidertråden."""
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, kwargs: dict, progress: Any = None) -> None:
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.progress = progress
+        self.status = JobStatus.QUEUED
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.submitted_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+
+class JobExecutorService:
+    """
+    Prosessfelles kjøring av agentforespørsler i en begrenset trådpool.
+
+    Jobber som ikke får en ledig arbeider venter i en FIFO-kø, og køplassen kan
+    leses med `position`. Når køen har `max_queue` ventende jobber avvises nye
+    med JobQueueFullError.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, retention_seconds: float) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention_seconds = retention_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-job")
+        self._jobs: dict[str, Job] = {}
+        self._pending: deque[str] = deque()
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._lock = Lock()
+
+    def submit(self, fn: Callable[..., Any], *args: Any, progress: Any = None, **kwargs: Any) -> Job:
+        """
+        Legger en jobb i køen.
+
+        Args:
+            fn: Funksjonen som skal kjøres i en arbeidertråd.
+            progress: Valgfritt objekt UI-et kan lese fremdrift fra mens jobben kjører
+                      (f.eks. en TokenUsageCallbackHandler).
+
+        Returns:
+            Job: Håndtak som kan polles med `get`/`position`.
+        """
+        job = Job(fn, args, kwargs, progress=progress)
+        with self._lock:
+            self._prune_locked()
+            if len(self._pending) >= self.max_queue:
+                self._rejected += 1
+                raise JobQueueFullError(f"Agentkøen er full ({self.max_queue} ventende jobber).")
+            self._jobs[job.id] = job
+            self._pending.append(job.id)
+        self._pool.submit(self._run, job)
+        logger.info(f"Job {job.id} submitted. Queue depth: {len(self._pending)}")
+        return job
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            try:
+                self._pending.remove(job.id)
+            except ValueError:
+                pass
+            self._running += 1
+            job.status = JobStatus.RUNNING
+            job.started_at = time.time()
+        try:
+            job.result = job.fn(*job.args, **job.kwargs)
+            job.status = JobStatus.DONE
+        except BaseException as e:
+            logger.exception(f"Job {job.id} failed")
+            job.error = e
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._running -= 1
+                if job.status == JobStatus.DONE:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> int:
+        """Plass i køen (1 = neste), eller 0 hvis jobben ikke venter."""
+        with self._lock:
+            try:
+                return self._pending.index(job_id) + 1
+            except ValueError:
+                return 0
+
+    def discard(self, job_id: str) -> None:
+        """Fjerner en ferdig jobb når resultatet er hentet."""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune_locked(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        stale = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in stale:
+            del self._jobs[job_id]
+        if stale:
+            logger.info(f"Pruned {len(stale)} uncollected finished jobs")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "queued": len(self._pending),
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+
+job_executor = JobExecutorService(
+    max_workers=AGENT_MAX_WORKERS,
+    max_queue=AGENT_MAX_QUEUE,
+    retention_seconds=AGENT_JOB_RETENTION_SECONDS,
+)
+
+registry.gauge(
+    "sqlchat_agent_queue_depth", "Spørsmål som venter på en ledig arbeidertråd.",
+    function=lambda: job_executor.stats()["queued"],
+)
+registry.gauge(
+    "sqlchat_agent_jobs_running", "Spørsmål som kjøres akkurat nå.",
+    function=lambda: job_executor.stats()["running"],
+)
@@ -1,5 +1,5 @@
 from langchain_openai import AzureChatOpenAI
-from backend.config import AZURE_OPENAI_ENDPOINT
+from backend.config import AZURE_OPENAI_ENDPOINT, LLM_STREAMING
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,6 +10,7 @@ llm = AzureChatOpenAI(
     api_version="2024-12-01-preview",
     timeout=60,
     stream_usage=True,
+    streaming=LLM_STREAMING,
 )
 
 logger.info('LLM client initialisert using base: %s', AZURE_OPENAI_ENDPOINT)
\ No newline at end of file
@@ -0,0 +1,287 @@
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable
+
+from backend.config import (
+    METRICS_HTTP_HOST,
+    METRICS_HTTP_PORT,
+    METRICS_FILE_PATH,
+    METRICS_FILE_INTERVAL_SECONDS,
+)
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labelvalues(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} forventer labels {self.labelnames}, fikk {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Teller som bare øker (f.eks. antall spørsmål eller tokens)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("En teller kan ikke minke.")
+        key = self._labelvalues(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._labelvalues(labels), 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+
+class Gauge(_Metric):
+    """Øyeblikksverdi. Med `function` leses verdien først når metrikkene eksporteres."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float] | None = None) -> None:
+        super().__init__(name, documentation)
+        self._value = 0.0
+        self._function = function
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def value(self) -> float:
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return self._value
+
+    def _samples(self) -> list[str]:
+        try:
+            return [f"{self.name} {_format_value(self.value())}"]
+        except Exception as e:
+            logger.warning(f"Could not read gauge {self.name}: {e}")
+            return []
+
+
+class Histogram(_Metric):
+    """Fordeling av observasjoner i faste bøtter (f.eks. SQL-latens i sekunder)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float], labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per labelsett: antall per bøtte (siste er +Inf), sum.
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._labelvalues(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._labelvalues(labels))
+            return sum(series[0]) if series else 0
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            snapshot = [(key, list(counts), total[0]) for key, (counts, total) in sorted(self._series.items())]
+        lines = []
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Prosessfelles register over tellere, gauger og histogrammer, med eksport i
+    Prometheus' tekstformat (via HTTP eller til fil for node_exporters textfile-collector).
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._http_server: ThreadingHTTPServer | None = None
+        self._file_thread: threading.Thread | None = None
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float] | None = None) -> Gauge:
+        return self._register(Gauge(name, documentation, function))
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Iterable[float] = LATENCY_BUCKETS, labelnames: Iterable[str] = ()
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets, labelnames))
+
+    def render(self) -> str:
+        """Alle metrikker i Prometheus' tekstformat (versjon 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> bool:
+        """
+        Starter et lite HTTP-endepunkt (GET /metrics) i en bakgrunnstråd.
+
+        Returns:
+            bool: True hvis serveren kjører (også hvis den allerede var startet).
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        with self._lock:
+            if self._http_server is not None:
+                return True
+            try:
+                self._http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                logger.warning(f"Could not start metrics endpoint on {host}:{port}: {e}")
+                return False
+        thread = threading.Thread(target=self._http_server.serve_forever, name="metrics-http", daemon=True)
+        thread.start()
+        logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+        return True
+
+    def write_file(self, path: str) -> None:
+        """Skriver metrikkene atomisk til `path` (skrives til en midlertidig fil og byttes inn)."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start_file_exporter(self, path: str, interval_seconds: float) -> None:
+        """Skriver metrikkene til fil hvert `interval_seconds` sekund i en bakgrunnstråd."""
+        def loop() -> None:
+            while True:
+                try:
+                    self.write_file(path)
+                except Exception as e:
+                    logger.warning(f"Could not write metrics file {path}: {e}")
+                time.sleep(interval_seconds)
+
+        with self._lock:
+            if self._file_thread is not None:
+                return
+            self._file_thread = threading.Thread(target=loop, name="metrics-file", daemon=True)
+        self._file_thread.start()
+        logger.info(f"Writing metrics to {path} every {interval_seconds:.0f} s")
+
+
+registry = MetricsRegistry()
+
+QUESTIONS = registry.counter("sqlchat_questions_total", "Besvarte spørsmål per motor.", ["engine"])
+QUESTION_LATENCY = registry.histogram(
+    "sqlchat_question_duration_seconds", "Tid fra spørsmålet startet til svaret var klart.", labelnames=["engine"]
+)
+LLM_CALLS = registry.counter("sqlchat_llm_calls_total", "Vellykkede LLM-kall.")
+LLM_ERRORS = registry.counter("sqlchat_llm_errors_total", "LLM-kall som feilet.")
+LLM_TOKENS = registry.counter("sqlchat_llm_tokens_total", "Tokens brukt, per type (prompt/completion).", ["kind"])
+LLM_LATENCY = registry.histogram("sqlchat_llm_call_duration_seconds", "Varighet per LLM-kall.")
+SQL_QUERIES = registry.counter("sqlchat_sql_queries_total", "SQL-spørringer kjørt mot databasen, per utfall.", ["outcome"])
+SQL_LATENCY = registry.histogram("sqlchat_sql_duration_seconds", "Kjøretid per SQL-spørring (inkludert henting).")
+SQL_ROWS = registry.histogram("sqlchat_sql_rows", "Antall rader returnert per SQL-spørring.", buckets=ROW_BUCKETS)
+CACHE_LOOKUPS = registry.counter(
+    "sqlchat_cache_lookups_total", "Oppslag i cachene (question/result/rollup/chart) per resultat (hit/miss).", ["cache", "result"]
+)
+CHART_SUGGESTIONS = registry.counter(
+    "sqlchat_chart_suggestions_total", "Visualiseringsforslag per kilde (heuristic/cache/llm).", ["source"]
+)
+
+
+def start_exporters() -> None:
+    """Starter HTTP- og/eller fileksport etter konfigurasjonen. Trygg å kalle flere ganger."""
+    if METRICS_HTTP_PORT:
+        registry.start_http_server(METRICS_HTTP_PORT, METRICS_HTTP_HOST)
+    if METRICS_FILE_PATH:
+        registry.start_file_exporter(METRICS_FILE_PATH, METRICS_FILE_INTERVAL_SECONDS)
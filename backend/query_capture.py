@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from uuid import UUID
+
+from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
+from langchain_community.utilities.sql_database import truncate_word
+
+from backend.config import QUERY_CAPTURE_MAX_ROWS
+from backend.db_client import QueryResult, fetch_result
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUERY_TOOL_NAME = "sql_db_query"
+MAX_CAPTURED_RUNS = 64
+
+_captured_results: "OrderedDict[str, list[QueryResult]]" = OrderedDict()
+_captured_lock = Lock()
+
+
+def store_captured_result(run_id: UUID | str, result: QueryResult) -> None:
+    """
+    Tar vare på et resultat fra agentens SQL-verktøy, nøkkel er agentkjøringens run_id.
+    De eldste kjøringene kastes når det er flere enn MAX_CAPTURED_RUNS.
+    """
+    key = str(run_id)
+    with _captured_lock:
+        _captured_results.setdefault(key, []).append(result)
+        _captured_results.move_to_end(key)
+        while len(_captured_results) > MAX_CAPTURED_RUNS:
+            evicted_run_id, _ = _captured_results.popitem(last=False)
+            logger.info(f"Kastet ubrukte SQL-resultater for run_id {evicted_run_id}")
+
+
+def take_captured_result(run_id: UUID | str, sql_query: str) -> QueryResult | None:
+    """
+    Henter (og fjerner) alle resultater for en agentkjøring og returnerer det siste
+    som ble kjørt med `sql_query`.
+
+    Args:
+        run_id (UUID | str): run_id som ble gitt til agent.invoke.
+        sql_query (str): SQL-spørringen UI-et skal vise resultatet for.
+
+    Returns:
+        QueryResult | None: Resultatet, eller None hvis det ikke finnes.
+    """
+    with _captured_lock:
+        results = _captured_results.pop(str(run_id), [])
+    for result in reversed(results):
+        if result.sql.strip() == sql_query.strip():
+            return result
+    return None
+
+
+def format_result_for_llm(result: QueryResult, max_string_length: int) -> str:
+    """Formaterer resultatet slik SQLDatabase.run gjør, så agenten ser samme tekst som før."""
+    if not result.row_count:
+        return ""
+    return str([
+        tuple(truncate_word(value, length=max_string_length) for value in row)
+        for row in result.iter_rows()
+    ])
+
+
+class CapturingQuerySQLDatabaseTool(QuerySQLDatabaseTool):
+    """
+    SQL-verktøy som i tillegg til tekst til LLM-en tar vare på et typet resultat,
+    slik at UI-et slipper å kjøre den samme spørringen en gang til.
+    """
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        try:
+            result = fetch_result(query, max_rows=QUERY_CAPTURE_MAX_ROWS)
+        except Exception as e:
+            return f"Error: {e}"
+
+        if run_manager is not None and run_manager.parent_run_id is not None:
+            store_captured_result(run_manager.parent_run_id, result)
+        return format_result_for_llm(result, self.db._max_string_length)
+
+
+SCHEMA_TOOL_NAMES = ("sql_db_list_tables", "sql_db_schema")
+
+QUERY_TOOL_DESCRIPTION_WITHOUT_SCHEMA_TOOLS = (
+    "Input to this tool is a detailed and correct SQL query, output is a "
+    "result from the database. If the query is not correct, an error message "
+    "will be returned. If an error is returned, rewrite the query, check the "
+    "query, and try again. Use the schema given in the prompt to find the "
+    "correct table and column names."
+)
+
+
+class CapturingSQLDatabaseToolkit(SQLDatabaseToolkit):
+    """
+    SQLDatabaseToolkit der spørreverktøyet er byttet ut med CapturingQuerySQLDatabaseTool.
+
+    Med `include_schema_tools=False` utelates sql_db_list_tables og sql_db_schema,
+    for bruk når skjemaet allerede ligger i prompten.
+    """
+
+    include_schema_tools: bool = True
+
+    def get_tools(self) -> list[BaseTool]:
+        tools = []
+        for tool in super().get_tools():
+            if tool.name in SCHEMA_TOOL_NAMES and not self.include_schema_tools:
+                continue
+            if tool.name == QUERY_TOOL_NAME:
+                description = tool.description if self.include_schema_tools else QUERY_TOOL_DESCRIPTION_WITHOUT_SCHEMA_TOOLS
+                tool = CapturingQuerySQLDatabaseTool(db=self.db, description=description)
+            tools.append(tool)
+        return tools
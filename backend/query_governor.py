@@ -0,0 +1,190 @@
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock, current_thread
+from typing import Any, Iterator
+
+from backend.config import QUERY_TIMEOUT_SECONDS, QUERY_MAX_ROWS, QUERY_MAX_BYTES
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PROGRESS_INTERVAL = 1000
+POSTGRES_QUERY_CANCELED = "57014"
+
+
+class QueryTimeoutError(RuntimeError):
+    """Kastes når en spørring bruker lengre tid enn tidsgrensen."""
+
+
+class QueryCancelledError(RuntimeError):
+    """Kastes når en spørring blir avbrutt med QueryGovernor.cancel."""
+
+
+@dataclass
+class ActiveQuery:
+    """En spørring som kjører nå, med frist og avbruddsflagg."""
+
+    sql: str
+    dialect: str
+    dbapi_connection: Any
+    deadline: float
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    started_at: float = field(default_factory=time.time)
+    thread: str = field(default_factory=lambda: current_thread().name)
+    cancelled: bool = False
+    timed_out: bool = False
+
+    def _progress_handler(self) -> int:
+        """SQLite kaller denne jevnlig under kjøring; alt annet enn 0 avbryter spørringen."""
+        if self.cancelled:
+            return 1
+        if time.monotonic() > self.deadline:
+            self.timed_out = True
+            return 1
+        return 0
+
+    def check(self) -> None:
+        """Sjekkes mellom hver batch med rader, slik at også henting stopper ved frist eller avbrudd."""
+        if self.cancelled:
+            raise QueryCancelledError("Spørringen ble avbrutt.")
+        if time.monotonic() > self.deadline:
+            self.timed_out = True
+            raise QueryTimeoutError("Spørringen brukte for lang tid og ble stoppet.")
+
+
+class QueryGovernor:
+    """
+    Grenser for all SQL som kjøres via fetch_result: tidsgrense per spørring,
+    maks antall rader og bytes, og mulighet til å avbryte spørringer som kjører.
+
+    Tidsgrensen håndheves av databasen (progress handler i SQLite, statement_timeout
+    i Postgres) og i tillegg mellom hver batch med rader. Brudd logges med SQL-en.
+    """
+
+    def __init__(self, timeout_seconds: float, max_rows: int, max_bytes: int) -> None:
+        self.timeout_seconds = timeout_seconds
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._active: dict[str, ActiveQuery] = {}
+        self._lock = Lock()
+        self.timeouts = 0
+        self.cancellations = 0
+        self.truncations = 0
+
+    def row_limit(self, max_rows: int | None) -> tuple[int, str]:
+        """Effektiv radgrense og årsaken som settes hvis den nås."""
+        if max_rows is not None and max_rows <= self.max_rows:
+            return max_rows, "row_limit"
+        return self.max_rows, "row_budget"
+
+    @contextmanager
+    def govern(self, connection: Any, sql_query: str, timeout_seconds: float | None = None) -> Iterator[ActiveQuery]:
+        """
+        Kjører innholdet i with-blokken under tidsgrense og avbruddskontroll.
+
+        Args:
+            connection: SQLAlchemy Connection spørringen kjøres på.
+            sql_query (str): SQL-en (for logging og oversikt over aktive spørringer).
+            timeout_seconds (float | None): Overstyrer standard tidsgrense.
+
+        Raises:
+            QueryTimeoutError: Spørringen brukte for lang tid.
+            QueryCancelledError: Spørringen ble avbrutt med `cancel`.
+        """
+        timeout = timeout_seconds or self.timeout_seconds
+        dialect = connection.dialect.name
+        dbapi_connection = connection.connection.dbapi_connection
+        query = ActiveQuery(sql_query, dialect, dbapi_connection, deadline=time.monotonic() + timeout)
+        with self._lock:
+            self._active[query.id] = query
+
+        if dialect == "sqlite":
+            dbapi_connection.set_progress_handler(query._progress_handler, SQLITE_PROGRESS_INTERVAL)
+        elif dialect == "postgresql":
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+        try:
+            yield query
+        except (QueryTimeoutError, QueryCancelledError) as e:
+            self._record_violation(query, e)
+            raise
+        except Exception as e:
+            postgres_cancelled = getattr(getattr(e, "orig", None), "pgcode", None) == POSTGRES_QUERY_CANCELED
+            if query.cancelled:
+                error = QueryCancelledError("Spørringen ble avbrutt.")
+            elif query.timed_out or postgres_cancelled:
+                error = QueryTimeoutError(f"Spørringen brukte mer enn {timeout:.0f} s og ble stoppet.")
+            else:
+                raise
+            self._record_violation(query, error)
+            raise error from e
+        finally:
+            if dialect == "sqlite":
+                dbapi_connection.set_progress_handler(None, SQLITE_PROGRESS_INTERVAL)
+            with self._lock:
+                self._active.pop(query.id, None)
+
+    def _record_violation(self, query: ActiveQuery, error: Exception) -> None:
+        elapsed = time.time() - query.started_at
+        with self._lock:
+            if isinstance(error, QueryCancelledError):
+                self.cancellations += 1
+            else:
+                self.timeouts += 1
+        logger.warning(f"Query governor stopped query after {elapsed:.1f} s ({type(error).__name__}). SQL: {query.sql}")
+
+    def record_truncation(self, sql_query: str, reason: str, rows: int, size_bytes: int) -> None:
+        """Logger at et resultat ble avkortet av rad- eller bytebudsjettet."""
+        with self._lock:
+            self.truncations += 1
+        logger.warning(
+            f"Query governor truncated result ({reason}) at {rows} rows / {size_bytes / 1024 / 1024:.1f} MB. SQL: {sql_query}"
+        )
+
+    def cancel(self, query_id: str) -> bool:
+        """
+        Avbryter en spørring som kjører.
+
+        Returns:
+            bool: True hvis spørringen fantes og ble bedt om å stoppe.
+        """
+        with self._lock:
+            query = self._active.get(query_id)
+        if query is None:
+            return False
+        query.cancelled = True
+        try:
+            if query.dialect == "sqlite":
+                query.dbapi_connection.interrupt()
+            elif hasattr(query.dbapi_connection, "cancel"):
+                query.dbapi_connection.cancel()
+        except Exception as e:
+            logger.warning(f"Could not interrupt query {query_id}: {e}")
+        logger.info(f"Cancel requested for query {query_id}")
+        return True
+
+    def active_queries(self) -> list[dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return [
+                {"id": q.id, "sql": q.sql, "thread": q.thread, "running_s": round(now - q.started_at, 1)}
+                for q in self._active.values()
+            ]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "active": len(self._active),
+                "timeouts": self.timeouts,
+                "cancellations": self.cancellations,
+                "truncations": self.truncations,
+            }
+
+
+query_governor = QueryGovernor(
+    timeout_seconds=QUERY_TIMEOUT_SECONDS,
+    max_rows=QUERY_MAX_ROWS,
+    max_bytes=QUERY_MAX_BYTES,
+)
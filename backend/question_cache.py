@@ -0,0 +1,170 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from contextlib import closing
+from typing import Any
+
+from backend.config import (
+    QUESTION_CACHE_ENABLED,
+    QUESTION_CACHE_MAX_ENTRIES,
+    QUESTION_CACHE_PATH,
+    QUESTION_CACHE_TTL_SECONDS,
+)
+from backend.metrics import CACHE_LOOKUPS
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS question_cache (
+    cache_key TEXT PRIMARY KEY,
+    normalized_prompt TEXT NOT NULL,
+    schema_hash TEXT NOT NULL,
+    sql_query TEXT NOT NULL,
+    answer_text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hit_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_question_cache_last_access ON question_cache(last_access);
+CREATE INDEX IF NOT EXISTS idx_question_cache_created_at ON question_cache(created_at);
+CREATE TABLE IF NOT EXISTS question_cache_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normaliserer et spørsmål slik at små forskjeller i skrivemåte gir samme nøkkel."""
+    normalized = unicodedata.normalize("NFKC", prompt).casefold()
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    return normalized.rstrip("?!. ")
+
+
+class QuestionCache:
+    """
+    Persistent cache fra spørsmål til ferdig SQL og svartekst, lagret i SQLite.
+
+    Nøkkelen er normalisert spørsmål + hash av skjemaet, så endringer i tabellene
+    gjør gamle oppføringer ugyldige. Oppføringer eldre enn `ttl_seconds` regnes som
+    utløpt, og de minst nylig brukte kastes når det er flere enn `max_entries`.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+        logger.info(f"Question cache opened at {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def make_key(prompt: str, schema_hash: str) -> str:
+        return hashlib.sha256(f"{schema_hash}\x00{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def _bump_stat(self, conn: sqlite3.Connection, name: str) -> None:
+        conn.execute(
+            "INSERT INTO question_cache_stats(name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, prompt: str, schema_hash: str) -> dict[str, Any] | None:
+        """
+        Slår opp et spørsmål i cachen.
+
+        Returns:
+            dict | None: Oppføringen med 'sql_query' og 'answer_text', eller None ved bom.
+        """
+        key = self.make_key(prompt, schema_hash)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT * FROM question_cache WHERE cache_key = ?", (key,)).fetchone()
+            if row is not None and now - row["created_at"] > self.ttl_seconds:
+                conn.execute("DELETE FROM question_cache WHERE cache_key = ?", (key,))
+                row = None
+            if row is None:
+                self._bump_stat(conn, "misses")
+                CACHE_LOOKUPS.inc(cache="question", result="miss")
+                return None
+            conn.execute(
+                "UPDATE question_cache SET last_access = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                (now, key),
+            )
+            self._bump_stat(conn, "hits")
+        CACHE_LOOKUPS.inc(cache="question", result="hit")
+        logger.info(f"Question cache hit for '{row['normalized_prompt']}'")
+        return dict(row)
+
+    def put(self, prompt: str, schema_hash: str, sql_query: str, answer_text: str) -> None:
+        """Lagrer (eller erstatter) SQL og svartekst for et spørsmål og kaster utløpte/overflødige oppføringer."""
+        key = self.make_key(prompt, schema_hash)
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO question_cache "
+                "(cache_key, normalized_prompt, schema_hash, sql_query, answer_text, created_at, last_access, hit_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, normalize_prompt(prompt), schema_hash, sql_query, answer_text, now, now),
+            )
+            conn.execute("DELETE FROM question_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM question_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM question_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, cache_keys: list[str] | None = None) -> int:
+        """
+        Sletter oppføringer fra cachen.
+
+        Args:
+            cache_keys (list[str] | None): Nøklene som skal slettes. None sletter alt.
+
+        Returns:
+            int: Antall slettede oppføringer.
+        """
+        with closing(self._connect()) as conn, conn:
+            if cache_keys is None:
+                deleted = conn.execute("DELETE FROM question_cache").rowcount
+            else:
+                deleted = conn.executemany(
+                    "DELETE FROM question_cache WHERE cache_key = ?", [(k,) for k in cache_keys]
+                ).rowcount
+        logger.info(f"Question cache invalidated {deleted} entries")
+        return deleted
+
+    def list_entries(self, limit: int = 200) -> list[dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT cache_key, normalized_prompt, sql_query, created_at, last_access, hit_count "
+                "FROM question_cache ORDER BY last_access DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def stats(self) -> dict[str, int]:
+        with closing(self._connect()) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM question_cache_stats").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM question_cache").fetchone()[0]
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "entries": entries}
+
+
+question_cache = QuestionCache(
+    QUESTION_CACHE_PATH,
+    max_entries=QUESTION_CACHE_MAX_ENTRIES,
+    ttl_seconds=QUESTION_CACHE_TTL_SECONDS,
+) if QUESTION_CACHE_ENABLED else None
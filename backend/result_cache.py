@@ -0,0 +1,232 @@
+import os
+import re
+import sys
+import time
+import hashlib
+from collections import OrderedDict
+from dataclasses import replace
+from threading import Lock
+
+from sqlalchemy import text
+
+from backend.config import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_VERSION_PROBE,
+    RESULT_CACHE_PROBE_INTERVAL_SECONDS,
+    RESULT_CACHE_FALLBACK_TTL_SECONDS,
+)
+from backend.db_client import QueryResult, engine, fetch_result
+from backend.metrics import CACHE_LOOKUPS
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SQL_TOKEN_RE = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*')
+    | (?P<ident>"(?:[^"]|"")*")
+    | (?P<line_comment>--[^\n]*)
+    | (?P<block_comment>/\*.*?\*/)
+    | (?P<space>\s+)
+    | (?P<word>[^'"\s\-/]+)
+    | (?P<char>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def tokenize_sql(sql_query: str) -> list[tuple[str, str]]:
+    """Deler SQL i (type, tekst)-par: string, ident, line_comment, block_comment, space, word eller char."""
+    return [(match.lastgroup, match.group()) for match in _SQL_TOKEN_RE.finditer(sql_query)]
+
+
+def canonicalize_sql(sql_query: str) -> str:
+    """
+    Normaliserer SQL slik at spørringer som bare skiller seg i store/små bokstaver,
+    mellomrom, kommentarer eller avsluttende semikolon får samme tekst.
+    Strenger og siterte identifikatorer beholdes uendret.
+    """
+    parts: list[str] = []
+    for kind, token in tokenize_sql(sql_query):
+        if kind in ("line_comment", "block_comment", "space"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        elif kind in ("string", "ident"):
+            parts.append(token)
+        else:
+            parts.append(token.lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def sql_fingerprint(sql_query: str) -> str:
+    return hashlib.sha256(canonicalize_sql(sql_query).encode("utf-8")).hexdigest()
+
+
+def compact_result(result: QueryResult) -> QueryResult:
+    """
+    Lager en kompakt kopi av resultatet der like strengverdier i en kolonne deler
+    samme objekt. Kategorikolonner som `tilbyder` og `teknologi` har få unike verdier,
+    så dette reduserer minnebruken betraktelig.
+    """
+    compacted: list[list] = []
+    for values in result.column_data:
+        pool: dict[str, str] = {}
+        compacted.append([pool.setdefault(v, v) if type(v) is str else v for v in values])
+    return replace(result, column_data=compacted)
+
+
+def estimate_result_bytes(result: QueryResult) -> int:
+    """Anslår minnebruken til et resultat; delte objekter telles bare én gang."""
+    total = sys.getsizeof(result.column_data)
+    for values in result.column_data:
+        total += sys.getsizeof(values)
+        unique_values = {id(v): v for v in values}
+        total += sum(sys.getsizeof(v) for v in unique_values.values())
+    return total
+
+
+class DataVersionProbe:
+    """
+    Finner en versjon for dataene i databasen, slik at cachede resultater
+    blir ugyldige når dataene endres.
+
+    - SQLite-fil: endringstid og størrelse på databasefilen (og eventuell -wal-fil).
+    - Andre databaser: resultatet av RESULT_CACHE_VERSION_PROBE (f.eks. en
+      `SELECT max(oppdatert) FROM ...`). Uten probe brukes et tidsvindu på
+      RESULT_CACHE_FALLBACK_TTL_SECONDS, som gjør at cachen fungerer som en TTL-cache.
+    """
+
+    def __init__(self, probe_sql: str | None, probe_interval: float, fallback_ttl: float) -> None:
+        self.probe_sql = probe_sql
+        self.probe_interval = probe_interval
+        self.fallback_ttl = fallback_ttl
+        self._cached_version: str | None = None
+        self._checked_at = 0.0
+        self._lock = Lock()
+
+    def _sqlite_path(self) -> str | None:
+        if engine.dialect.name != "sqlite":
+            return None
+        database = engine.url.database
+        if not database or database == ":memory:" or database.startswith("file::memory:"):
+            return None
+        return database.removeprefix("file:").split("?")[0]
+
+    def _compute(self) -> str:
+        sqlite_path = self._sqlite_path()
+        if sqlite_path and self.probe_sql is None:
+            parts = []
+            for path in (sqlite_path, sqlite_path + "-wal"):
+                if os.path.exists(path):
+                    stat = os.stat(path)
+                    parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+            return "file:" + "|".join(parts)
+        if self.probe_sql:
+            with engine.connect() as connection:
+                row = connection.execute(text(self.probe_sql)).fetchone()
+            return "probe:" + repr(tuple(row) if row is not None else None)
+        return f"ttl:{int(time.time() // self.fallback_ttl)}"
+
+    def current(self) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if self._cached_version is None or now - self._checked_at >= self.probe_interval:
+                self._cached_version = self._compute()
+                self._checked_at = now
+            return self._cached_version
+
+
+class ResultCache:
+    """
+    Prosessfelles cache for SQL-resultater, delt mellom alle Streamlit-økter.
+
+    Nøkkelen er fingeravtrykket av normalisert SQL, dataversjonen og eventuell
+    radgrense. Resultatene lagres kolonnevis (QueryResult), og de minst nylig
+    brukte kastes når samlet anslått størrelse overstiger `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, version_probe: DataVersionProbe) -> None:
+        self.max_bytes = max_bytes
+        self.version_probe = version_probe
+        self._entries: "OrderedDict[tuple[str, str, int | None], tuple[QueryResult, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, sql_query: str, max_rows: int | None) -> tuple[str, str, int | None]:
+        return sql_fingerprint(sql_query), self.version_probe.current(), max_rows
+
+    def get(self, sql_query: str, max_rows: int | None = None) -> QueryResult | None:
+        key = self._key(sql_query, max_rows)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="result", result="miss")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        CACHE_LOOKUPS.inc(cache="result", result="hit")
+        return entry[0]
+
+    def put(self, result: QueryResult, max_rows: int | None = None) -> None:
+        result = compact_result(result)
+        size = estimate_result_bytes(result)
+        if size > self.max_bytes:
+            logger.info(f"Result too large for cache ({size} bytes), not caching.")
+            return
+        key = self._key(result.sql, max_rows)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[1]
+            self._entries[key] = (result, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def fetch(self, sql_query: str, max_rows: int | None = None) -> QueryResult:
+        """Henter resultatet fra cachen, eller kjører spørringen og cacher resultatet."""
+        cached = self.get(sql_query, max_rows)
+        if cached is not None:
+            logger.info(f"Result cache hit ({cached.row_count} rows) for SQL: {sql_query}")
+            return cached
+        result = fetch_result(sql_query, max_rows=max_rows)
+        self.put(result, max_rows)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+result_cache = ResultCache(
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    version_probe=DataVersionProbe(
+        RESULT_CACHE_VERSION_PROBE,
+        probe_interval=RESULT_CACHE_PROBE_INTERVAL_SECONDS,
+        fallback_ttl=RESULT_CACHE_FALLBACK_TTL_SECONDS,
+    ),
+) if RESULT_CACHE_ENABLED else None
+
+
+def cached_fetch_result(sql_query: str, max_rows: int | None = None) -> QueryResult:
+    """Som fetch_result, men går via resultatcachen når den er slått på."""
+    if result_cache is None:
+        return fetch_result(sql_query, max_rows=max_rows)
+    return result_cache.fetch(sql_query, max_rows=max_rows)
@@ -0,0 +1,170 @@
+import csv
+import io
+from dataclasses import dataclass
+from typing import Iterator
+
+import pandas as pd
+
+from backend.config import EXPORT_CHUNK_ROWS
+from backend.db_client import QueryResult, stream_result_chunks
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXCEL_MAX_ROWS = 1_048_575  # Excel-ark har 1 048 576 rader, inkludert overskriften.
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    key: str
+    label: str
+    mime: str
+    extension: str
+
+
+EXPORT_FORMATS = {
+    "csv": ExportFormat("csv", "CSV", "text/csv", "csv"),
+    "parquet": ExportFormat("parquet", "Parquet", "application/vnd.apache.parquet", "parquet"),
+    "xlsx": ExportFormat(
+        "xlsx", "Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"
+    ),
+}
+
+
+def available_formats() -> list[ExportFormat]:
+    """Eksportformatene som kan brukes: Parquet krever pyarrow og Excel krever openpyxl."""
+    formats = [EXPORT_FORMATS["csv"]]
+    try:
+        import pyarrow  # noqa: F401
+        formats.append(EXPORT_FORMATS["parquet"])
+    except ImportError:
+        pass
+    try:
+        import openpyxl  # noqa: F401
+        formats.append(EXPORT_FORMATS["xlsx"])
+    except ImportError:
+        pass
+    return formats
+
+
+def _chunks_from_result(result: QueryResult, chunk_rows: int) -> Iterator[QueryResult]:
+    for start in range(0, max(result.row_count, 1), chunk_rows):
+        yield QueryResult(
+            result.sql, result.columns,
+            [values[start:start + chunk_rows] for values in result.column_data],
+            result.elapsed_ms,
+        )
+
+
+def _result_from_dataframe(df: pd.DataFrame) -> QueryResult:
+    column_data = [df[c].astype(object).where(df[c].notna(), None).tolist() for c in df.columns]
+    return QueryResult("", [str(c) for c in df.columns], column_data, 0.0)
+
+
+def _write_csv(chunks: Iterator[QueryResult], output: io.BytesIO) -> None:
+    text_output = io.TextIOWrapper(output, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text_output)
+    header_written = False
+    for chunk in chunks:
+        if not header_written:
+            writer.writerow(chunk.columns)
+            header_written = True
+        writer.writerows(chunk.iter_rows())
+    text_output.detach()
+
+
+def _write_parquet(chunks: Iterator[QueryResult], output: io.BytesIO) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk.to_dataframe(), preserve_index=False)
+            if writer is None:
+                # Kolonner som bare har NULL i første bit får tekst-type, så senere bit kan skrives.
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                    for field in table.schema
+                ])
+                writer = pq.ParquetWriter(output, schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _write_xlsx(chunks: Iterator[QueryResult], output: io.BytesIO) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Resultat")
+    rows_written = 0
+    header_written = False
+    for chunk in chunks:
+        if not header_written:
+            sheet.append(chunk.columns)
+            header_written = True
+        for row in chunk.iter_rows():
+            if rows_written >= EXCEL_MAX_ROWS:
+                logger.warning(f"Excel-eksport avkortet til {EXCEL_MAX_ROWS} rader.")
+                break
+            sheet.append(list(row))
+            rows_written += 1
+    workbook.save(output)
+
+
+_WRITERS = {"csv": _write_csv, "parquet": _write_parquet, "xlsx": _write_xlsx}
+
+
+def export_result(
+    format_key: str,
+    dataframe: pd.DataFrame | None = None,
+    sql_query: str | None = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> io.BytesIO:
+    """
+    Serialiserer et resultat til CSV, Parquet eller Excel, bit for bit.
+
+    Kalles først når brukeren laster ned, og bytene holdes ikke igjen etterpå.
+    For resultater som vises side for side finnes ikke hele tabellen i meldingen,
+    så da strømmes SQL-en fra databasen i bit på `chunk_rows` rader, uten å gå via
+    resultatcachen og uten å samle hele resultatet i minnet.
+
+    Args:
+        format_key (str): "csv", "parquet" eller "xlsx".
+        dataframe (pd.DataFrame | None): Resultatet, hvis det ligger i meldingen.
+        sql_query (str | None): SQL-en som ga resultatet; brukes når dataframe er None.
+        chunk_rows (int): Antall rader som kodes om gangen.
+
+    Returns:
+        io.BytesIO: Den ferdige filen, spolt tilbake til start.
+    """
+    if dataframe is not None:
+        chunks = _chunks_from_result(_result_from_dataframe(dataframe), chunk_rows)
+    elif sql_query:
+        chunks = stream_result_chunks(sql_query, chunk_rows)
+    else:
+        raise ValueError("Trenger enten en DataFrame eller en SQL-spørring for å eksportere.")
+
+    rows_exported = 0
+
+    def counted(chunks: Iterator[QueryResult]) -> Iterator[QueryResult]:
+        nonlocal rows_exported
+        for chunk in chunks:
+            rows_exported += chunk.row_count
+            yield chunk
+
+    output = io.BytesIO()
+    _WRITERS[format_key](counted(chunks), output)
+    output.seek(0)
+    logger.info(
+        f"Exported {rows_exported} rows as {format_key} "
+        f"({output.getbuffer().nbytes / 1024:.0f} KB, {chunk_rows} rows per chunk)"
+    )
+    return output
+
+
+def export_file_name(format_key: str, stem: str = "query_result") -> str:
+    return f"{stem}.{EXPORT_FORMATS[format_key].extension}"
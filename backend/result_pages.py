@@ -0,0 +1,213 @@
+import re
+from dataclasses import dataclass, replace
+
+from backend.db_client import QueryResult, engine
+from backend.result_cache import cached_fetch_result, result_cache, tokenize_sql
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUBQUERY_ALIAS = "_page_source"
+
+_ORDER_BY_RE = re.compile(r"\border\s+by\b", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"\b(limit|offset|fetch)\b", re.IGNORECASE)
+_DIRECTION_RE = re.compile(r"\s+(asc|desc)(\s+nulls\s+(first|last))?$", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class PageRequest:
+    """
+    Hvilken visning av et resultat som skal bla i: SQL-en pluss sortering og filter.
+    `columns` er kolonnene i resultatet; alle brukes til slutt i ORDER BY, så
+    rekkefølgen er entydig og sider ikke overlapper eller hopper over rader.
+    """
+
+    sql: str
+    columns: tuple[str, ...] = ()
+    sort_column: str | None = None
+    descending: bool = False
+    filter_column: str | None = None
+    filter_text: str | None = None
+
+    @property
+    def is_plain(self) -> bool:
+        return self.sort_column is None and not (self.filter_column and self.filter_text)
+
+
+@dataclass
+class Page:
+    result: QueryResult
+    offset: int
+    has_more: bool
+    total_rows: int | None
+
+
+def _quote(identifier: str) -> str:
+    return engine.dialect.identifier_preparer.quote(identifier)
+
+
+def _string_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _base_sql(request: PageRequest) -> str:
+    return request.sql.strip().rstrip(";")
+
+
+def _mask_nested(sql_query: str) -> str:
+    """
+    SQL-en med samme lengde, der strenger, identifikatorer og alt inne i parenteser
+    er byttet ut med _ og kommentarer med mellomrom, så nøkkelord og komma på
+    øverste nivå kan finnes med regex.
+    """
+    chars: list[str] = []
+    depth = 0
+    for kind, token in tokenize_sql(sql_query):
+        if kind in ("line_comment", "block_comment"):
+            chars.append(" " * len(token))
+        elif kind in ("string", "ident") or (kind == "space" and depth > 0):
+            chars.append("_" * len(token))
+        else:
+            for char in token:
+                if char == ")":
+                    depth = max(depth - 1, 0)
+                chars.append(char if depth == 0 else "_")
+                if char == "(":
+                    depth += 1
+    return "".join(chars)
+
+
+def _top_level_order_by(sql_query: str) -> tuple[list[str] | None, bool]:
+    """
+    Finner ORDER BY-leddene på øverste nivå i spørringen.
+
+    Returns:
+        tuple[list[str] | None, bool]: Leddene (None uten ORDER BY) og om spørringen
+            har LIMIT/OFFSET/FETCH på øverste nivå.
+    """
+    masked = _mask_nested(sql_query)
+    matches = list(_ORDER_BY_RE.finditer(masked))
+    order_by = matches[-1] if matches else None
+    limit = _LIMIT_RE.search(masked, order_by.end() if order_by else 0)
+    if order_by is None:
+        return None, limit is not None
+    end = limit.start() if limit else len(sql_query)
+    terms, start = [], order_by.end()
+    for comma in re.finditer(",", masked[start:end]):
+        terms.append(sql_query[start:order_by.end() + comma.start()].strip())
+        start = order_by.end() + comma.end()
+    terms.append(sql_query[start:end].strip())
+    return terms, limit is not None
+
+
+def _unquote(name: str) -> str:
+    return name[1:-1].replace('""', '"') if len(name) > 1 and name[0] == name[-1] == '"' else name
+
+
+def _order_term_as_output_column(term: str, columns: tuple[str, ...]) -> str | None:
+    """
+    Oversetter et ORDER BY-ledd i den opprinnelige spørringen til kolonnenummer i
+    resultatet, så det kan brukes utenfor underspørringen. None hvis det ikke går.
+    """
+    direction = _DIRECTION_RE.search(term)
+    expression = term[:direction.start()] if direction else term
+    suffix = direction.group(0) if direction else ""
+    expression = " ".join(expression.split())
+    if expression.isdigit():
+        return f"{int(expression)}{suffix}" if 1 <= int(expression) <= len(columns) else None
+    candidates = {expression.casefold(), _unquote(expression).casefold(), _unquote(expression.rsplit(".", 1)[-1]).casefold()}
+    for position, column in enumerate(columns, start=1):
+        if " ".join(column.split()).casefold() in candidates:
+            return f"{position}{suffix}"
+    return None
+
+
+def _filtered_sql(request: PageRequest) -> str:
+    """Den opprinnelige spørringen som underspørring, med filteret lagt på i SQL."""
+    sql = f"SELECT * FROM ({_base_sql(request)}) AS {SUBQUERY_ALIAS}"
+    if request.filter_column and request.filter_text:
+        sql += (
+            f" WHERE LOWER(CAST({_quote(request.filter_column)} AS TEXT)) "
+            f"LIKE {_string_literal('%' + request.filter_text.lower() + '%')}"
+        )
+    return sql
+
+
+def _source_sql(request: PageRequest) -> str:
+    """
+    Visningen som SQL med entydig rekkefølge. Valgt sortering (eller spørringens
+    egen ORDER BY) kommer først, og til slutt alle kolonnene som tiebreaker.
+    """
+    tiebreaker = [str(position) for position in range(1, len(request.columns) + 1)]
+    base = _base_sql(request)
+    inner_order, has_limit = _top_level_order_by(base)
+
+    if request.is_plain and not has_limit:
+        # Spørringens egen ORDER BY gjelder direkte og utvides bare med tiebreakeren.
+        if not tiebreaker:
+            return base
+        if inner_order is None:
+            return f"{base}\nORDER BY {', '.join(tiebreaker)}"
+        return f"{base}\n, {', '.join(tiebreaker)}"
+
+    if request.sort_column:
+        order = [f"{_quote(request.sort_column)} {'DESC' if request.descending else 'ASC'}"]
+    else:
+        # En ORDER BY inne i en underspørring gjelder ikke nødvendigvis utenfor den.
+        order = []
+        for term in inner_order or []:
+            mapped = _order_term_as_output_column(term, request.columns)
+            if mapped is None:
+                logger.info(f"Kan ikke bruke ORDER BY-leddet '{term}' utenfor underspørringen; sorterer på kolonnene.")
+                break
+            order.append(mapped)
+    order += tiebreaker
+    sql = _filtered_sql(request)
+    return f"{sql} ORDER BY {', '.join(order)}" if order else sql
+
+
+def build_page_sql(request: PageRequest, offset: int, limit: int) -> str:
+    return f"{_source_sql(request)} LIMIT {int(limit)} OFFSET {int(offset)}"
+
+
+def build_count_sql(request: PageRequest) -> str:
+    return f"SELECT COUNT(*) FROM ({_filtered_sql(request)}) AS {SUBQUERY_ALIAS}_count"
+
+
+def _slice(result: QueryResult, start: int, stop: int) -> QueryResult:
+    return replace(result, column_data=[values[start:stop] for values in result.column_data])
+
+
+def fetch_page(request: PageRequest, page: int, page_size: int, prefetch_pages: int) -> Page:
+    """
+    Henter én side av resultatet.
+
+    Uten sortering og filter brukes det fulle resultatet fra resultatcachen hvis det
+    finnes der. Ellers hentes et vindu på `prefetch_pages` sider med LIMIT/OFFSET
+    (cachet i resultatcachen), slik at neste sider ikke krever ny spørring.
+
+    Returns:
+        Page: Radene på siden, om det finnes flere, og totalt antall rader hvis det er kjent.
+    """
+    offset = page * page_size
+    if request.is_plain and result_cache is not None:
+        full = result_cache.get(request.sql)
+        if full is not None and not full.truncated:
+            return Page(_slice(full, offset, offset + page_size), offset, offset + page_size < full.row_count, full.row_count)
+
+    window_size = page_size * max(prefetch_pages, 1)
+    window_index = offset // window_size
+    window_offset = window_index * window_size
+    window = cached_fetch_result(build_page_sql(request, window_offset, window_size + 1))
+    start = offset - window_offset
+    page_result = _slice(window, start, start + page_size)
+    has_more = window.row_count > start + page_size
+    total_rows = window_offset + window.row_count if window.row_count <= window_size else None
+    return Page(page_result, offset, has_more, total_rows)
+
+
+def count_rows(request: PageRequest) -> int:
+    """Teller radene i visningen med COUNT(*) i SQL (kjøres bare når brukeren ber om det)."""
+    result = cached_fetch_result(build_count_sql(request))
+    return int(result.column_data[0][0]) if result.row_count else 0
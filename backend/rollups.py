@@ -0,0 +1,565 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+from contextlib import closing
+from dataclasses import dataclass, replace
+from threading import Lock, Thread
+
+from sqlalchemy import create_engine, text
+
+from backend.config import (
+    FETCH_BATCH_SIZE,
+    RESULT_CACHE_FALLBACK_TTL_SECONDS,
+    RESULT_CACHE_PROBE_INTERVAL_SECONDS,
+    RESULT_CACHE_VERSION_PROBE,
+    ROLLUP_DB_PATH,
+    ROLLUP_DIMENSION_SETS,
+    ROLLUP_DIMENSIONS,
+    ROLLUP_MAX_TABLES,
+    ROLLUP_SOURCE_TABLE,
+    ROLLUP_VERIFY,
+    ROLLUPS_ENABLED,
+)
+from backend.db_client import QueryResult, engine, fetch_result, register_query_interceptor
+from backend.metrics import CACHE_LOOKUPS
+from backend.result_cache import DataVersionProbe, tokenize_sql
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COUNT_COLUMN = "_rollup_count"
+
+_META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_meta (
+    table_name TEXT PRIMARY KEY,
+    source_table TEXT NOT NULL,
+    dimensions TEXT NOT NULL,
+    data_version TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    built_at REAL NOT NULL,
+    build_ms REAL NOT NULL
+);
+"""
+
+SQL_KEYWORDS = {
+    "select", "distinct", "all", "from", "where", "group", "by", "having", "order", "limit", "offset",
+    "as", "and", "or", "not", "in", "is", "null", "like", "glob", "between", "escape", "collate", "nocase",
+    "asc", "desc", "nulls", "first", "last", "case", "when", "then", "else", "end", "true", "false",
+}
+UNSUPPORTED_KEYWORDS = {
+    "join", "union", "intersect", "except", "over", "window", "with", "into", "values", "exists",
+}
+ALLOWED_FUNCTIONS = {
+    "count", "min", "max", "lower", "upper", "trim", "ltrim", "rtrim", "length", "substr", "substring",
+    "coalesce", "ifnull", "nullif", "replace", "instr",
+}
+CLAUSE_ENDINGS = {"where", "group", "order", "limit", "having"}
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@dataclass
+class RollupTable:
+    table_name: str
+    dimensions: tuple[str, ...]
+    data_version: str
+    row_count: int
+    built_at: float
+    build_ms: float
+
+
+def rollup_table_name(source_table: str, dimensions: tuple[str, ...]) -> str:
+    digest = hashlib.sha1(",".join(dimensions).encode("utf-8")).hexdigest()[:10]
+    return f"rollup_{source_table.lower()}_{digest}"
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _tokens(sql_query: str) -> list[tuple[str, str]]:
+    """Deler SQL i (type, tekst) der type er name, punct, ident, string eller space."""
+    tokens = []
+    for kind, token in tokenize_sql(sql_query):
+        if kind in ("space", "line_comment", "block_comment"):
+            tokens.append(("space", " "))
+        elif kind in ("ident", "string"):
+            tokens.append((kind, token))
+        else:
+            for piece in _PIECE_RE.findall(token):
+                tokens.append(("name" if piece[0].isalnum() or piece[0] == "_" else "punct", piece))
+    return tokens
+
+
+@dataclass
+class _ParsedQuery:
+    tokens: list[tuple[str, str]]
+    dimensions: set[str]
+    table_index: int
+    count_spans: list[tuple[int, int, str | None]]
+    unaliased_count_items: list[tuple[int, int, int]]
+
+
+def parse_rollup_query(sql_query: str, source_table: str, dimensions: list[str]) -> _ParsedQuery | None:
+    """
+    Sjekker om spørringen er en ren aggregering over `source_table` som bare bruker
+    dimensjonskolonner, og finner hvilke dimensjoner den trenger.
+
+    Støttet: én SELECT fra tabellen (med valgfritt alias), WHERE/GROUP BY/HAVING/
+    ORDER BY/LIMIT på dimensjoner, COUNT(*), COUNT(kolonne), COUNT(DISTINCT ...),
+    MIN/MAX og enkle strengfunksjoner. Alt annet (JOIN, underspørringer, SUM/AVG,
+    vindusfunksjoner, ukjente kolonner) gir None.
+
+    Returns:
+        _ParsedQuery | None: Token og metadata for omskriving, eller None.
+    """
+    tokens = _tokens(sql_query.strip().rstrip(";"))
+    significant = [i for i, (kind, _) in enumerate(tokens) if kind != "space"]
+    words = [tokens[i][1].lower() for i in significant]
+    if words.count("select") != 1 or not words or words[0] != "select" or UNSUPPORTED_KEYWORDS.intersection(words):
+        return None
+
+    dims_by_name = {d.lower(): d for d in dimensions}
+
+    def name_of(position: int) -> str:
+        kind, value = tokens[significant[position]]
+        return value[1:-1].replace('""', '"').lower() if kind == "ident" else value.lower()
+
+    try:
+        from_pos = words.index("from")
+    except ValueError:
+        return None
+    if from_pos + 1 >= len(words) or name_of(from_pos + 1) != source_table.lower():
+        return None
+    table_index = significant[from_pos + 1]
+
+    aliases = {source_table.lower()}
+    after_table = from_pos + 2
+    if after_table < len(words) and words[after_table] == "as":
+        after_table += 1
+    if after_table < len(words) and words[after_table] not in CLAUSE_ENDINGS and tokens[significant[after_table]][0] in ("name", "ident"):
+        aliases.add(name_of(after_table))
+        after_table += 1
+    if after_table < len(words) and words[after_table] not in CLAUSE_ENDINGS:
+        return None
+
+    for pos, word in enumerate(words):
+        if word == "as" and pos + 1 < len(words):
+            aliases.add(name_of(pos + 1))
+        elif pos < from_pos and pos + 1 < len(words) and words[pos + 1] in (",", "from") and pos > 0 \
+                and (words[pos - 1] == ")" or name_of(pos - 1) in dims_by_name) \
+                and tokens[significant[pos]][0] in ("name", "ident"):
+            aliases.add(name_of(pos))
+
+    has_aggregate = "distinct" in words or "group" in words
+    needed: set[str] = set()
+    count_spans: list[tuple[int, int, str | None]] = []
+    pos = 0
+    while pos < len(words):
+        kind, _ = tokens[significant[pos]]
+        word = words[pos]
+        is_call = pos + 1 < len(words) and words[pos + 1] == "("
+        if kind == "name" and is_call:
+            if word not in ALLOWED_FUNCTIONS:
+                return None
+            if word in ("count", "min", "max"):
+                has_aggregate = True
+            if word == "count":
+                if pos + 2 < len(words) and words[pos + 2] == "distinct":
+                    pos += 3
+                    continue
+                try:
+                    close = words.index(")", pos + 2)
+                except ValueError:
+                    return None
+                inner = list(range(pos + 2, close))
+                if len(inner) == 3 and words[inner[1]] == "." and name_of(inner[0]) in aliases:
+                    inner = inner[2:]
+                if len(inner) != 1:
+                    return None
+                column = None
+                if name_of(inner[0]) in dims_by_name:
+                    column = dims_by_name[name_of(inner[0])]
+                    needed.add(column)
+                elif words[inner[0]] != "*" and not words[inner[0]].isdigit():
+                    return None
+                count_spans.append((pos, close, column))
+                pos = close + 1
+                continue
+        elif kind in ("name", "ident") and not (kind == "name" and (word in SQL_KEYWORDS or word[0].isdigit())):
+            name = name_of(pos)
+            if name in dims_by_name:
+                needed.add(dims_by_name[name])
+            elif name not in aliases:
+                return None
+        pos += 1
+
+    if not has_aggregate:
+        return None
+
+    # Elementene i SELECT-listen, delt på komma utenfor parenteser.
+    select_start = 1
+    while select_start < from_pos and words[select_start] in ("distinct", "all"):
+        select_start += 1
+    items: list[tuple[int, int]] = []
+    depth = 0
+    item_start = select_start
+    for pos in range(select_start, from_pos + 1):
+        if pos == from_pos or (words[pos] == "," and depth == 0):
+            items.append((item_start, pos - 1))
+            item_start = pos + 1
+        elif words[pos] == "(":
+            depth += 1
+        elif words[pos] == ")":
+            depth -= 1
+
+    # Elementer med COUNT og uten eget alias får navnet sitt fra uttrykket; det må
+    # beholdes når COUNT byttes ut, også når COUNT bare er en del av uttrykket.
+    unaliased_count_items = []
+    for index, (first, last) in enumerate(items):
+        if not any(first <= start <= last for start, _, _ in count_spans):
+            continue
+        last_kind = tokens[significant[last]][0]
+        has_alias = last > first and (
+            words[last - 1] == "as"
+            or (
+                (last_kind == "ident" or (last_kind == "name" and words[last] not in SQL_KEYWORDS))
+                and (words[last - 1] == ")" or tokens[significant[last - 1]][0] in ("name", "ident"))
+            )
+        )
+        if not has_alias:
+            unaliased_count_items.append((index, significant[first], significant[last]))
+
+    return _ParsedQuery(
+        tokens,
+        needed,
+        table_index,
+        [(significant[start], significant[end], column) for start, end, column in count_spans],
+        unaliased_count_items,
+    )
+
+
+def rewrite_for_rollup(parsed: _ParsedQuery, rollup: RollupTable, column_names: list[str] | None = None) -> str:
+    """
+    Bytter tabellen ut med rollup-tabellen og COUNT med sum over radtellingen.
+
+    Hvert SELECT-element med COUNT og uten eget alias får originalnavnet som alias,
+    så kolonnenavnene blir de samme som fra basistabellen.
+
+    Args:
+        parsed (_ParsedQuery): Resultatet fra parse_rollup_query.
+        rollup (RollupTable): Rollupen det skal leses fra.
+        column_names (list[str] | None): Kolonnenavnene originalspørringen gir. Uten
+            dem brukes teksten i SELECT-elementet.
+    """
+    count_column = _quote(ROLLUP_COUNT_COLUMN)
+    replacements: dict[int, tuple[int, str]] = {parsed.table_index: (parsed.table_index, _quote(rollup.table_name))}
+    for start, end, column in parsed.count_spans:
+        if column is None:
+            expression = f"COALESCE(SUM({count_column}), 0)"
+        else:
+            expression = f"COALESCE(SUM(CASE WHEN {_quote(column)} IS NOT NULL THEN {count_column} END), 0)"
+        replacements[start] = (end, expression)
+
+    aliases: dict[int, str] = {}
+    for item_index, first, last in parsed.unaliased_count_items:
+        if column_names is not None and item_index < len(column_names):
+            aliases[last] = column_names[item_index]
+        else:
+            aliases[last] = "".join(value for _, value in parsed.tokens[first:last + 1])
+
+    parts = []
+    index = 0
+    while index < len(parsed.tokens):
+        if index in replacements:
+            end, replacement = replacements[index]
+            parts.append(replacement)
+        else:
+            end = index
+            parts.append(parsed.tokens[index][1])
+        if end in aliases:
+            parts.append(f" AS {_quote(aliases[end])}")
+        index = end + 1
+    return "".join(parts)
+
+
+def result_column_names(sql_query: str, target_engine=engine) -> list[str]:
+    """Kolonnenavnene spørringen gir, uten å hente rader (LIMIT 0 rundt spørringen)."""
+    with target_engine.connect() as connection:
+        return list(connection.execute(text(f"SELECT * FROM ({sql_query}) LIMIT 0")).keys())
+
+
+def _same_result(a: QueryResult, b: QueryResult) -> bool:
+    if a.columns != b.columns or a.row_count != b.row_count:
+        return False
+    return sorted(map(repr, a.iter_rows())) == sorted(map(repr, b.iter_rows()))
+
+
+class RollupManager:
+    """
+    Forhåndsaggregerte COUNT-tabeller for kildetabellen, lagret i en egen SQLite-fil.
+
+    Hver rollup grupperer kildetabellen på en kombinasjon av dimensjoner. Spørringer
+    som bare trenger dimensjoner en rollup har, skrives om til å lese fra den minste
+    slike rollupen. Når dataversjonen endres bygges rollupene på nytt i bakgrunnen,
+    og spørringer går mot basistabellen i mellomtiden.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        source_table: str,
+        dimensions: list[str],
+        dimension_sets: list[list[str]],
+        max_tables: int,
+        version_probe: DataVersionProbe,
+        verify: bool = False,
+    ) -> None:
+        self.path = path
+        self.source_table = source_table
+        self.dimensions = dimensions
+        self.dimension_sets = dimension_sets
+        self.max_tables = max_tables
+        self.version_probe = version_probe
+        self.verify = verify
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.executescript(_META_SCHEMA)
+        self.engine = create_engine(f"sqlite:///{path}")
+        self._tables: dict[str, RollupTable] = self._load_meta()
+        self._lock = Lock()
+        self._build_lock = Lock()
+        self._building = False
+        self.hits = 0
+        self.not_rewritable = 0
+        self.stale_skips = 0
+        self.mismatches = 0
+        self.last_error: str | None = None
+
+    def _load_meta(self) -> dict[str, RollupTable]:
+        with closing(sqlite3.connect(self.path)) as conn:
+            rows = conn.execute(
+                "SELECT table_name, dimensions, data_version, row_count, built_at, build_ms "
+                "FROM rollup_meta WHERE source_table = ?",
+                (self.source_table,),
+            ).fetchall()
+        return {
+            name: RollupTable(name, tuple(json.loads(dims)), version, row_count, built_at, build_ms)
+            for name, dims, version, row_count, built_at, build_ms in rows
+        }
+
+    def choose_dimension_sets(self, statements: list[str] | None = None) -> list[tuple[str, ...]]:
+        """
+        Velger hvilke dimensjonskombinasjoner som skal ha en rollup: alle dimensjoner
+        (kan svare på alt), faste kombinasjoner fra konfigurasjonen og de hyppigste
+        kombinasjonene i kjørt SQL, opptil `max_tables`.
+        """
+        order = {d: i for i, d in enumerate(self.dimensions)}
+
+        def ordered(dims) -> tuple[str, ...]:
+            return tuple(sorted(set(dims), key=order.__getitem__))
+
+        chosen = [ordered(self.dimensions)]
+        for dims in self.dimension_sets:
+            if dims and set(dims) <= set(self.dimensions) and ordered(dims) not in chosen:
+                chosen.append(ordered(dims))
+
+        if statements is None:
+            from backend.index_advisor import load_workload
+            statements = load_workload()
+        usage = Counter()
+        for sql_query in statements:
+            parsed = parse_rollup_query(sql_query, self.source_table, self.dimensions)
+            if parsed is not None and parsed.dimensions:
+                usage[ordered(parsed.dimensions)] += 1
+        for dims, _ in usage.most_common():
+            if len(chosen) >= self.max_tables:
+                break
+            if dims not in chosen:
+                chosen.append(dims)
+        return chosen
+
+    def build(self, dimensions: tuple[str, ...], data_version: str) -> RollupTable:
+        """Bygger (eller erstatter) én rollup-tabell fra kildetabellen."""
+        started = time.perf_counter()
+        name = rollup_table_name(self.source_table, dimensions)
+        source_quote = engine.dialect.identifier_preparer.quote
+        select_list = ", ".join(source_quote(d) for d in dimensions)
+        columns = ", ".join(_quote(d) for d in dimensions)
+        staging = f"{name}_staging"
+        row_count = 0
+        with engine.connect() as source, closing(sqlite3.connect(self.path)) as target:
+            cursor = source.execute(text(
+                f"SELECT {select_list}, COUNT(*) FROM {source_quote(self.source_table)} GROUP BY {select_list}"
+            ))
+            target.execute(f"DROP TABLE IF EXISTS {_quote(staging)}")
+            target.execute(f"CREATE TABLE {_quote(staging)} ({columns}, {_quote(ROLLUP_COUNT_COLUMN)} INTEGER)")
+            insert = f"INSERT INTO {_quote(staging)} VALUES ({', '.join('?' * (len(dimensions) + 1))})"
+            while True:
+                batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not batch:
+                    break
+                target.executemany(insert, [tuple(row) for row in batch])
+                row_count += len(batch)
+            cursor.close()
+            target.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+            target.execute(f"ALTER TABLE {_quote(staging)} RENAME TO {_quote(name)}")
+            target.execute(f"CREATE INDEX IF NOT EXISTS {_quote('idx_' + name)} ON {_quote(name)} ({columns})")
+            build_ms = (time.perf_counter() - started) * 1000
+            target.execute(
+                "INSERT OR REPLACE INTO rollup_meta VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, self.source_table, json.dumps(list(dimensions)), data_version, row_count, time.time(), build_ms),
+            )
+            target.commit()
+        rollup = RollupTable(name, dimensions, data_version, row_count, time.time(), build_ms)
+        logger.info(f"Rollup {name} {dimensions} bygget på {build_ms:.0f} ms ({row_count} rader)")
+        return rollup
+
+    def rebuild(self, statements: list[str] | None = None) -> None:
+        """Bygger alle valgte rollups som mangler eller er utdaterte, og fjerner de som ikke lenger er valgt."""
+        with self._build_lock:
+            self._rebuild_locked(statements)
+
+    def _rebuild_locked(self, statements: list[str] | None) -> None:
+        data_version = self.version_probe.current()
+        wanted = self.choose_dimension_sets(statements)
+        wanted_names = {rollup_table_name(self.source_table, dims) for dims in wanted}
+        for dims in wanted:
+            existing = self._tables.get(rollup_table_name(self.source_table, dims))
+            if existing is None or existing.data_version != data_version:
+                rollup = self.build(dims, data_version)
+                with self._lock:
+                    self._tables[rollup.table_name] = rollup
+        obsolete = [name for name in self._tables if name not in wanted_names]
+        if obsolete:
+            with closing(sqlite3.connect(self.path)) as conn, conn:
+                for name in obsolete:
+                    conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+                    conn.execute("DELETE FROM rollup_meta WHERE table_name = ?", (name,))
+            with self._lock:
+                for name in obsolete:
+                    self._tables.pop(name, None)
+
+    def _rebuild_in_background(self) -> None:
+        try:
+            self.rebuild()
+            self.last_error = None
+        except Exception as e:
+            logger.exception("Rollup rebuild failed")
+            self.last_error = str(e)
+        finally:
+            with self._lock:
+                self._building = False
+
+    def refresh_if_stale(self) -> None:
+        """Starter en bakgrunnsbygging hvis rollups mangler eller dataversjonen er endret."""
+        data_version = self.version_probe.current()
+        with self._lock:
+            fresh = self._tables and all(t.data_version == data_version for t in self._tables.values())
+            if fresh or self._building:
+                return
+            self._building = True
+        logger.info("Rollups are missing or stale, rebuilding in background.")
+        Thread(target=self._rebuild_in_background, name="rollup-rebuild", daemon=True).start()
+
+    def intercept(self, sql_query: str, max_rows: int | None) -> QueryResult | None:
+        """
+        Interceptor for fetch_result: svarer fra en rollup hvis spørringen kan
+        skrives om og rollupen er oppdatert, ellers None (kjøres mot basistabellen).
+        """
+        parsed = parse_rollup_query(sql_query, self.source_table, self.dimensions)
+        if parsed is None:
+            self.not_rewritable += 1
+            return None
+        data_version = self.version_probe.current()
+        with self._lock:
+            candidates = [
+                t for t in self._tables.values()
+                if parsed.dimensions <= set(t.dimensions) and t.data_version == data_version
+            ]
+        if not candidates:
+            self.stale_skips += 1
+            CACHE_LOOKUPS.inc(cache="rollup", result="miss")
+            self.refresh_if_stale()
+            return None
+
+        rollup = min(candidates, key=lambda t: t.row_count)
+        try:
+            expected_columns = result_column_names(sql_query.strip().rstrip(";"))
+            rewritten = rewrite_for_rollup(parsed, rollup, expected_columns)
+            result = fetch_result(rewritten, max_rows=max_rows, target_engine=self.engine, intercept=False)
+        except Exception as e:
+            logger.warning(f"Rollup query failed, using base table instead: {e}. SQL: {sql_query}")
+            CACHE_LOOKUPS.inc(cache="rollup", result="miss")
+            return None
+        if result.columns != expected_columns:
+            self.not_rewritable += 1
+            logger.warning(
+                f"Rollup columns {result.columns} differ from {expected_columns}, using base table. SQL: {rewritten}"
+            )
+            CACHE_LOOKUPS.inc(cache="rollup", result="miss")
+            return None
+        result = replace(result, sql=sql_query, rewritten_sql=rewritten)
+        logger.info(f"Answered from rollup {rollup.table_name} ({rollup.row_count} rader) in {result.elapsed_ms:.1f} ms")
+
+        if self.verify and not result.truncated:
+            base = fetch_result(sql_query, max_rows=max_rows, intercept=False)
+            if not base.truncated and not _same_result(result, base):
+                self.mismatches += 1
+                logger.warning(f"Rollup result differs from base table, using base table. SQL: {sql_query} -> {rewritten}")
+                return base
+        self.hits += 1
+        CACHE_LOOKUPS.inc(cache="rollup", result="hit")
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            tables = [
+                {"table": t.table_name, "dimensions": ", ".join(t.dimensions), "rows": t.row_count,
+                 "build_ms": round(t.build_ms), "data_version": t.data_version}
+                for t in sorted(self._tables.values(), key=lambda t: t.row_count)
+            ]
+            return {
+                "tables": tables,
+                "building": self._building,
+                "hits": self.hits,
+                "not_rewritable": self.not_rewritable,
+                "stale_skips": self.stale_skips,
+                "mismatches": self.mismatches,
+                "last_error": self.last_error,
+            }
+
+
+rollup_manager = RollupManager(
+    ROLLUP_DB_PATH,
+    source_table=ROLLUP_SOURCE_TABLE,
+    dimensions=ROLLUP_DIMENSIONS,
+    dimension_sets=ROLLUP_DIMENSION_SETS,
+    max_tables=ROLLUP_MAX_TABLES,
+    version_probe=DataVersionProbe(
+        RESULT_CACHE_VERSION_PROBE,
+        probe_interval=RESULT_CACHE_PROBE_INTERVAL_SECONDS,
+        fallback_ttl=RESULT_CACHE_FALLBACK_TTL_SECONDS,
+    ),
+    verify=ROLLUP_VERIFY,
+) if ROLLUPS_ENABLED else None
+
+if rollup_manager is not None:
+    register_query_interceptor(rollup_manager.intercept)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if rollup_manager is None:
+        print("Rollups er slått av (ROLLUPS_ENABLED=false).")
+    else:
+        rollup_manager.rebuild()
+        for table in rollup_manager.stats()["tables"]:
+            print(f"{table['table']}: {table['dimensions']} ({table['rows']} rader, {table['build_ms']} ms)")
@@ -0,0 +1,144 @@
+import time
+from threading import Lock
+
+from langchain.agents.mrkl.prompt import FORMAT_INSTRUCTIONS
+from langchain_core.prompts import PromptTemplate
+from sqlalchemy import inspect, text
+
+from backend.config import SCHEMA_CONTEXT_SAMPLE_ROWS, SCHEMA_CONTEXT_MAX_VALUES
+from backend.db_client import TABLES, engine, get_schema_fingerprint
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_VALUE_LENGTH = 50
+
+SCHEMA_CONTEXT_PREFIX = """You are an agent designed to interact with a SQL database.
+Given an input question, create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer.
+Unless the user specifies a specific number of examples they wish to obtain, always limit your query to at most {top_k} results.
+You can order the results by a relevant column to return the most interesting examples in the database.
+Never query for all the columns from a specific table, only ask for the relevant columns given the question.
+You have access to tools for interacting with the database.
+Only use the below tools. Only use the information returned by the below tools to construct your final answer.
+You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
+
+DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
+
+The complete schema of the tables you can query is given below, including column types, the most common values
+of text columns and a few example rows. You do not need to look up tables or schemas; go straight to writing the query.
+
+{schema_context}"""
+
+SCHEMA_CONTEXT_SUFFIX = """Begin!
+
+Question: {input}
+Thought: The schema is given above, so I can write the query directly.
+{agent_scratchpad}"""
+
+
+def _short(value) -> str:
+    value_str = str(value)
+    return value_str if len(value_str) <= MAX_VALUE_LENGTH else value_str[:MAX_VALUE_LENGTH] + "..."
+
+
+class SchemaContextBuilder:
+    """
+    Bygger en kompakt beskrivelse av tabellene i TABLES (DDL, kolonnetyper, vanlige
+    verdier og eksempelrader) som legges rett inn i agentens prompt.
+
+    Teksten bygges én gang og bygges på nytt bare når skjemaets fingeravtrykk endres.
+    """
+
+    def __init__(self, tables: list[str], sample_rows: int, max_values: int) -> None:
+        self.tables = tables
+        self.sample_rows = sample_rows
+        self.max_values = max_values
+        self._text: str | None = None
+        self._fingerprint: str | None = None
+        self.built_at: float | None = None
+        self.build_ms: float = 0.0
+        self._lock = Lock()
+
+    def _describe_table(self, connection, inspector, table: str) -> str:
+        quote = engine.dialect.identifier_preparer.quote
+        columns = inspector.get_columns(table)
+        column_defs = ", ".join(f"{quote(col['name'])} {col['type']}" for col in columns)
+        lines = [f"CREATE TABLE {quote(table)} ({column_defs})"]
+
+        row_count = connection.execute(text(f"SELECT COUNT(*) FROM {quote(table)}")).scalar()
+        lines.append(f"-- {row_count} rows")
+
+        for col in columns:
+            try:
+                is_text = col["type"].python_type is str
+            except NotImplementedError:
+                is_text = False
+            if not is_text:
+                continue
+            values = connection.execute(text(
+                f"SELECT {quote(col['name'])}, COUNT(*) AS n FROM {quote(table)} "
+                f"WHERE {quote(col['name'])} IS NOT NULL "
+                f"GROUP BY {quote(col['name'])} ORDER BY n DESC LIMIT {self.max_values + 1}"
+            )).fetchall()
+            if not values:
+                continue
+            shown = ", ".join(repr(_short(v[0])) for v in values[:self.max_values])
+            more = ", ..." if len(values) > self.max_values else ""
+            lines.append(f"-- {col['name']} values: {shown}{more}")
+
+        if self.sample_rows > 0:
+            rows = connection.execute(text(f"SELECT * FROM {quote(table)} LIMIT {self.sample_rows}")).fetchall()
+            lines.append(f"-- {self.sample_rows} example rows:")
+            lines.append("-- " + " | ".join(col["name"] for col in columns))
+            for row in rows:
+                lines.append("-- " + " | ".join(_short(v) for v in row))
+        return "\n".join(lines)
+
+    def build(self) -> str:
+        started = time.perf_counter()
+        inspector = inspect(engine)
+        with engine.connect() as connection:
+            parts = [self._describe_table(connection, inspector, table) for table in self.tables]
+        self.build_ms = (time.perf_counter() - started) * 1000
+        self.built_at = time.time()
+        context = "\n\n".join(parts)
+        logger.info(f"Skjemakontekst bygget på {self.build_ms:.0f} ms ({len(context)} tegn)")
+        return context
+
+    def get(self) -> str:
+        """Returnerer skjemakonteksten, og bygger den på nytt hvis skjemaet er endret."""
+        fingerprint = get_schema_fingerprint()
+        with self._lock:
+            if self._text is None or fingerprint != self._fingerprint:
+                if self._text is not None:
+                    logger.info("Skjemaet er endret, bygger skjemakonteksten på nytt.")
+                self._text = self.build()
+                self._fingerprint = fingerprint
+            return self._text
+
+    def stats(self) -> dict:
+        return {
+            "fingerprint": self._fingerprint,
+            "built_at": self.built_at,
+            "build_ms": self.build_ms,
+            "chars": len(self._text or ""),
+        }
+
+
+schema_context = SchemaContextBuilder(
+    TABLES,
+    sample_rows=SCHEMA_CONTEXT_SAMPLE_ROWS,
+    max_values=SCHEMA_CONTEXT_MAX_VALUES,
+)
+
+
+def build_schema_context_prompt() -> PromptTemplate:
+    """
+    Lager ReAct-prompten for SQL-agenten med skjemakonteksten innebygd.
+
+    `schema_context` er en delvis variabel med funksjon som verdi, så prompten
+    alltid får siste versjon uten at agenten må bygges på nytt.
+    """
+    template = "\n\n".join([SCHEMA_CONTEXT_PREFIX, "{tools}", FORMAT_INSTRUCTIONS, SCHEMA_CONTEXT_SUFFIX])
+    return PromptTemplate.from_template(template).partial(schema_context=schema_context.get)
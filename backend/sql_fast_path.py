@@ -0,0 +1,135 @@
+import re
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import text
+
+from backend.config import RESULT_PAGER_THRESHOLD_ROWS
+from backend.db_client import QueryResult, engine, fetch_result
+from backend.llm_client import llm
+from backend.sql_safety import read_only_violation
+from backend.schema_context import schema_context
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 1000
+NO_SQL_ANSWER = "NONE"
+
+_CODE_BLOCK_RE = re.compile(r"```(?:sql)?\s*(.*?)```", re.IGNORECASE | re.DOTALL)
+
+
+class FastPathError(Exception):
+    """Kastes når hurtigstien ikke kan besvare spørsmålet, og agenten må ta over."""
+
+
+@dataclass
+class FastPathResult:
+    """SQL generert med ett LLM-kall, med resultatet og tidsbruk per del."""
+
+    sql: str
+    result: QueryResult
+    llm_ms: float
+    validate_ms: float
+    total_ms: float
+
+
+def build_fast_path_prompt(question: str) -> str:
+    return f"""
+    You are an expert {engine.dialect.name} SQL analyst. Write ONE syntactically correct
+    {engine.dialect.name} query that answers the question below, using only the tables
+    and columns described in the schema.
+
+    Rules:
+    - Return only the SQL query, with no explanation and no markdown.
+    - Only a single SELECT statement (CTEs with WITH are allowed). Never modify data.
+    - Never select all columns with *; select only the columns needed to answer the question.
+    - Unless the question asks for a specific number of rows, limit the result to at most {TOP_K} rows.
+    - Use the listed column values exactly as written when filtering text columns.
+    - If the question cannot be answered with a single query against this schema,
+      return exactly {NO_SQL_ANSWER}.
+
+    Schema:
+    {schema_context.get()}
+
+    Question: {question}
+    SQL:
+    """
+
+
+def extract_sql(llm_output: str) -> str:
+    """Henter SQL-en ut av LLM-svaret (fjerner eventuelle markdown-kodeblokker)."""
+    match = _CODE_BLOCK_RE.search(llm_output)
+    sql_query = match.group(1) if match else llm_output
+    return sql_query.strip().rstrip(";").strip()
+
+
+def validate_sql(sql_query: str) -> None:
+    """
+    Sjekker lokalt at SQL-en er én enkelt lesespørring, og lar databasen
+    planlegge den med EXPLAIN uten å kjøre den.
+
+    Raises:
+        FastPathError: Hvis SQL-en ikke er gyldig eller ikke er en ren lesespørring.
+    """
+    if not sql_query or sql_query.upper() == NO_SQL_ANSWER:
+        raise FastPathError("LLM-en fant ingen enkeltspørring som svarer på spørsmålet.")
+
+    violation = read_only_violation(sql_query)
+    if violation:
+        raise FastPathError(violation)
+
+    explain = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+    try:
+        with engine.connect() as connection:
+            connection.execute(text(f"{explain} {sql_query}")).fetchall()
+    except Exception as e:
+        raise FastPathError(f"Databasen avviste SQL-en: {e}") from e
+
+
+def run_fast_path(question: str, callbacks: list[Any] | None = None) -> FastPathResult:
+    """
+    Genererer SQL med ett LLM-kall, validerer og kjører den.
+
+    Args:
+        question (str): Brukerens spørsmål.
+        callbacks (list | None): Callbacks til LLM-kallet (token- og fremdriftssporing).
+
+    Returns:
+        FastPathResult: SQL-en og resultatet.
+
+    Raises:
+        FastPathError: Hvis LLM-kallet, valideringen eller kjøringen feiler.
+    """
+    started = time.perf_counter()
+    try:
+        response = llm.invoke(build_fast_path_prompt(question), config={"callbacks": callbacks or []})
+    except Exception as e:
+        raise FastPathError(f"LLM-kallet feilet: {e}") from e
+    llm_done = time.perf_counter()
+
+    content = response.content if hasattr(response, "content") else str(response)
+    sql_query = extract_sql(content)
+    validate_sql(sql_query)
+    validated = time.perf_counter()
+
+    try:
+        # Flere rader enn grensen blas i fra databasen, så resten trengs ikke her.
+        result = fetch_result(sql_query, max_rows=RESULT_PAGER_THRESHOLD_ROWS + 1)
+    except Exception as e:
+        raise FastPathError(f"Kjøring av SQL feilet: {e}") from e
+
+    fast_path_result = FastPathResult(
+        sql=sql_query,
+        result=result,
+        llm_ms=(llm_done - started) * 1000,
+        validate_ms=(validated - llm_done) * 1000,
+        total_ms=(time.perf_counter() - started) * 1000,
+    )
+    logger.info(
+        f"Fast path answered in {fast_path_result.total_ms:.0f} ms "
+        f"(LLM {fast_path_result.llm_ms:.0f} ms, validering {fast_path_result.validate_ms:.0f} ms)"
+    )
+    return fast_path_result
@@ -0,0 +1,37 @@
+import re
+
+from backend.result_cache import tokenize_sql
+
+ALLOWED_FIRST_KEYWORDS = ("select", "with")
+FORBIDDEN_KEYWORDS = {
+    "insert", "update", "delete", "merge", "upsert", "drop", "alter", "create",
+    "truncate", "attach", "detach", "pragma", "vacuum", "reindex", "grant",
+    "revoke", "copy", "call", "exec", "execute",
+}
+
+_WORD_RE = re.compile(r"[a-z_]+")
+
+
+def read_only_violation(sql_query: str) -> str | None:
+    """
+    Sjekker lokalt, uten databasen, at SQL-en er én enkelt lesespørring.
+
+    Args:
+        sql_query (str): SQL-en som skal sjekkes.
+
+    Returns:
+        str | None: Hvorfor SQL-en ikke er tillatt, eller None hvis den er en ren lesespørring.
+    """
+    words: list[str] = []
+    for kind, token in tokenize_sql(sql_query):
+        if kind in ("word", "char") and ";" in token:
+            return "SQL-en inneholder flere setninger."
+        if kind == "word":
+            words.extend(_WORD_RE.findall(token.lower()))
+
+    if not words or words[0] not in ALLOWED_FIRST_KEYWORDS:
+        return f"SQL-en er ikke en SELECT-spørring: {sql_query[:80]}"
+    forbidden = FORBIDDEN_KEYWORDS.intersection(words)
+    if forbidden:
+        return f"SQL-en inneholder ikke-tillatte nøkkelord: {', '.join(sorted(forbidden))}"
+    return None
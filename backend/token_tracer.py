@@ -1,4 +1,7 @@
 import logging
+import time
+from collections import deque
+from threading import Lock
 from typing import Any, List, Dict, Optional, Union
 from uuid import UUID
 
@@ -6,18 +9,146 @@ from langchain_core.callbacks.base import BaseCallbackHandler
 from langchain_core.outputs import LLMResult, ChatGeneration, Generation
 from langchain_core.messages import AIMessage
 
+from backend.config import TOKEN_TRACE_MAX_STEPS
+from backend.metrics import LLM_CALLS, LLM_ERRORS, LLM_LATENCY, LLM_TOKENS
+
 logger = logging.getLogger(__name__)
 
+
+class TraceEvent:
+    """
+    Ett callback-event i kompakt form. UUID-er og verdier lagres som de er;
+    dict-formen i get_report() bygges først når noen ber om den.
+    """
+
+    __slots__ = ("kind", "run_id", "parent_run_id", "name", "payload", "at")
+
+    def __init__(
+        self,
+        kind: str,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        name: Optional[str] = None,
+        payload: Any = None,
+    ) -> None:
+        self.kind = kind
+        self.run_id = run_id
+        self.parent_run_id = parent_run_id
+        self.name = name
+        self.payload = payload
+        self.at = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        step: Dict[str, Any] = {
+            "type": self.kind,
+            "run_id": str(self.run_id),
+            "parent_run_id": str(self.parent_run_id) if self.parent_run_id else None,
+        }
+        kind, payload = self.kind, self.payload
+        if kind == "llm_start":
+            step["llm_type"] = self.name
+        elif kind == "llm_end":
+            (step["tokens_used_this_step"], step["prompt_tokens_this_step"], step["completion_tokens_this_step"],
+             step["cumulative_total_tokens"], step["cumulative_prompt_tokens"], step["cumulative_completion_tokens"],
+             step["token_info_source"]) = payload
+        elif kind in ("llm_error", "chain_error"):
+            step["error"] = payload
+        elif kind == "tool_start":
+            step["name"] = self.name
+            step["input_str"] = payload
+        elif kind == "tool_error":
+            step["name"] = self.name
+            step["error"] = payload
+        elif kind == "agent_action":
+            step["tool"] = self.name
+            step["tool_input"], step["log"] = payload
+        elif kind == "agent_finish":
+            step["return_values"] = payload
+        else:
+            step["name"] = self.name
+        return step
+
+
+class RunRecord:
+    """
+    En kjøring (LLM, kjede eller verktøy) slått opp på run_id, med monotone start- og sluttider.
+    `depth` er antall åpne foreldre da kjøringen startet.
+    """
+
+    __slots__ = ("kind", "name", "parent_run_id", "depth", "started_at", "ended_at", "error")
+
+    def __init__(self, kind: str, name: str, parent_run_id: Optional[UUID], depth: int = 0) -> None:
+        self.kind = kind
+        self.name = name
+        self.parent_run_id = parent_run_id
+        self.depth = depth
+        self.started_at = time.monotonic()
+        self.ended_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+
 class TokenUsageCallbackHandler(BaseCallbackHandler):
-    def __init__(self) -> None:
+    """
+    Teller tokens og LLM-kall for én forespørsel og holder en historikk over
+    callback-eventene.
+
+    Åpne kjøringer ligger i en tabell indeksert på run_id, så slutt-eventer finner
+    navnet sitt uten å lete gjennom historikken, og hver kjøring får start- og
+    sluttid (time.monotonic) til tidslinjen i `get_timings()`. Ferdige kjøringer flyttes
+    til en egen liste. Både den og historikken er ringbuffere når `max_steps`
+    (TOKEN_TRACE_MAX_STEPS) er satt, ellers beholdes alt.
+    """
+
+    def __init__(self, max_steps: Optional[int] = TOKEN_TRACE_MAX_STEPS) -> None:
         super().__init__()
         self.total_tokens_used: int = 0
         self.prompt_tokens_used: int = 0
         self.completion_tokens_used: int = 0
         self.successful_llm_requests: int = 0
         self.llm_errors: int = 0
-        self.steps: List[Dict[str, Any]] = []
-        self._current_chain_ids: List[UUID] = []
+        self.max_steps = max_steps or None
+        self.steps: deque[TraceEvent] = deque(maxlen=self.max_steps)
+        self.events_recorded: int = 0
+        self._runs: Dict[UUID, RunRecord] = {}
+        self._finished_runs: deque[tuple[UUID, RunRecord]] = deque(maxlen=self.max_steps)
+
+    def _record(self, kind: str, run_id: UUID, parent_run_id: Optional[UUID], name: Optional[str] = None, payload: Any = None) -> None:
+        self.steps.append(TraceEvent(kind, run_id, parent_run_id, name, payload))
+        self.events_recorded += 1
+
+    def _start_run(self, kind: str, run_id: UUID, parent_run_id: Optional[UUID], name: str) -> None:
+        parent = self._runs.get(parent_run_id) if parent_run_id else None
+        self._runs[run_id] = RunRecord(kind, name, parent_run_id, parent.depth + 1 if parent is not None else 0)
+
+    def _finish_run(self, run_id: UUID, error: Optional[str] = None) -> Optional[RunRecord]:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        run.ended_at = time.monotonic()
+        run.error = error
+        self._finished_runs.append((run_id, run))
+        return run
+
+    def _end_run(self, run_id: UUID, default_name: str, error: Optional[str] = None) -> str:
+        run = self._finish_run(run_id, error)
+        return run.name if run is not None else default_name
+
+    def _observe_llm_call(self, run: Optional[RunRecord], prompt_tokens: int, completion_tokens: int) -> None:
+        """Fører et fullført LLM-kall inn i de prosessfelles metrikkene."""
+        LLM_CALLS.inc()
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        if run is not None:
+            LLM_LATENCY.observe(run.ended_at - run.started_at)
+
+    def _all_runs(self) -> List[tuple[UUID, RunRecord]]:
+        """Ferdige (innenfor ringbufferen) og åpne kjøringer, i startrekkefølge."""
+        return sorted([*self._finished_runs, *self._runs.items()], key=lambda item: item[1].started_at)
+
+    @property
+    def dropped_steps(self) -> int:
+        """Antall eventer som er skjøvet ut av ringbufferen."""
+        return self.events_recorded - len(self.steps)
 
     def on_llm_start(
         self,
@@ -31,13 +162,9 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         llm_type = serialized.get("id", ["<unknown_llm>"])[-1] if serialized and serialized.get("id") else "<unknown_llm>"
-        logger.info(f"LLM Start (Run ID: {run_id}, Type: {llm_type})")
-        self.steps.append({
-            "type": "llm_start",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "llm_type": llm_type,
-        })
+        logger.info("LLM Start (Run ID: %s, Type: %s)", run_id, llm_type)
+        self._start_run("llm", run_id, parent_run_id, llm_type)
+        self._record("llm_start", run_id, parent_run_id, llm_type)
 
     def on_llm_end(
         self,
@@ -88,11 +215,10 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
             self.prompt_tokens_used += step_prompt_tokens
             self.completion_tokens_used += step_completion_tokens
             self.total_tokens_used += step_total_tokens
-            log_msg = (
-                f"LLM End (Run ID: {run_id}). Tokens this step: Total={step_total_tokens} "
-                f"(P={step_prompt_tokens}, C={step_completion_tokens}). Source: {token_info_source}."
+            logger.info(
+                "LLM End (Run ID: %s). Tokens this step: Total=%d (P=%d, C=%d). Source: %s.",
+                run_id, step_total_tokens, step_prompt_tokens, step_completion_tokens, token_info_source,
             )
-            logger.info(log_msg)
         else:
             warning_msg = f"LLM End (Run ID: {run_id}). Could not extract token usage for this LLM step. "
             if response.generations and isinstance(response.generations[0][0], ChatGeneration) and \
@@ -119,22 +245,17 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
 
 
         logger.info(
-            f"Cumulative tokens after LLM call (Run ID: {run_id}): Total={self.total_tokens_used} "
-            f"(Prompt={self.prompt_tokens_used}, Completion={self.completion_tokens_used})"
+            "Cumulative tokens after LLM call (Run ID: %s): Total=%d (Prompt=%d, Completion=%d)",
+            run_id, self.total_tokens_used, self.prompt_tokens_used, self.completion_tokens_used,
         )
 
-        self.steps.append({
-            "type": "llm_end",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "tokens_used_this_step": step_total_tokens,
-            "prompt_tokens_this_step": step_prompt_tokens,
-            "completion_tokens_this_step": step_completion_tokens,
-            "cumulative_total_tokens": self.total_tokens_used,
-            "cumulative_prompt_tokens": self.prompt_tokens_used,
-            "cumulative_completion_tokens": self.completion_tokens_used,
-            "token_info_source": token_info_source,
-        })
+        run = self._finish_run(run_id)
+        self._observe_llm_call(run, step_prompt_tokens, step_completion_tokens)
+        self._record("llm_end", run_id, parent_run_id, payload=(
+            step_total_tokens, step_prompt_tokens, step_completion_tokens,
+            self.total_tokens_used, self.prompt_tokens_used, self.completion_tokens_used,
+            token_info_source,
+        ))
 
     def on_llm_error(
         self,
@@ -145,13 +266,10 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         **kwargs: Any,
     ) -> None:
         self.llm_errors += 1
+        LLM_ERRORS.inc()
         logger.error(f"LLM Error (Run ID: {run_id}): {error}", exc_info=True)
-        self.steps.append({
-            "type": "llm_error",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "error": str(error)
-        })
+        self._end_run(run_id, "<unknown_llm>", error=str(error))
+        self._record("llm_error", run_id, parent_run_id, payload=str(error))
 
     def on_chain_start(
         self,
@@ -164,21 +282,15 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         metadata: Optional[Dict[str, Any]] = None,
         **kwargs: Any,
     ) -> None:
-        self._current_chain_ids.append(run_id)
         if serialized is None:
-            logger.info(f"Chain Start (Run ID: {run_id}): Received None for 'serialized' object. Cannot determine chain name.")
-            chain_name = "<unknown_chain_type_due_to_none_serialized>"
+            chain_name = kwargs.get("name") or "<unknown_chain_type_due_to_none_serialized>"
         else:
             chain_name_parts = serialized.get("id", ["<unknown_chain>"])
             chain_name = chain_name_parts[-1] if chain_name_parts else "<unknown_chain>"
         
-        logger.info(f"Chain Start (Run ID: {run_id}, Name: {chain_name}).")
-        self.steps.append({
-            "type": "chain_start",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "name": chain_name,
-        })
+        logger.info("Chain Start (Run ID: %s, Name: %s).", run_id, chain_name)
+        self._start_run("chain", run_id, parent_run_id, chain_name)
+        self._record("chain_start", run_id, parent_run_id, chain_name)
 
     def on_chain_end(
         self,
@@ -188,22 +300,9 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        if self._current_chain_ids and self._current_chain_ids[-1] == run_id:
-            self._current_chain_ids.pop()
-        
-        chain_name = "<unknown_chain_ended>"
-        for step in reversed(self.steps): 
-            if step.get("run_id") == str(run_id) and step.get("type") == "chain_start":
-                chain_name = step.get("name", chain_name)
-                break
-        
-        logger.info(f"Chain End (Run ID: {run_id}, Name: {chain_name}).") 
-        self.steps.append({
-            "type": "chain_end",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "name": chain_name,
-        })
+        chain_name = self._end_run(run_id, "<unknown_chain_ended>")
+        logger.info("Chain End (Run ID: %s, Name: %s).", run_id, chain_name)
+        self._record("chain_end", run_id, parent_run_id, chain_name)
 
     def on_chain_error(
         self,
@@ -213,15 +312,9 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        if self._current_chain_ids and self._current_chain_ids[-1] == run_id:
-            self._current_chain_ids.pop()
+        self._end_run(run_id, "<unknown_chain_errored>", error=str(error))
         logger.error(f"Chain Error (Run ID: {run_id}): {error}", exc_info=True)
-        self.steps.append({
-            "type": "chain_error",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "error": str(error)
-        })
+        self._record("chain_error", run_id, parent_run_id, payload=str(error))
 
     def on_tool_start(
         self,
@@ -240,14 +333,9 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         else:
             tool_name = serialized.get("name", serialized.get("id", ["<unknown_tool>"])[-1])
             
-        logger.info(f"Tool Start (Run ID: {run_id}, Name: {tool_name}). Input: '{input_str}'")
-        self.steps.append({
-            "type": "tool_start",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "name": tool_name,
-            "input_str": input_str
-        })
+        logger.info("Tool Start (Run ID: %s, Name: %s). Input: '%s'", run_id, tool_name, input_str)
+        self._start_run("tool", run_id, parent_run_id, tool_name)
+        self._record("tool_start", run_id, parent_run_id, tool_name, input_str)
 
     def on_tool_end(
         self,
@@ -257,18 +345,9 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        tool_name = "<unknown_tool_ended>"
-        for step in reversed(self.steps):
-            if step.get("run_id") == str(run_id) and step.get("type") == "tool_start":
-                tool_name = step.get("name", tool_name)
-                break
-        logger.info(f"Tool End (Run ID: {run_id}, Name: {tool_name}). Output length: {len(output)}")
-        self.steps.append({
-            "type": "tool_end",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "name": tool_name, 
-        })
+        tool_name = self._end_run(run_id, "<unknown_tool_ended>")
+        logger.info("Tool End (Run ID: %s, Name: %s). Output length: %d", run_id, tool_name, len(output))
+        self._record("tool_end", run_id, parent_run_id, tool_name)
 
     def on_tool_error(
         self,
@@ -278,19 +357,9 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        tool_name = "<unknown_tool_errored>"
-        for step in reversed(self.steps):
-            if step.get("run_id") == str(run_id) and step.get("type") == "tool_start":
-                tool_name = step.get("name", tool_name)
-                break
+        tool_name = self._end_run(run_id, "<unknown_tool_errored>", error=str(error))
         logger.error(f"Tool Error (Run ID: {run_id}, Name: {tool_name}): {error}", exc_info=True)
-        self.steps.append({
-            "type": "tool_error",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "name": tool_name, 
-            "error": str(error)
-        })
+        self._record("tool_error", run_id, parent_run_id, tool_name, str(error))
     
     def on_agent_action(
         self,
@@ -300,16 +369,10 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        tool_log = action.log.strip().replace('\n', ' ')
-        logger.info(f"Agent Action (Run ID: {run_id}): Tool: {action.tool}, Input: '{action.tool_input}', Log: '{tool_log}'")
-        self.steps.append({
-            "type": "agent_action",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "tool": action.tool,
-            "tool_input": action.tool_input,
-            "log": action.log 
-        })
+        if logger.isEnabledFor(logging.INFO):
+            tool_log = action.log.strip().replace('\n', ' ')
+            logger.info(f"Agent Action (Run ID: {run_id}): Tool: {action.tool}, Input: '{action.tool_input}', Log: '{tool_log}'")
+        self._record("agent_action", run_id, parent_run_id, action.tool, (action.tool_input, action.log))
 
     def on_agent_finish(
         self,
@@ -319,30 +382,264 @@ class TokenUsageCallbackHandler(BaseCallbackHandler):
         parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        logger.info(f"Agent Finish (Run ID: {run_id}). Return values: {finish.return_values}")
-        self.steps.append({
-            "type": "agent_finish",
-            "run_id": str(run_id),
-            "parent_run_id": str(parent_run_id) if parent_run_id else None,
-            "return_values": finish.return_values
-        })
+        logger.info("Agent Finish (Run ID: %s). Return values: %s", run_id, finish.return_values)
+        self._record("agent_finish", run_id, parent_run_id, payload=finish.return_values)
 
-    def get_report(self) -> Dict[str, Any]:
+    def get_timings(self) -> List[Dict[str, Any]]:
+        """
+        Start og varighet for hver kjøring, i millisekunder fra første start, i
+        startrekkefølge. `depth` er antall foreldre (via parent_run_id), så tidslinjen
+        kan vises som et nøstet fossefallsdiagram. Med `max_steps` satt er bare de
+        siste ferdige kjøringene med.
+        """
+        runs = self._all_runs()
+        if not runs:
+            return []
+        origin = runs[0][1].started_at
+        now = time.monotonic()
+        timings = []
+        for run_id, run in runs:
+            ended_at = run.ended_at if run.ended_at is not None else now
+            timings.append({
+                "run_id": str(run_id),
+                "parent_run_id": str(run.parent_run_id) if run.parent_run_id else None,
+                "kind": run.kind,
+                "name": run.name,
+                "depth": run.depth,
+                "start_ms": (run.started_at - origin) * 1000,
+                "duration_ms": (ended_at - run.started_at) * 1000,
+                "finished": run.ended_at is not None,
+                "error": run.error,
+            })
+        return timings
+
+    def llm_time_ms(self) -> float:
+        """Samlet tid i LLM-kall; overlappende kall telles bare én gang."""
+        intervals = sorted(
+            (run.started_at, run.ended_at if run.ended_at is not None else time.monotonic())
+            for _, run in self._all_runs() if run.kind == "llm"
+        )
+        total = 0.0
+        current_start, current_end = None, None
+        for start, end in intervals:
+            if current_end is None or start > current_end:
+                if current_end is not None:
+                    total += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        if current_end is not None:
+            total += current_end - current_start
+        return total * 1000
+
+    def get_summary(self) -> Dict[str, Any]:
+        """Som get_report(), men uten detailed_steps (billig å logge)."""
         return {
             "total_tokens_used": self.total_tokens_used,
             "prompt_tokens_used": self.prompt_tokens_used,
             "completion_tokens_used": self.completion_tokens_used,
             "successful_llm_requests": self.successful_llm_requests,
             "llm_errors": self.llm_errors,
-            "detailed_steps": self.steps 
         }
 
+    def get_report(self) -> Dict[str, Any]:
+        return {**self.get_summary(), "detailed_steps": [event.to_dict() for event in self.steps]}
+
     def reset(self) -> None:
         self.total_tokens_used = 0
         self.prompt_tokens_used = 0
         self.completion_tokens_used = 0
         self.successful_llm_requests = 0
         self.llm_errors = 0
-        self.steps = []
-        self._current_chain_ids = []
+        self.steps = deque(maxlen=self.max_steps)
+        self.events_recorded = 0
+        self._runs = {}
+        self._finished_runs = deque(maxlen=self.max_steps)
         logger.info("TokenUsageCallbackHandler has been reset.")
+
+
+TOOL_STEP_LABELS = {
+    "sql_db_list_tables": "Lister tabeller",
+    "sql_db_schema": "Henter tabellskjema",
+    "sql_db_query_checker": "Sjekker SQL",
+    "sql_db_query": "Kjører SQL-spørring",
+}
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+ACTION_INPUT_MARKER = "Action Input:"
+SQL_QUERY_TOOL = "sql_db_query"
+# Så mange tegn fra før et nytt token må søkes sammen med det for å finne en markør som går over token-grensen.
+_MARKER_OVERLAP = max(len(FINAL_ANSWER_MARKER), len(ACTION_INPUT_MARKER), len(SQL_QUERY_TOOL)) - 1
+
+
+class LlmTextStream:
+    """
+    Teksten fra ett LLM-kall, lagret som tokens, og det som er funnet etter markørene.
+
+    Hvert nytt token søkes bare sammen med de siste tegnene før det, og etter at en
+    markør er funnet legges tokens rett til svaret eller SQL-utkastet. Kostnaden per
+    token er dermed konstant i stedet for å vokse med teksten; strengene bygges
+    først når noen ber om dem.
+    """
+
+    __slots__ = ("tokens", "tail", "sql_tool_seen", "action_input_seen", "draft_tokens", "answer_tokens")
+
+    def __init__(self) -> None:
+        self.tokens: List[str] = []
+        self.tail = ""
+        self.sql_tool_seen = False
+        self.action_input_seen = False
+        self.draft_tokens: Optional[List[str]] = None
+        self.answer_tokens: Optional[List[str]] = None
+
+    def add(self, token: str) -> str:
+        """Legger til et token og returnerer hva det endret: "answer", "draft" eller ""."""
+        self.tokens.append(token)
+        if self.answer_tokens is not None:
+            self.answer_tokens.append(token)
+            return "answer"
+
+        window = self.tail + token
+        self.tail = window[-_MARKER_OVERLAP:]
+        answer_at = window.find(FINAL_ANSWER_MARKER)
+        if answer_at != -1:
+            self.answer_tokens = [window[answer_at + len(FINAL_ANSWER_MARKER):]]
+            return "answer"
+
+        if self.draft_tokens is not None:
+            self.draft_tokens.append(token)
+            return "draft"
+        if self.action_input_seen:
+            return ""
+        input_at = window.find(ACTION_INPUT_MARKER)
+        if not self.sql_tool_seen:
+            self.sql_tool_seen = SQL_QUERY_TOOL in (window if input_at == -1 else window[:input_at])
+        if input_at == -1:
+            return ""
+        self.action_input_seen = True
+        if not self.sql_tool_seen:
+            return ""
+        self.draft_tokens = [window[input_at + len(ACTION_INPUT_MARKER):]]
+        return "draft"
+
+    @property
+    def text(self) -> str:
+        return "".join(self.tokens)
+
+    @property
+    def sql_draft(self) -> str:
+        return "".join(self.draft_tokens).strip() if self.draft_tokens is not None else ""
+
+    @property
+    def final_answer(self) -> str:
+        return "".join(self.answer_tokens).lstrip() if self.answer_tokens is not None else ""
+
+
+class StreamingTokenUsageCallbackHandler(TokenUsageCallbackHandler):
+    """
+    TokenUsageCallbackHandler som i tillegg bygger en live tidslinje over agentens
+    steg og strømmer det endelige svaret token for token fra `on_llm_new_token`.
+
+    Tokentellingen skjer fortsatt i `on_llm_end`, som med stream_usage=True får
+    samlet usage_metadata fra siste chunk. Metodene kalles fra arbeidertråden,
+    mens UI-tråden leser med `snapshot()`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._stream_lock = Lock()
+        self.timeline: List[Dict[str, Any]] = []
+        self._timeline_index: Dict[UUID, int] = {}
+        self._llm_streams: Dict[UUID, LlmTextStream] = {}
+        self._current_stream: Optional[LlmTextStream] = None
+        self._draft_stream: Optional[LlmTextStream] = None
+        self._answer_stream: Optional[LlmTextStream] = None
+
+    @property
+    def current_llm_text(self) -> str:
+        return self._current_stream.text if self._current_stream is not None else ""
+
+    @property
+    def sql_draft(self) -> str:
+        return self._draft_stream.sql_draft if self._draft_stream is not None else ""
+
+    @property
+    def final_answer(self) -> str:
+        return self._answer_stream.final_answer if self._answer_stream is not None else ""
+
+    def _start_timeline_step(self, run_id: UUID, kind: str, name: str, label: str, detail: str = "") -> None:
+        with self._stream_lock:
+            self._timeline_index[run_id] = len(self.timeline)
+            self.timeline.append({
+                "kind": kind,
+                "name": name,
+                "label": label,
+                "detail": detail,
+                "started_at": time.monotonic(),
+                "ended_at": None,
+                "error": None,
+            })
+
+    def _end_timeline_step(self, run_id: UUID, error: Optional[str] = None) -> None:
+        with self._stream_lock:
+            index = self._timeline_index.pop(run_id, None)
+            if index is not None:
+                self.timeline[index]["ended_at"] = time.monotonic()
+                self.timeline[index]["error"] = error
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        super().on_llm_start(serialized, prompts, run_id=run_id, **kwargs)
+        self._start_timeline_step(run_id, "llm", "llm", "Tenker")
+        with self._stream_lock:
+            self._current_stream = self._llm_streams[run_id] = LlmTextStream()
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._stream_lock:
+            stream = self._llm_streams.get(run_id)
+            if stream is None:
+                stream = self._llm_streams[run_id] = LlmTextStream()
+            self._current_stream = stream
+            changed = stream.add(token)
+            if changed == "answer":
+                self._answer_stream = stream
+            elif changed == "draft":
+                self._draft_stream = stream
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        super().on_llm_end(response, run_id=run_id, **kwargs)
+        self._end_timeline_step(run_id)
+        with self._stream_lock:
+            self._llm_streams.pop(run_id, None)
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], *, run_id: UUID, **kwargs: Any) -> None:
+        super().on_llm_error(error, run_id=run_id, **kwargs)
+        self._end_timeline_step(run_id, error=str(error))
+        with self._stream_lock:
+            self._llm_streams.pop(run_id, None)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        super().on_tool_start(serialized, input_str, run_id=run_id, **kwargs)
+        tool_name = serialized.get("name", "") if serialized else ""
+        self._start_timeline_step(
+            run_id, "tool", tool_name, TOOL_STEP_LABELS.get(tool_name, f"Kjører {tool_name}"), input_str
+        )
+        if tool_name == SQL_QUERY_TOOL:
+            with self._stream_lock:
+                self._draft_stream = None
+
+    def on_tool_end(self, output: str, *, run_id: UUID, **kwargs: Any) -> None:
+        super().on_tool_end(output, run_id=run_id, **kwargs)
+        self._end_timeline_step(run_id)
+
+    def on_tool_error(self, error: Union[Exception, KeyboardInterrupt], *, run_id: UUID, **kwargs: Any) -> None:
+        super().on_tool_error(error, run_id=run_id, **kwargs)
+        self._end_timeline_step(run_id, error=str(error))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._stream_lock:
+            return {
+                "timeline": [dict(step) for step in self.timeline],
+                "current_llm_text": self.current_llm_text,
+                "sql_draft": self.sql_draft,
+                "final_answer": self.final_answer,
+            }
@@ -0,0 +1,213 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Any
+
+from backend.config import (
+    USAGE_LEDGER_ENABLED,
+    USAGE_LEDGER_PATH,
+)
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    message_id TEXT,
+    engine TEXT,
+    cache_outcome TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    gco2e REAL NOT NULL DEFAULT 0,
+    llm_calls INTEGER NOT NULL DEFAULT 0,
+    llm_errors INTEGER NOT NULL DEFAULT 0,
+    latency_ms REAL NOT NULL DEFAULT 0,
+    sql_query TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_usage_events_ts ON usage_events(ts);
+CREATE INDEX IF NOT EXISTS idx_usage_events_day_latency ON usage_events(day, latency_ms);
+CREATE INDEX IF NOT EXISTS idx_usage_events_user_day ON usage_events(user, day);
+"""
+# Versjon 1: `day` er UTC-dato (som i feedback_store), ikke servertid.
+_SCHEMA_VERSION = 1
+
+
+def _utc_day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+class UsageLedger:
+    """
+    Varig logg over ressursbruk per forespørsel (spørsmål og visualiseringsforslag), lagret i SQLite.
+
+    Hver rad er én forespørsel med bruker, tidspunkt, tokens, gCO₂e, LLM-kall, svartid,
+    SQL og om svaret kom fra cache. Aggregatene til admin-siden regnes ut i SQL
+    ved hjelp av indeksene på tidspunkt, (dag, svartid) og (bruker, dag). Dagene er
+    UTC-datoer, som i feedback_store og timeoversikten.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+                # Rader fra før versjon 1 har dag i servertid; regnes om fra tidspunktet.
+                conn.execute("UPDATE usage_events SET day = strftime('%Y-%m-%d', ts, 'unixepoch')")
+                conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        logger.info(f"Usage ledger opened at {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(
+        self,
+        user: str,
+        kind: str,
+        usage_report: dict[str, Any],
+        gco2e: float,
+        latency_ms: float,
+        message_id: str | None = None,
+        engine: str | None = None,
+        cache_outcome: str | None = None,
+        sql_query: str | None = None,
+    ) -> None:
+        """
+        Legger til én forespørsel i loggen.
+
+        Args:
+            user (str): Brukeren som stilte spørsmålet.
+            kind (str): "question" eller "visualization".
+            usage_report (dict): Sammendraget fra TokenUsageCallbackHandler.get_summary().
+            gco2e (float): Estimert utslipp for forespørselen.
+            latency_ms (float): Svartid i millisekunder.
+            message_id (str | None): Meldingen forespørselen hører til.
+            engine (str | None): Motoren som svarte (cache, fast_path, agent).
+            cache_outcome (str | None): "hit" eller "miss" for spørsmålscachen.
+            sql_query (str | None): SQL-en som ble kjørt.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO usage_events (ts, day, user, kind, message_id, engine, cache_outcome, "
+                "prompt_tokens, completion_tokens, total_tokens, gco2e, llm_calls, llm_errors, latency_ms, sql_query) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    now, _utc_day(now), user, kind, message_id, engine,
+                    cache_outcome,
+                    usage_report.get("prompt_tokens_used", 0),
+                    usage_report.get("completion_tokens_used", 0),
+                    usage_report.get("total_tokens_used", 0),
+                    gco2e,
+                    usage_report.get("successful_llm_requests", 0),
+                    usage_report.get("llm_errors", 0),
+                    latency_ms,
+                    sql_query,
+                ),
+            )
+
+    @staticmethod
+    def _since_day(days: int) -> str:
+        return _utc_day(time.time() - (days - 1) * 86400)
+
+    def _percentile(self, conn: sqlite3.Connection, day: str, count: int, fraction: float) -> float | None:
+        # Går rett til raden i indeksen (day, latency_ms) i stedet for å sortere dagens rader.
+        if count == 0:
+            return None
+        row = conn.execute(
+            "SELECT latency_ms FROM usage_events WHERE day = ? ORDER BY latency_ms LIMIT 1 OFFSET ?",
+            (day, min(int(count * fraction), count - 1)),
+        ).fetchone()
+        return row[0] if row else None
+
+    def daily_summary(self, days: int = 14) -> list[dict[str, Any]]:
+        """
+        Antall forespørsler, tokens, gCO₂e og svartid (p50/p95) per dag.
+
+        Args:
+            days (int): Antall dager bakover, inkludert i dag (UTC).
+
+        Returns:
+            list[dict]: Én rad per UTC-dag med aktivitet, eldste først.
+        """
+        with closing(self._connect()) as conn:
+            rows = [dict(r) for r in conn.execute(
+                "SELECT day, COUNT(*) AS requests, SUM(kind = 'question') AS questions, "
+                "COUNT(DISTINCT user) AS users, SUM(total_tokens) AS total_tokens, "
+                "SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens, "
+                "SUM(gco2e) AS gco2e, SUM(llm_calls) AS llm_calls, SUM(llm_errors) AS llm_errors, "
+                "SUM(cache_outcome = 'hit') AS cache_hits "
+                "FROM usage_events WHERE day >= ? GROUP BY day ORDER BY day",
+                (self._since_day(days),),
+            )]
+            for row in rows:
+                row["p50_latency_ms"] = self._percentile(conn, row["day"], row["requests"], 0.50)
+                row["p95_latency_ms"] = self._percentile(conn, row["day"], row["requests"], 0.95)
+        return rows
+
+    def per_user_summary(self, days: int = 14, limit: int = 50) -> list[dict[str, Any]]:
+        """Forespørsler, tokens og gCO₂e per bruker de siste `days` dagene, mest brukte først."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT user, COUNT(*) AS requests, SUM(total_tokens) AS total_tokens, SUM(gco2e) AS gco2e, "
+                "AVG(latency_ms) AS avg_latency_ms, MAX(ts) AS last_seen "
+                "FROM usage_events WHERE day >= ? GROUP BY user ORDER BY total_tokens DESC LIMIT ?",
+                (self._since_day(days), limit),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def user_day_tokens(self, days: int = 14) -> list[dict[str, Any]]:
+        """Tokens per bruker og dag, til stablet diagram."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT day, user, SUM(total_tokens) AS total_tokens "
+                "FROM usage_events WHERE day >= ? GROUP BY day, user ORDER BY day",
+                (self._since_day(days),),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def hourly_throughput(self, hours: int = 24) -> list[dict[str, Any]]:
+        """Antall forespørsler per time de siste `hours` timene."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT CAST(ts / 3600 AS INTEGER) * 3600 AS hour, COUNT(*) AS requests "
+                "FROM usage_events WHERE ts >= ? GROUP BY hour ORDER BY hour",
+                (time.time() - hours * 3600,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def recent(self, limit: int = 100) -> list[dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT ts, user, kind, engine, cache_outcome, total_tokens, llm_calls, latency_ms, sql_query "
+                "FROM usage_events ORDER BY ts DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+
+usage_ledger = UsageLedger(USAGE_LEDGER_PATH) if USAGE_LEDGER_ENABLED else None
+
+
+def record_usage(**kwargs: Any) -> None:
+    """Som UsageLedger.record, men gjør ingenting hvis loggen er slått av og logger feil i stedet for å kaste."""
+    if usage_ledger is None:
+        return
+    try:
+        usage_ledger.record(**kwargs)
+    except Exception as e:
+        logger.error(f"Kunne ikke skrive til bruksloggen: {e}", exc_info=True)
@@ -0,0 +1,103 @@
+"""
+Mikrobenchmark for TokenUsageCallbackHandler: kostnad per callback-event og
+minne per lagret event, for ulike lengder på agentkjøringen.
+
+Kjøres fra prosjektroten:
+
+    python -m benchmarks.bench_token_tracer
+    python -m benchmarks.bench_token_tracer --iterations 100 1000 10000 --max-steps 2000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from uuid import uuid4
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from backend.token_tracer import TokenUsageCallbackHandler
+
+EVENTS_PER_ITERATION = 7
+
+LLM_SERIALIZED = {"id": ["langchain", "chat_models", "azure_openai", "AzureChatOpenAI"]}
+CHAIN_SERIALIZED = {"id": ["langchain", "chains", "llm", "LLMChain"]}
+TOOL_SERIALIZED = {"name": "sql_db_query"}
+SQL = "SELECT tilbyder, COUNT(*) AS n FROM ekom GROUP BY tilbyder ORDER BY n DESC LIMIT 10"
+LLM_RESPONSE = LLMResult(generations=[[ChatGeneration(message=AIMessage(
+    content=f"Thought: I should query.\nAction: sql_db_query\nAction Input: {SQL}",
+    usage_metadata={"input_tokens": 1200, "output_tokens": 80, "total_tokens": 1280},
+))]])
+ACTION = SimpleNamespace(tool="sql_db_query", tool_input=SQL, log="Thought: I should query.\nAction: sql_db_query")
+
+
+def run_agent_iterations(handler: TokenUsageCallbackHandler, iterations: int) -> None:
+    """Spiller av eventene én ReAct-runde gir (kjede, LLM-kall, agenthandling, verktøy), `iterations` ganger."""
+    root_id = uuid4()
+    for _ in range(iterations):
+        chain_id, llm_id, tool_id = uuid4(), uuid4(), uuid4()
+        handler.on_chain_start(CHAIN_SERIALIZED, {}, run_id=chain_id, parent_run_id=root_id)
+        handler.on_llm_start(LLM_SERIALIZED, ["prompt"], run_id=llm_id, parent_run_id=chain_id)
+        handler.on_llm_end(LLM_RESPONSE, run_id=llm_id, parent_run_id=chain_id)
+        handler.on_chain_end({}, run_id=chain_id, parent_run_id=root_id)
+        handler.on_agent_action(ACTION, run_id=root_id)
+        handler.on_tool_start(TOOL_SERIALIZED, SQL, run_id=tool_id, parent_run_id=root_id)
+        handler.on_tool_end("[('telenor', 100)]", run_id=tool_id, parent_run_id=root_id)
+
+
+def bench(iterations: int, max_steps: int | None, repeat: int) -> dict:
+    best_ns = float("inf")
+    for _ in range(repeat):
+        handler = TokenUsageCallbackHandler(max_steps=max_steps)
+        started = time.perf_counter_ns()
+        run_agent_iterations(handler, iterations)
+        best_ns = min(best_ns, time.perf_counter_ns() - started)
+
+    tracemalloc.start()
+    handler = TokenUsageCallbackHandler(max_steps=max_steps)
+    before, _ = tracemalloc.get_traced_memory()
+    run_agent_iterations(handler, iterations)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter_ns()
+    report = handler.get_report()
+    report_ns = time.perf_counter_ns() - started
+
+    events = iterations * EVENTS_PER_ITERATION
+    return {
+        "events": events,
+        "ns_per_event": best_ns / events,
+        "retained_bytes_per_event": (after - before) / events,
+        "stored_steps": len(report["detailed_steps"]),
+        "report_ms": report_ns / 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mikrobenchmark for TokenUsageCallbackHandler.")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="Antall agentrunder (7 eventer per runde).")
+    parser.add_argument("--max-steps", type=int, default=2000, help="Størrelse på ringbufferen (0 = ubegrenset).")
+    parser.add_argument("--repeat", type=int, default=5, help="Antall gjentakelser; beste tid rapporteres.")
+    args = parser.parse_args()
+
+    logging.getLogger("backend.token_tracer").setLevel(logging.WARNING)
+
+    print(f"{'buffer':>10} {'events':>8} {'ns/event':>10} {'bytes/event':>12} {'lagret':>8} {'get_report':>11}")
+    for max_steps in (0, args.max_steps):
+        for iterations in args.iterations:
+            result = bench(iterations, max_steps or None, args.repeat)
+            print(
+                f"{max_steps or 'ubegr.':>10} {result['events']:>8} {result['ns_per_event']:>10.0f} "
+                f"{result['retained_bytes_per_event']:>12.0f} {result['stored_steps']:>8} {result['report_ms']:>9.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Backend-modulene leser konfigurasjonen ved import; testene skal ikke skrive i
+# prosjektets cache-mappe eller starte bakgrunnsjobber mot den ekte databasen.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="sqlchat_tests_"))
+os.environ.setdefault("ROLLUPS_ENABLED", "false")
+os.environ.setdefault("DATABASE_URI", f"sqlite:///{os.path.join(PROJECT_ROOT, 'data-ekom.db')}")
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
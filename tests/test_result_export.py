@@ -0,0 +1,50 @@
+import csv
+import io
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from backend.db_client import stream_result_chunks
+from backend.result_export import export_result
+
+
+@pytest.fixture()
+def source_engine(tmp_path):
+    path = tmp_path / "source.db"
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute("CREATE TABLE t (id INTEGER, navn TEXT)")
+        conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, f"rad {i}" if i % 7 else None) for i in range(2500)])
+    engine = create_engine(f"sqlite:///{path}")
+    yield engine
+    engine.dispose()
+
+
+def test_stream_result_chunks_yields_bounded_chunks_in_order(source_engine):
+    chunks = list(stream_result_chunks("SELECT id, navn FROM t ORDER BY id", chunk_rows=1000, target_engine=source_engine))
+
+    assert [chunk.row_count for chunk in chunks] == [1000, 1000, 500]
+    assert all(chunk.columns == ["id", "navn"] for chunk in chunks)
+    assert [row[0] for chunk in chunks for row in chunk.iter_rows()] == list(range(2500))
+    assert not any(chunk.truncated for chunk in chunks)
+
+
+def test_stream_result_chunks_gives_columns_for_empty_result(source_engine):
+    chunks = list(stream_result_chunks("SELECT id, navn FROM t WHERE 0", chunk_rows=1000, target_engine=source_engine))
+
+    assert len(chunks) == 1
+    assert chunks[0].columns == ["id", "navn"]
+    assert chunks[0].row_count == 0
+
+
+def test_csv_export_from_dataframe_round_trips():
+    df = pd.DataFrame({"id": range(25), "navn": [f"rad {i}" if i % 3 else None for i in range(25)]})
+
+    output = export_result("csv", dataframe=df, chunk_rows=10)
+
+    rows = list(csv.reader(io.TextIOWrapper(output, encoding="utf-8")))
+    assert rows[0] == ["id", "navn"]
+    assert [r[0] for r in rows[1:]] == [str(i) for i in range(25)]
+    assert rows[1][1] == "" and rows[2][1] == "rad 1"
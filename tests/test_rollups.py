@@ -0,0 +1,112 @@
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from backend.rollups import ROLLUP_COUNT_COLUMN, RollupTable, parse_rollup_query, rewrite_for_rollup
+
+DIMENSIONS = ["tilbyder", "teknologi", "hovedkategori"]
+ROLLUP = RollupTable("rollup_ekom_test", tuple(DIMENSIONS), "v1", 0, 0.0, 0.0)
+
+ROWS = [
+    ("Telenor", "Fiber", "Bredbånd", 10),
+    ("Telenor", "Fiber", "Bredbånd", 20),
+    ("Telenor", "DSL", "Bredbånd", 5),
+    ("Telenor", None, "Mobil", 7),
+    ("Telia", "Fiber", "Bredbånd", 3),
+    ("Telia", "5G", "Mobil", 8),
+    ("Telia", "5G", "Mobil", 9),
+    ("Ice", "5G", "Mobil", 1),
+    ("Ice", None, None, 2),
+    (None, "Fiber", "Bredbånd", 4),
+    ("altibox", "Fiber", "Bredbånd", 6),
+]
+
+
+@pytest.fixture()
+def conn():
+    """Kildetabellen og rollupen over alle dimensjonene, i samme minnedatabase."""
+    with closing(sqlite3.connect(":memory:")) as conn:
+        conn.execute("CREATE TABLE ekom (tilbyder TEXT, teknologi TEXT, hovedkategori TEXT, verdi INTEGER)")
+        conn.executemany("INSERT INTO ekom VALUES (?, ?, ?, ?)", ROWS)
+        columns = ", ".join(DIMENSIONS)
+        conn.execute(
+            f'CREATE TABLE {ROLLUP.table_name} AS '
+            f'SELECT {columns}, COUNT(*) AS "{ROLLUP_COUNT_COLUMN}" FROM ekom GROUP BY {columns}'
+        )
+        yield conn
+
+
+def _run(conn: sqlite3.Connection, sql_query: str) -> tuple[list[str], list[tuple]]:
+    cursor = conn.execute(sql_query)
+    return [d[0] for d in cursor.description], cursor.fetchall()
+
+
+SUPPORTED = [
+    "SELECT tilbyder, COUNT(*) FROM ekom GROUP BY tilbyder",
+    "SELECT tilbyder, COUNT(*) AS n FROM ekom GROUP BY tilbyder ORDER BY n DESC, tilbyder",
+    "SELECT COUNT(*) FROM ekom",
+    "SELECT COUNT(*) FROM ekom WHERE tilbyder LIKE 'tel%'",
+    "SELECT teknologi, COUNT(tilbyder) FROM ekom GROUP BY teknologi",
+    "SELECT tilbyder, COUNT(teknologi) AS med_teknologi FROM ekom GROUP BY tilbyder",
+    "SELECT COUNT(DISTINCT tilbyder) FROM ekom",
+    "SELECT hovedkategori, COUNT(DISTINCT teknologi) AS n FROM ekom GROUP BY hovedkategori",
+    "SELECT tilbyder FROM ekom GROUP BY tilbyder HAVING COUNT(*) > 2",
+    "SELECT tilbyder, COUNT(*) FROM ekom GROUP BY tilbyder HAVING COUNT(*) >= 2 ORDER BY COUNT(*) DESC, tilbyder",
+    "SELECT tilbyder, COUNT(*)*1.0/10 FROM ekom GROUP BY tilbyder",
+    "SELECT tilbyder, COUNT(teknologi) + COUNT(*) FROM ekom GROUP BY tilbyder",
+    "SELECT e.tilbyder, COUNT(*) AS n FROM ekom AS e WHERE e.teknologi = 'Fiber' GROUP BY e.tilbyder",
+    "SELECT e.tilbyder, COUNT(e.teknologi) FROM ekom e GROUP BY e.tilbyder",
+    'SELECT "tilbyder", count(*) FROM "ekom" GROUP BY 1;',
+    "SELECT lower(tilbyder) AS t, MIN(teknologi), MAX(teknologi) FROM ekom GROUP BY t",
+    "SELECT DISTINCT hovedkategori FROM ekom",
+    "SELECT tilbyder, teknologi, COUNT(*) AS n FROM ekom WHERE hovedkategori IS NOT NULL "
+    "GROUP BY tilbyder, teknologi ORDER BY n DESC, tilbyder, teknologi LIMIT 3",
+]
+
+REJECTED = [
+    "SELECT e.tilbyder, COUNT(*) FROM ekom e JOIN ekom f ON e.tilbyder = f.tilbyder GROUP BY e.tilbyder",
+    "SELECT tilbyder, SUM(verdi) FROM ekom GROUP BY tilbyder",
+    "SELECT tilbyder, AVG(verdi) FROM ekom GROUP BY tilbyder",
+    "SELECT COUNT(*) FROM (SELECT tilbyder FROM ekom)",
+    "SELECT tilbyder, COUNT(*) FROM ekom WHERE tilbyder IN (SELECT tilbyder FROM ekom) GROUP BY tilbyder",
+    "SELECT verdi, COUNT(*) FROM ekom GROUP BY verdi",
+    "SELECT tilbyder, COUNT(verdi) FROM ekom GROUP BY tilbyder",
+    "SELECT tilbyder, COUNT(*) FROM ekom WHERE verdi > 5 GROUP BY tilbyder",
+    "SELECT tilbyder FROM ekom",
+    "SELECT COUNT(*) FROM annen_tabell",
+    "SELECT tilbyder, COUNT(*) OVER () FROM ekom",
+    "SELECT tilbyder, COUNT(*) FROM ekom GROUP BY tilbyder UNION SELECT teknologi, COUNT(*) FROM ekom GROUP BY teknologi",
+    "WITH t AS (SELECT tilbyder FROM ekom) SELECT COUNT(*) FROM t",
+]
+
+
+@pytest.mark.parametrize("sql_query", SUPPORTED)
+@pytest.mark.parametrize("with_column_names", [True, False], ids=["column_names", "item_text"])
+def test_rollup_gives_same_result_as_base_table(conn, sql_query, with_column_names):
+    parsed = parse_rollup_query(sql_query, "ekom", DIMENSIONS)
+    assert parsed is not None
+
+    base_columns, base_rows = _run(conn, sql_query.rstrip(";"))
+    rewritten = rewrite_for_rollup(parsed, ROLLUP, base_columns if with_column_names else None)
+    assert ROLLUP.table_name in rewritten
+    rollup_columns, rollup_rows = _run(conn, rewritten)
+
+    assert rollup_columns == base_columns
+    if "ORDER BY" in sql_query:
+        assert rollup_rows == base_rows
+    else:
+        assert sorted(rollup_rows, key=repr) == sorted(base_rows, key=repr)
+
+
+@pytest.mark.parametrize("sql_query", REJECTED)
+def test_unsupported_queries_are_not_rewritten(sql_query):
+    assert parse_rollup_query(sql_query, "ekom", DIMENSIONS) is None
+
+
+def test_needed_dimensions_are_collected():
+    parsed = parse_rollup_query(
+        "SELECT e.tilbyder, COUNT(teknologi) FROM ekom e WHERE e.hovedkategori = 'Mobil' GROUP BY e.tilbyder",
+        "ekom", DIMENSIONS,
+    )
+    assert parsed.dimensions == {"tilbyder", "teknologi", "hovedkategori"}
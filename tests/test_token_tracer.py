@@ -0,0 +1,71 @@
+import random
+from uuid import uuid4
+
+import pytest
+
+from backend.token_tracer import (
+    ACTION_INPUT_MARKER,
+    FINAL_ANSWER_MARKER,
+    StreamingTokenUsageCallbackHandler,
+)
+
+SQL = "SELECT tilbyder, COUNT(*) AS n\nFROM ekom GROUP BY tilbyder"
+TEXTS = [
+    f"Thought: I should query.\nAction: sql_db_query\nAction Input: {SQL}\n",
+    f"Thought: check schema\nAction: sql_db_schema\nAction Input: ekom\n",
+    f"Thought: I know the answer.\n{FINAL_ANSWER_MARKER}  Telenor har flest abonnenter.",
+    f"Action: sql_db_query\nAction Input: {SQL}\nObservation: ...\n{FINAL_ANSWER_MARKER} 42 rader",
+    f"Action: sql_db_query_checker\nAction Input: {SQL}",
+    "Bare tekst uten markører, æøå og emoji 📊",
+]
+
+
+def _rescan_every_token(tokens: list[str]) -> tuple[str, str]:
+    """Referansen: søker gjennom hele den samlede teksten for hvert token."""
+    text = sql_draft = final_answer = ""
+    for token in tokens:
+        text += token
+        answer_at = text.find(FINAL_ANSWER_MARKER)
+        if answer_at != -1:
+            final_answer = text[answer_at + len(FINAL_ANSWER_MARKER):].lstrip()
+            continue
+        input_at = text.find(ACTION_INPUT_MARKER)
+        if input_at != -1 and "sql_db_query" in text[:input_at]:
+            sql_draft = text[input_at + len(ACTION_INPUT_MARKER):].strip()
+    return sql_draft, final_answer
+
+
+def _split(text: str, rng: random.Random) -> list[str]:
+    tokens, position = [], 0
+    while position < len(text):
+        size = rng.randint(1, 6)
+        tokens.append(text[position:position + size])
+        position += size
+    return tokens
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("seed", range(20))
+def test_markers_are_found_across_token_boundaries(text, seed):
+    handler = StreamingTokenUsageCallbackHandler()
+    run_id = uuid4()
+    handler.on_llm_start({"id": ["AzureChatOpenAI"]}, ["prompt"], run_id=run_id)
+    tokens = _split(text, random.Random(seed))
+    for token in tokens:
+        handler.on_llm_new_token(token, run_id=run_id)
+
+    snapshot = handler.snapshot()
+    assert snapshot["current_llm_text"] == text
+    assert (snapshot["sql_draft"], snapshot["final_answer"]) == _rescan_every_token(tokens)
+
+
+def test_sql_draft_is_cleared_when_the_query_tool_starts():
+    handler = StreamingTokenUsageCallbackHandler()
+    run_id = uuid4()
+    handler.on_llm_start({"id": ["AzureChatOpenAI"]}, ["prompt"], run_id=run_id)
+    handler.on_llm_new_token(TEXTS[0], run_id=run_id)
+    assert handler.snapshot()["sql_draft"] == SQL
+
+    handler.on_tool_start({"name": "sql_db_query"}, SQL, run_id=uuid4())
+
+    assert handler.snapshot()["sql_draft"] == ""
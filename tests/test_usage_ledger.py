@@ -0,0 +1,47 @@
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.usage_ledger import UsageLedger
+
+REPORT = {"prompt_tokens_used": 10, "completion_tokens_used": 5, "total_tokens_used": 15, "successful_llm_requests": 1}
+
+
+@pytest.fixture()
+def far_east_timezone(monkeypatch):
+    """Servertid langt fra UTC (UTC+14), så lokal dato og UTC-dato ofte er forskjellige."""
+    monkeypatch.setenv("TZ", "Pacific/Kiritimati")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_days_are_utc_dates(tmp_path, far_east_timezone):
+    ledger = UsageLedger(str(tmp_path / "usage.db"))
+    ledger.record(user="a", kind="question", usage_report=REPORT, gco2e=0.1, latency_ms=1200)
+
+    rows = ledger.daily_summary(days=1)
+
+    assert [row["day"] for row in rows] == [datetime.now(timezone.utc).strftime("%Y-%m-%d")]
+    assert rows[0]["p50_latency_ms"] == rows[0]["p95_latency_ms"] == 1200
+
+
+def test_rows_with_server_local_days_are_migrated(tmp_path, far_east_timezone):
+    path = str(tmp_path / "usage.db")
+    UsageLedger(path)
+    ts = datetime(2026, 3, 1, 23, 30, tzinfo=timezone.utc).timestamp()
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute(
+            "INSERT INTO usage_events (ts, day, user, kind) VALUES (?, ?, 'a', 'question')",
+            (ts, datetime.fromtimestamp(ts).strftime("%Y-%m-%d")),
+        )
+        conn.execute("PRAGMA user_version = 0")
+
+    UsageLedger(path)
+
+    with closing(sqlite3.connect(path)) as conn:
+        assert conn.execute("SELECT day FROM usage_events").fetchone()[0] == "2026-03-01"